@@ -0,0 +1,119 @@
+"""
+Agent Warm Start Benchmark
+Compares lambda_handler latency on a cold container, on a warm container
+for a new session, and on a warm container for a pooled session
+
+The model and memory clients are stubs with fixed latencies, so the numbers
+show the construction work each path does rather than Bedrock response times.
+
+Usage:
+    python -m benchmarks.bench_agent_warm [--requests 20] [--model-init-ms 80] [--memory-ms 150]
+"""
+
+import argparse
+import json
+import statistics
+import time
+from unittest.mock import patch
+
+from strands.models.model import Model
+
+from src.rag import budget_agent, memory
+from src.runtime import handler
+
+
+class StubModel(Model):
+    """Model client that answers every prompt with a fixed text"""
+
+    init_seconds = 0.0
+
+    def __init__(self, **config):
+        time.sleep(self.init_seconds)
+        self.config = config
+
+    def update_config(self, **model_config):
+        self.config.update(model_config)
+
+    def get_config(self):
+        return self.config
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        yield {"messageStart": {"role": "assistant"}}
+        yield {"contentBlockDelta": {"delta": {"text": "The budget allocates $1.2 billion."}}}
+        yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+
+
+class StubMemoryClient:
+    """Memory client whose control plane calls take a fixed time"""
+
+    latency = 0.0
+
+    def __init__(self, region_name=None):
+        time.sleep(self.latency)
+        self.gmcp_client = self
+
+    def list_memories(self):
+        time.sleep(self.latency)
+        return {"memories": [{"id": "BudgetAgentMemory_bench", "createdAt": "2026-01-01T00:00:00Z"}]}
+
+
+def stub_session_manager(**kwargs):
+    # Stands in for the session manager loading the session; the agent runs without memory
+    time.sleep(StubMemoryClient.latency)
+    return None
+
+
+def cold_start():
+    """Forget everything a warm container keeps"""
+    handler.agent_pool = None
+    budget_agent.shared_model = None
+    memory.memory_client = None
+
+
+def timed_request(session_id: str) -> float:
+    event = {"body": json.dumps({"query": "What is the carbon tax?", "actor_id": "bench", "session_id": session_id})}
+    start = time.perf_counter()
+    response = handler.lambda_handler(event, None)
+    elapsed = time.perf_counter() - start
+    assert response["statusCode"] == 200, response["body"]
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--model-init-ms", type=float, default=80)
+    parser.add_argument("--memory-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    StubModel.init_seconds = args.model_init_ms / 1000
+    StubMemoryClient.latency = args.memory_ms / 1000
+
+    with patch.object(budget_agent, "BedrockModel", StubModel), \
+         patch.object(memory, "MemoryClient", StubMemoryClient), \
+         patch.object(memory, "AgentCoreMemorySessionManager", stub_session_manager):
+        cold, new_session, warm = [], [], []
+        for i in range(args.requests):
+            cold_start()
+            cold.append(timed_request(f"cold-{i}"))
+            new_session.append(timed_request(f"new-{i}"))
+            warm.append(timed_request(f"new-{i}"))
+        cold_start()
+
+    def ms(samples):
+        return statistics.median(samples) * 1000
+
+    print(f"{args.requests} requests per path, model init {args.model_init_ms:.0f} ms, "
+          f"memory calls {args.memory_ms:.0f} ms")
+    print(f"  cold container:          {ms(cold):8.2f} ms")
+    print(f"  warm, new session:       {ms(new_session):8.2f} ms")
+    print(f"  warm, pooled session:    {ms(warm):8.2f} ms")
+    print(f"  speedup: {ms(cold) / ms(warm):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
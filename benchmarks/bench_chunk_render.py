@@ -0,0 +1,126 @@
+"""
+Chunk Render Benchmark
+Compares full-page render-then-crop against clip-region rasterization,
+and both against the default path with the document and page raster caches
+
+Usage:
+    python -m benchmarks.bench_chunk_render [--pages 20] [--crops 200] [--dpi 150]
+"""
+
+import argparse
+import io
+import random
+import time
+import tracemalloc
+
+import fitz
+from PIL import Image
+
+from src.rag.render_cache import document_cache, page_raster_cache
+from src.rag.visual_grounding_helper import (
+    RENDER_MODE_CLIP,
+    RENDER_MODE_FULL,
+    render_chunk_region
+)
+
+
+def build_synthetic_pdf(pages: int = 20, seed: int = 0) -> bytes:
+    """
+    Build a budget-like PDF with running text, ruled tables, vector shapes and a raster figure.
+    
+    Args:
+        pages: Number of pages
+        seed: Random seed for text and layout jitter
+    
+    Returns:
+        PDF file content as bytes
+    """
+    rnd = random.Random(seed)
+    figure = Image.new("RGB", (64, 48))
+    for x in range(64):
+        for y in range(48):
+            figure.putpixel((x, y), (x * 4, y * 5, (x * y) % 255))
+    figure_bytes = io.BytesIO()
+    figure.save(figure_bytes, format="PNG")
+    
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page(width=595.3, height=841.9)
+        for line in range(18):
+            page.insert_text(
+                (40 + rnd.random() * 10, 40 + line * 19.3),
+                f"Page {page_num}, line {line}: program spending of ${rnd.randint(1, 999)} million",
+                fontsize=9.7
+            )
+        for row in range(12):
+            for col in range(5):
+                cell = fitz.Rect(300 + col * 50.3, 400 + row * 17.7, 350.3 + col * 50.3, 417.7 + row * 17.7)
+                page.draw_rect(cell, color=(0, 0, 0), width=0.6)
+                page.insert_text((cell.x0 + 3, cell.y1 - 5), f"{rnd.randint(0, 9999)}", fontsize=7)
+        page.draw_circle((150.5, 600.2), 40.3, color=(1, 0, 0), fill=(0, 0.5, 1))
+        page.insert_image(fitz.Rect(100.2, 700.1, 260.7, 800.3), stream=figure_bytes.getvalue())
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+
+def random_bboxes(pages: int, crops: int, seed: int = 1):
+    """Yield (page_num, normalized bbox) pairs shaped like small text and table chunks"""
+    rnd = random.Random(seed)
+    for _ in range(crops):
+        x0, y0 = rnd.random() * 0.8, rnd.random() * 0.9
+        width, height = 0.05 + rnd.random() * 0.3, 0.01 + rnd.random() * 0.08
+        yield rnd.randrange(pages), [x0, y0, min(1.0, x0 + width), min(1.0, y0 + height)]
+
+
+def run_mode(pdf_path: str, jobs, mode: str, dpi: int, page_cache: bool = False):
+    """
+    Render every job in one mode and return (images, seconds, peak traced bytes).
+    Without page_cache the page raster cache is emptied before each crop,
+    so every crop takes the uncached path of its mode.
+    """
+    document_cache.clear()
+    page_raster_cache.clear()
+    tracemalloc.start()
+    start = time.perf_counter()
+    images = []
+    for page_num, bbox in jobs:
+        if not page_cache:
+            page_raster_cache.clear()
+        images.append(render_chunk_region(pdf_path, page_num, bbox, padding=10, dpi=dpi, mode=mode))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return images, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--crops", type=int, default=200)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--pdf", default="/tmp/bench_chunk_render.pdf")
+    args = parser.parse_args()
+    
+    with open(args.pdf, "wb") as f:
+        f.write(build_synthetic_pdf(args.pages))
+    jobs = list(random_bboxes(args.pages, args.crops))
+    
+    full_images, full_seconds, full_peak = run_mode(args.pdf, jobs, RENDER_MODE_FULL, args.dpi)
+    clip_images, clip_seconds, clip_peak = run_mode(args.pdf, jobs, RENDER_MODE_CLIP, args.dpi)
+    cached_images, cached_seconds, cached_peak = run_mode(args.pdf, jobs, RENDER_MODE_CLIP, args.dpi, page_cache=True)
+    
+    mismatches = sum(
+        1 for a, b, c in zip(full_images, clip_images, cached_images)
+        if not a.tobytes() == b.tobytes() == c.tobytes()
+    )
+    
+    print(f"{args.crops} crops over {args.pages} pages at {args.dpi} DPI")
+    print(f"  full page + crop: {full_seconds * 1000 / args.crops:7.2f} ms/crop, peak {full_peak / 1e6:6.1f} MB")
+    print(f"  clip region:      {clip_seconds * 1000 / args.crops:7.2f} ms/crop, peak {clip_peak / 1e6:6.1f} MB")
+    print(f"  clip + page cache:{cached_seconds * 1000 / args.crops:7.2f} ms/crop, peak {cached_peak / 1e6:6.1f} MB")
+    print(f"  speedup: {full_seconds / clip_seconds:.1f}x, pixel mismatches: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
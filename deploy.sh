@@ -1,4 +1,5 @@
 set -e
+set -o pipefail
 set -a
 source .env
 set +a
@@ -19,6 +20,22 @@ echo "Region: $AWS_REGION"
 echo "ECR Repo: $ECR_REPO_NAME"
 echo "======================================"
 
+# Step 0: Provision agent memory
+# Creating the memory resource takes minutes, so it happens here and never in a request
+echo ""
+echo "Step 0: Provisioning agent memory..."
+if [ -z "$BUDGET_MEMORY_ID" ]; then
+    MEMORY_ID_FILE=$(mktemp)
+    python -m src.rag.memory --output "$MEMORY_ID_FILE"
+    BUDGET_MEMORY_ID=$(cat "$MEMORY_ID_FILE")
+    rm -f "$MEMORY_ID_FILE"
+fi
+if ! [[ "$BUDGET_MEMORY_ID" =~ ^BudgetAgentMemory[A-Za-z0-9_-]+$ ]]; then
+    echo "❌ Not a memory ID: '$BUDGET_MEMORY_ID'"
+    exit 1
+fi
+echo "Memory: $BUDGET_MEMORY_ID"
+
 # Step 1: Build Docker image
 echo ""
 echo "Step 1: Building Docker image..."
@@ -65,7 +82,7 @@ if aws lambda get-function --function-name $LAMBDA_FUNCTION_NAME --region $AWS_R
         --function-name $LAMBDA_FUNCTION_NAME \
         --timeout 300 \
         --memory-size 1024 \
-        --environment Variables="{BEDROCK_KB_ID=$BEDROCK_KB_ID,BEDROCK_MODEL_ID=$BEDROCK_MODEL_ID,S3_BUCKET=$S3_BUCKET,DATA_SOURCE_ID=$DATA_SOURCE_ID,VISION_AGENT_API_KEY=$VISION_AGENT_API_KEY}" \
+        --environment Variables="{BEDROCK_KB_ID=$BEDROCK_KB_ID,BEDROCK_MODEL_ID=$BEDROCK_MODEL_ID,S3_BUCKET=$S3_BUCKET,DATA_SOURCE_ID=$DATA_SOURCE_ID,VISION_AGENT_API_KEY=$VISION_AGENT_API_KEY,BUDGET_MEMORY_ID=$BUDGET_MEMORY_ID}" \
         --region $AWS_REGION
 else
     echo "Creating new Lambda function..."
@@ -112,7 +129,7 @@ else
         --role $ROLE_ARN \
         --timeout 300 \
         --memory-size 1024 \
-        --environment Variables="{BEDROCK_KB_ID=$BEDROCK_KB_ID,BEDROCK_MODEL_ID=$BEDROCK_MODEL_ID,S3_BUCKET=$S3_BUCKET,DATA_SOURCE_ID=$DATA_SOURCE_ID,VISION_AGENT_API_KEY=$VISION_AGENT_API_KEY}" \
+        --environment Variables="{BEDROCK_KB_ID=$BEDROCK_KB_ID,BEDROCK_MODEL_ID=$BEDROCK_MODEL_ID,S3_BUCKET=$S3_BUCKET,DATA_SOURCE_ID=$DATA_SOURCE_ID,VISION_AGENT_API_KEY=$VISION_AGENT_API_KEY,BUDGET_MEMORY_ID=$BUDGET_MEMORY_ID}" \
         --region $AWS_REGION
 fi
 
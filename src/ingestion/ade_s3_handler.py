@@ -1,19 +1,97 @@
 import os
 import json
+import hashlib
 import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import unquote_plus
 from landingai_ade import LandingAIADE
 
-s3 = boto3.client("s3")
+try:
+    from bulk_s3_writer import BULK_WRITE_WORKERS, BulkS3Writer
+    from chunk_prerender import PRERENDER_CHUNK_IMAGES, prerender_chunk_images, prerender_incomplete
+    from chunk_index import write_chunk_index
+    from chunk_shards import CHUNK_LAYOUT_BOTH, CHUNK_LAYOUT_PER_CHUNK, CHUNK_LAYOUT_SHARDS, write_chunk_shards
+    from rate_limiter import ade_limiter
+    from native_text import NATIVE_TEXT_FAST_PATH, parse_with_native_text
+    from page_range_parser import PARSE_PAGES_PER_RANGE, count_pages, parse_page_ranges, serialize_parse_response
+    from ingestion_state import (
+        CONTINUATION_KEY, INGESTION_CHECKPOINT_EVERY, STAGE_CHUNKS_WRITTEN, STAGE_OUTPUTS_WRITTEN, STAGE_PARSED,
+        clear_state, load_parsed, load_state, next_continuation, reinvoke, save_parsed, save_state, stage_reached,
+        time_running_low
+    )
+    from ingestion_manifest import apply_chunk_ids, build_manifest, content_hash, delete_keys, diff_chunks, load_manifest, manifest_key
+    from grounding_manifest import grounding_manifest
+    from visual_grounding_helper import chunk_image_key
+except ImportError:
+    from src.ingestion.bulk_s3_writer import BULK_WRITE_WORKERS, BulkS3Writer
+    from src.ingestion.chunk_prerender import PRERENDER_CHUNK_IMAGES, prerender_chunk_images, prerender_incomplete
+    from src.rag.chunk_index import write_chunk_index
+    from src.rag.chunk_shards import CHUNK_LAYOUT_BOTH, CHUNK_LAYOUT_PER_CHUNK, CHUNK_LAYOUT_SHARDS, write_chunk_shards
+    from src.ingestion.rate_limiter import ade_limiter
+    from src.ingestion.native_text import NATIVE_TEXT_FAST_PATH, parse_with_native_text
+    from src.ingestion.page_range_parser import PARSE_PAGES_PER_RANGE, count_pages, parse_page_ranges, serialize_parse_response
+    from src.ingestion.ingestion_state import (
+        CONTINUATION_KEY, INGESTION_CHECKPOINT_EVERY, STAGE_CHUNKS_WRITTEN, STAGE_OUTPUTS_WRITTEN, STAGE_PARSED,
+        clear_state, load_parsed, load_state, next_continuation, reinvoke, save_parsed, save_state, stage_reached,
+        time_running_low
+    )
+    from src.ingestion.ingestion_manifest import apply_chunk_ids, build_manifest, content_hash, delete_keys, diff_chunks, load_manifest, manifest_key
+    from src.rag.grounding_manifest import grounding_manifest
+    from src.rag.visual_grounding_helper import chunk_image_key
+
+# Documents of one event processed at the same time
+INGESTION_RECORD_CONCURRENCY = int(os.environ.get("INGESTION_RECORD_CONCURRENCY", "4"))
+
+# Room for the bulk writer threads of every concurrent record plus the handlers' own requests
+s3 = boto3.client("s3", config=Config(
+    max_pool_connections=BULK_WRITE_WORKERS * INGESTION_RECORD_CONCURRENCY + 4 * INGESTION_RECORD_CONCURRENCY
+))
 
 VISION_AGENT_API_KEY = os.environ.get("VISION_AGENT_API_KEY")
 ADE_MODEL = os.environ.get("ADE_MODEL", "dpt-2-latest")
 INPUT_FOLDER = os.environ.get("INPUT_FOLDER", "input/")
 OUTPUT_FOLDER = os.environ.get("OUTPUT_FOLDER", "output/")
 FORCE_REPROCESS = os.environ.get("FORCE_REPROCESS", "false").lower() == "true"
+# "both" (default) writes the per-chunk files the Knowledge Base data source indexes
+# plus the shards; "shards" alone only once the data source no longer needs chunk files
+CHUNK_LAYOUT = os.environ.get("CHUNK_LAYOUT", CHUNK_LAYOUT_BOTH).lower()
+
+# Created on first parse, so the module imports without an API key
+client = None
+
+
+def get_client():
+    global client
+    if client is None:
+        client = LandingAIADE(apikey=VISION_AGENT_API_KEY)
+    return client
+
+
+def parse_document(document_path: Path) -> dict:
+    """
+    Parse a document with ADE, within the rate and concurrency limits of ade_limiter.
+    
+    With NATIVE_TEXT_FAST_PATH, PDF pages of plain running text are read from
+    the text layer and only complex pages go to ADE. PDFs longer than
+    PARSE_PAGES_PER_RANGE pages are parsed as concurrent page ranges and
+    merged back into one result.
+    
+    Returns:
+        Dict with markdown, chunks, splits and metadata
+    """
+    def parse(path):
+        with ade_limiter:
+            return get_client().parse(document=path, model=ADE_MODEL)
+
+    page_count = count_pages(document_path)
+    if NATIVE_TEXT_FAST_PATH and page_count:
+        return parse_with_native_text(parse, document_path, pages_per_range=PARSE_PAGES_PER_RANGE or page_count)
+    if PARSE_PAGES_PER_RANGE and page_count > PARSE_PAGES_PER_RANGE:
+        return parse_page_ranges(parse, document_path, pages_per_range=PARSE_PAGES_PER_RANGE)
+    return serialize_parse_response(parse(document_path))
 
-client = LandingAIADE(apikey=VISION_AGENT_API_KEY)
 
 def ensure_s3_folders(bucket: str):
     for folder in [INPUT_FOLDER, OUTPUT_FOLDER]:
@@ -23,15 +101,353 @@ def ensure_s3_folders(bucket: str):
         except Exception as e:
             print(f"Could not ensure folder {folder}: {e}")
 
-def ade_handler(event, context):
+def _grounding_paths(output_key: str):
+    """Return (grounding_key, chunks_folder) for a Markdown output key"""
+    # Use path-based approach for consistent folder structure
+    path_parts = Path(output_key).parts
+    
+    if len(path_parts) >= 2:
+        base_folder = str(Path(*path_parts[:2]))  
+        relative_path = Path(*path_parts[2:]) if len(path_parts) > 2 else Path(path_parts[-1])
+        
+        # Create parallel folders with consistent naming
+        grounding_folder = f"{base_folder}_grounding"
+        chunks_folder = f"{base_folder}_chunks/"
+        
+        # Build the grounding key path
+        grounding_filename = str(relative_path).replace('.md', '_grounding.json')
+        grounding_key = str(Path(grounding_folder) / grounding_filename)
+    else:
+        # Fallback for files directly in output/ (shouldn't happen normally)
+        grounding_key = output_key.replace('.md', '_grounding.json')
+        chunks_folder = 'output/chunks/'
+    return grounding_key, chunks_folder
+
+
+def chunk_record(chunk: dict, source_document: str) -> dict:
+    """Build the Knowledge Base chunk JSON record of a serialized ADE chunk"""
+    # Extract bbox from grounding
+    grounding = chunk.get('grounding', {})
+    box = grounding.get('box', {})
+    bbox = [
+        box.get('left', 0),
+        box.get('top', 0),
+        box.get('right', 1),
+        box.get('bottom', 1)
+    ]
+    
+    return {
+        "chunk_id": chunk.get('id', ''),
+        "chunk_type": chunk.get('type', 'text'),
+        "text": chunk.get('markdown', ''),
+        "bbox": bbox,
+        "page": grounding.get('page', 0),
+        "source_document": source_document
+    }
+
+
+def resume_prerender(bucket: str, key: str, output_key: str, filename: str, context) -> dict:
+    """Finish an interrupted chunk image pre-render of an already parsed document"""
+    source_document = Path(filename).stem
+    grounding_key, _ = _grounding_paths(output_key)
+    
+    grounding_obj = s3.get_object(Bucket=bucket, Key=grounding_key)
+    grounding_data = json.loads(grounding_obj["Body"].read().decode("utf-8"))
+    records = [chunk_record(chunk, source_document) for chunk in grounding_data.get('chunks', []) if chunk.get('id')]
+    
+    tmp_path = local_path(key, filename)
+    s3.download_file(bucket, key, str(tmp_path))
+    with BulkS3Writer(s3, bucket, label=f"{source_document} chunk images") as writer:
+        return prerender_chunk_images(s3, bucket, tmp_path, source_document, records, context=context, writer=writer)
+
+
+def skip_document(bucket: str, key: str, output_key: str, filename: str, context, reason: str) -> dict:
+    """Result of a document that needs no parsing, finishing an interrupted pre-render first"""
+    doc_id = os.path.basename(key)
+    if PRERENDER_CHUNK_IMAGES and prerender_incomplete(s3, bucket, Path(filename).stem):
+        print(f"Resuming chunk image pre-render for {doc_id}")
+        return {
+            "source": f"s3://{bucket}/{key}",
+            "output": f"s3://{bucket}/{output_key}",
+            "status": "success",
+            "prerender": resume_prerender(bucket, key, output_key, filename, context)
+        }
+    print(f"Skipping {doc_id} - {reason.replace('_', ' ')} (output exists: {output_key})")
+    return {
+        "source": f"s3://{bucket}/{key}",
+        "output": f"s3://{bucket}/{output_key}",
+        "status": "skipped",
+        "reason": reason
+    }
+
+
+def remove_orphaned_chunks(bucket: str, source_document: str, orphans: dict, chunks_folder: str, had_chunk_files: bool) -> int:
+    """Delete the chunk files and images of chunks that disappeared from a revised document"""
+    if not orphans:
+        return 0
+    image_keys = [chunk_image_key(source_document, chunk_id, chunk_type=chunk_type) for chunk_id, chunk_type in orphans.items()]
+    keys = list(image_keys)
+    if had_chunk_files:
+        keys.extend(f"{chunks_folder}{source_document}_{chunk_id}.json" for chunk_id in orphans)
+    deleted = delete_keys(s3, bucket, keys)
+    grounding_manifest.remove_images(bucket, image_keys)
+    print(f"Removed {len(orphans)} orphaned chunks of {source_document} ({deleted} objects)")
+    return deleted
+
+
+def ingest_document(bucket: str, key: str, output_key: str, tmp_path: Path, document_hash: str,
+                    previous_manifest, state, writer: BulkS3Writer, context) -> dict:
     """
-    AWS Lambda handler for automatically parsing documents uploaded to S3/input/
-    and saving Markdown results to S3/output/ with preserved folder structure.
+    Parse a document and write its outputs in checkpointed stages.
+
+    Stages: parsed (parse result saved), outputs_written (markdown, grounding,
+    shards and chunk index), chunks_written (per-chunk files, checkpointed every
+    INGESTION_CHECKPOINT_EVERY files), then chunk images (pre-render checkpoint).
+    A run resumes after the last completed stage.
+
+    Returns:
+        Result dict; status "in_progress" when the run stopped before the timeout
+    """
+    doc_id = os.path.basename(key)
+    source_document = Path(tmp_path).stem
+    grounding_key, chunks_folder = _grounding_paths(output_key)
+    result = {
+        "source": f"s3://{bucket}/{key}",
+        "output": f"s3://{bucket}/{output_key}",
+        "status": "success"
+    }
+
+    if stage_reached(state, STAGE_PARSED):
+        print(f"Resuming ingestion of {doc_id} after stage '{state['stage']}'")
+        parsed = load_parsed(s3, bucket, source_document)
+        unchanged = set(state["unchanged"])
+    else:
+        print(f"Starting ADE parsing for {doc_id} (model={ADE_MODEL})")
+        parsed = parse_document(tmp_path)
+        print(f"Finished parsing document: {doc_id}")
+        
+        # Keep the ids of chunks whose content did not change since the last ingestion
+        chunk_diff = diff_chunks([
+            chunk_record(chunk, source_document) for chunk in parsed['chunks'] if chunk.get('id', '')
+        ], previous_manifest)
+        parsed = apply_chunk_ids(parsed, chunk_diff.id_map)
+        unchanged = chunk_diff.unchanged
+        if previous_manifest:
+            print(f"{len(chunk_diff.unchanged)} chunks unchanged, {len(chunk_diff.orphans)} removed since last ingestion")
+        
+        previous_layout = (previous_manifest or {}).get("chunk_layout", "")
+        state = {
+            "source_key": key,
+            "content_hash": document_hash,
+            "stage": STAGE_PARSED,
+            "chunks_written": 0,
+            "unchanged": sorted(unchanged),
+            "orphans": chunk_diff.orphans,
+            "had_chunk_files": previous_layout in (CHUNK_LAYOUT_PER_CHUNK, CHUNK_LAYOUT_BOTH),
+            "has_previous": previous_manifest is not None
+        }
+        save_parsed(s3, bucket, source_document, parsed)
+        save_state(s3, bucket, source_document, state)
+    
+    chunk_records = [
+        chunk_record(chunk, source_document)
+        for chunk in parsed['chunks'] if chunk.get('id', '')
+    ]
+
+    def checkpoint(stage: str = None):
+        # Outputs must be durable before the checkpoint claims them
+        summary = writer.flush()
+        if summary["failed"]:
+            raise RuntimeError(f"{summary['failed']} S3 writes failed: {writer.failed_keys[:5]}")
+        if stage:
+            state["stage"] = stage
+        save_state(s3, bucket, source_document, state)
+
+    if not stage_reached(state, STAGE_OUTPUTS_WRITTEN):
+        print(f"Uploading parsed Markdown → s3://{bucket}/{output_key}")
+        writer.put(output_key, parsed['markdown'].encode("utf-8"), "text/markdown")
+        
+        # Save grounding data (visual references) in separate folder
+        grounding_data = {
+            'chunks': parsed['chunks'],
+            'splits': parsed['splits'],
+            'metadata': parsed['metadata']
+        }
+        
+        # Only save if we have actual chunk data
+        if grounding_data['chunks']:
+            print(f"Uploading visual grounding data → s3://{bucket}/{grounding_key}")
+            print(f"Found {len(grounding_data['chunks'])} chunks with grounding info")
+            
+            # Save as clean JSON
+            writer.put(grounding_key, json.dumps(grounding_data, indent=2).encode("utf-8"), "application/json")
+            print(f"Queued grounding data: {grounding_key}")
+            
+            # Write all chunks as a few NDJSON shards
+            if CHUNK_LAYOUT in (CHUNK_LAYOUT_SHARDS, CHUNK_LAYOUT_BOTH):
+                write_chunk_shards(s3, bucket, source_document, chunk_records, writer=writer)
+            
+            # Publish the packed metadata index used by the query path
+            write_chunk_index(s3, bucket, source_document, chunk_records, writer=writer)
+        else:
+            print(f"No chunks found in response for grounding data")
+        checkpoint(STAGE_OUTPUTS_WRITTEN)
+
+    if not stage_reached(state, STAGE_CHUNKS_WRITTEN):
+        # Compatibility: individual chunk JSON files for Knowledge Base
+        if CHUNK_LAYOUT in (CHUNK_LAYOUT_PER_CHUNK, CHUNK_LAYOUT_BOTH):
+            start = state["chunks_written"]
+            print(f"Creating individual chunk files for Knowledge Base (from chunk {start})...")
+            for index in range(start, len(chunk_records)):
+                chunk_json = chunk_records[index]
+                # Unchanged chunk files are left alone so the Knowledge Base does not re-sync them
+                if not (state["had_chunk_files"] and chunk_json['chunk_id'] in unchanged):
+                    chunk_key = f"{chunks_folder}{source_document}_{chunk_json['chunk_id']}.json"
+                    writer.put(chunk_key, json.dumps(chunk_json, indent=2).encode("utf-8"), "application/json")
+                
+                if (index + 1) % INGESTION_CHECKPOINT_EVERY == 0 and index + 1 < len(chunk_records):
+                    state["chunks_written"] = index + 1
+                    checkpoint()
+                    if time_running_low(context):
+                        print(f"Stopping {doc_id} after {index + 1}/{len(chunk_records)} chunk files before the Lambda timeout")
+                        return {**result, "status": "in_progress", "stage": "chunks", "chunks_written": index + 1}
+            
+            print(f"Queued chunk files {start}-{len(chunk_records)} in {chunks_folder}")
+        state["chunks_written"] = len(chunk_records)
+        checkpoint(STAGE_CHUNKS_WRITTEN)
+
+    # Render chunk images now so queries never have to
+    if PRERENDER_CHUNK_IMAGES and chunk_records:
+        result["prerender"] = prerender_chunk_images(
+            s3, bucket, tmp_path, source_document, chunk_records, context=context, writer=writer
+        )
+        if not result["prerender"]["complete"]:
+            return {**result, "status": "in_progress", "stage": "images"}
+
+    write_summary = writer.report()
+    if write_summary["failed"]:
+        raise RuntimeError(f"{write_summary['failed']} S3 writes failed: {writer.failed_keys[:5]}")
+    result["writes"] = write_summary
+    
+    # Only clean up and record the new version once all its outputs are written
+    if chunk_records:
+        remove_orphaned_chunks(bucket, source_document, state["orphans"], chunks_folder, state["had_chunk_files"])
+        s3.put_object(
+            Bucket=bucket,
+            Key=manifest_key(source_document),
+            Body=json.dumps(build_manifest(key, document_hash, chunk_records, CHUNK_LAYOUT)).encode("utf-8"),
+            ContentType="application/json"
+        )
+        if state["has_previous"]:
+            result["chunks"] = {
+                "unchanged": len(unchanged),
+                "changed": len(chunk_records) - len(unchanged),
+                "removed": len(state["orphans"])
+            }
+    clear_state(s3, bucket, source_document)
+    return result
+
+
+def local_path(key: str, filename: str) -> Path:
+    """/tmp path for a source document, unique per S3 key so concurrent records never clash"""
+    folder = Path("/tmp") / "ingest" / hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder / filename
+
+
+def process_record(record: dict, context):
+    """
+    Ingest the document of one S3 event record.
+
+    Returns:
+        (result dict or None if the record was ignored, True if the record must be re-invoked)
     """
-    results = []
+    bucket = record["s3"]["bucket"]["name"]
+    key = unquote_plus(record["s3"]["object"]["key"])
+    doc_id = os.path.basename(key)
 
-    for record in event.get("Records", []):
-        bucket = record["s3"]["bucket"]["name"]
+    # Leave documents for a fresh invocation once time runs low
+    if time_running_low(context):
+        print(f"Deferring {doc_id} to the next invocation")
+        return {"source": f"s3://{bucket}/{key}", "status": "in_progress", "stage": "queued"}, True
+
+    # Record the PDF version so query-time grounding can trust its cached copy
+    grounding_manifest.add_pdf(bucket, key, record["s3"]["object"].get("eTag"))
+
+    # Extract relative path from input folder to preserve folder structure
+    relative_path = key[len(INPUT_FOLDER):] if key.startswith(INPUT_FOLDER) else key
+    
+    # Get the directory structure and filename
+    path_parts = Path(relative_path)
+    subfolder = str(path_parts.parent) if path_parts.parent != Path('.') else ''
+    filename = path_parts.name
+    
+    # Remove the original extension (e.g., .pdf) and add .md
+    # This converts "document.pdf" to "document.md" instead of "document.pdf.md"
+    filename_without_ext = Path(filename).stem  # Gets filename without extension
+    
+    # Build output key preserving folder structure
+    if subfolder and subfolder != '.':
+        output_key = f"{OUTPUT_FOLDER}{subfolder}/{filename_without_ext}.md"
+    else:
+        output_key = f"{OUTPUT_FOLDER}{filename_without_ext}.md"
+
+    previous_manifest = load_manifest(s3, bucket, filename_without_ext)
+    state = load_state(s3, bucket, filename_without_ext)
+    
+    # Documents ingested before the manifest existed are skipped if their output exists
+    if not FORCE_REPROCESS and previous_manifest is None and state is None:
+        try:
+            s3.head_object(Bucket=bucket, Key=output_key)
+            return skip_document(bucket, key, output_key, filename, context, "already_processed"), False
+        except s3.exceptions.ClientError:
+            # File doesn't exist, proceed with processing
+            pass
+
+    writer = BulkS3Writer(s3, bucket, label=doc_id)
+    try:
+        print(f"Fetching s3://{bucket}/{key}")
+        obj = s3.get_object(Bucket=bucket, Key=key)
+        file_bytes = obj["Body"].read()
+
+        document_hash = content_hash(file_bytes)
+        if state is not None and state.get("content_hash") != document_hash:
+            print(f"Discarding checkpoint of an older version of {doc_id}")
+            state = None
+        
+        # Unchanged re-uploads are skipped without spending ADE credits
+        if not FORCE_REPROCESS and state is None and previous_manifest and previous_manifest.get("content_hash") == document_hash:
+            return skip_document(bucket, key, output_key, filename, context, "unchanged"), False
+
+        tmp_path = local_path(key, filename)
+        tmp_path.write_bytes(file_bytes)
+        if subfolder and subfolder != '.':
+            print(f"   Preserved folder structure: {subfolder}/")
+
+        result = ingest_document(
+            bucket, key, output_key, tmp_path, document_hash, previous_manifest, state, writer, context
+        )
+        if result["status"] == "in_progress":
+            return result, True
+
+        print(f"Completed pipeline for {doc_id} → {output_key} (clean name: {filename_without_ext}.md)")
+        return result, False
+
+    except Exception as e:
+        print(f"Error processing {doc_id}: {e}")
+        return {
+            "source": f"s3://{bucket}/{key}",
+            "error": str(e),
+            "status": "failed"
+        }, False
+    finally:
+        writer.close()
+
+
+def select_input_records(records: list) -> list:
+    """S3 event records of uploaded input documents, skipping folders and other prefixes"""
+    selected = []
+    for record in records:
         key = unquote_plus(record["s3"]["object"]["key"])
         
         # Skip folder creation events
@@ -47,228 +463,81 @@ def ade_handler(event, context):
             continue
 
         print(f"Lambda triggered for new upload: {doc_id}")
-        ensure_s3_folders(bucket)
-
         if not key.startswith(INPUT_FOLDER):
             print(f"Skipping non-input file: {key}")
             continue
+        selected.append(record)
+    return selected
 
-        # Extract relative path from input folder to preserve folder structure
-        relative_path = key[len(INPUT_FOLDER):] if key.startswith(INPUT_FOLDER) else key
-        
-        # Get the directory structure and filename
-        path_parts = Path(relative_path)
-        subfolder = str(path_parts.parent) if path_parts.parent != Path('.') else ''
-        filename = path_parts.name
-        
-        # Remove the original extension (e.g., .pdf) and add .md
-        # This converts "document.pdf" to "document.md" instead of "document.pdf.md"
-        filename_without_ext = Path(filename).stem  # Gets filename without extension
-        
-        # Build output key preserving folder structure
-        if subfolder and subfolder != '.':
-            output_key = f"{OUTPUT_FOLDER}{subfolder}/{filename_without_ext}.md"
-        else:
-            output_key = f"{OUTPUT_FOLDER}{filename_without_ext}.md"
-
-        # Check if output file already exists (unless force reprocess is enabled)
-        if not FORCE_REPROCESS:
-            try:
-                s3.head_object(Bucket=bucket, Key=output_key)
-                print(f"Skipping {doc_id} - already processed (output exists: {output_key})")
-                results.append({
-                    "source": f"s3://{bucket}/{key}",
-                    "output": f"s3://{bucket}/{output_key}",
-                    "status": "skipped",
-                    "reason": "already_processed"
-                })
-                continue
-            except s3.exceptions.ClientError:
-                # File doesn't exist, proceed with processing
-                pass
 
-        try:
-            print(f"Fetching s3://{bucket}/{key}")
-            obj = s3.get_object(Bucket=bucket, Key=key)
-            file_bytes = obj["Body"].read()
-
-            tmp_path = Path("/tmp") / filename
-            tmp_path.write_bytes(file_bytes)
-
-            # Start parsing
-            print(f"Starting ADE parsing for {doc_id} (model={ADE_MODEL})")
-            response = client.parse(document=tmp_path, model=ADE_MODEL)
-            markdown = response.markdown
-            print(f"Finished parsing document: {doc_id}")
-
-            print(f"Uploading parsed Markdown → s3://{bucket}/{output_key}")
-            if subfolder and subfolder != '.':
-                print(f"   Preserved folder structure: {subfolder}/")
-            s3.put_object(
-                Bucket=bucket,
-                Key=output_key,
-                Body=markdown.encode("utf-8"),
-                ContentType="text/markdown"
-            )
-            
-            # Save grounding data (visual references) in separate folder
-            # Use path-based approach for consistent folder structure
-            path_parts = Path(output_key).parts
-            
-            if len(path_parts) >= 2:
-                base_folder = str(Path(*path_parts[:2]))  
-                relative_path = Path(*path_parts[2:]) if len(path_parts) > 2 else Path(path_parts[-1])
-                
-                # Create parallel folders with consistent naming
-                grounding_folder = f"{base_folder}_grounding"
-                chunks_folder = f"{base_folder}_chunks/"
-                
-                # Build the grounding key path
-                grounding_filename = str(relative_path).replace('.md', '_grounding.json')
-                grounding_key = str(Path(grounding_folder) / grounding_filename)
-            else:
-                # Fallback for files directly in output/ (shouldn't happen normally)
-                grounding_key = output_key.replace('.md', '_grounding.json')
-                chunks_folder = 'output/chunks/'
-            try:
-                # Parse and properly format grounding data
-                chunks_data = []
-                if hasattr(response, 'chunks'):
-                    for chunk in response.chunks:
-                        # Parse chunk data - handle both object and dict formats
-                        if hasattr(chunk, '__dict__'):
-                            chunk_dict = {
-                                'id': getattr(chunk, 'id', ''),
-                                'type': getattr(chunk, 'type', ''),
-                                'markdown': getattr(chunk, 'markdown', ''),
-                            }
-                            if hasattr(chunk, 'grounding'):
-                                grounding = chunk.grounding
-                                if hasattr(grounding, 'page') and hasattr(grounding, 'box'):
-                                    box = grounding.box
-                                    chunk_dict['grounding'] = {
-                                        'page': grounding.page,
-                                        'box': {
-                                            'left': getattr(box, 'left', 0),
-                                            'top': getattr(box, 'top', 0),
-                                            'right': getattr(box, 'right', 0),
-                                            'bottom': getattr(box, 'bottom', 0)
-                                        }
-                                    }
-                        else:
-                            chunk_dict = chunk
-                        chunks_data.append(chunk_dict)
-                
-                splits_data = []
-                if hasattr(response, 'splits'):
-                    for split in response.splits:
-                        if hasattr(split, '__dict__'):
-                            split_dict = {
-                                'chunks': getattr(split, 'chunks', []),
-                                'pages': getattr(split, 'pages', []),
-                                'markdown': getattr(split, 'markdown', ''),
-                                'class_': getattr(split, 'class_', '')
-                            }
-                        else:
-                            split_dict = split
-                        splits_data.append(split_dict)
-                
-                metadata_data = {}
-                if hasattr(response, 'metadata'):
-                    metadata = response.metadata
-                    if hasattr(metadata, '__dict__'):
-                        metadata_data = {
-                            'filename': getattr(metadata, 'filename', ''),
-                            'page_count': getattr(metadata, 'page_count', 0),
-                            'version': getattr(metadata, 'version', ''),
-                            'job_id': getattr(metadata, 'job_id', ''),
-                            'org_id': getattr(metadata, 'org_id', ''),
-                            'credit_usage': getattr(metadata, 'credit_usage', 0),
-                            'duration_ms': getattr(metadata, 'duration_ms', 0)
-                        }
-                    else:
-                        metadata_data = metadata
-                
-                grounding_data = {
-                    'chunks': chunks_data,
-                    'splits': splits_data,
-                    'metadata': metadata_data
-                }
-                
-                # Only save if we have actual chunk data
-                if grounding_data['chunks']:
-                    print(f"Uploading visual grounding data → s3://{bucket}/{grounding_key}")
-                    print(f"Found {len(grounding_data['chunks'])} chunks with grounding info")
-                    
-                    # Save as clean JSON
-                    s3.put_object(
-                        Bucket=bucket,
-                        Key=grounding_key,
-                        Body=json.dumps(grounding_data, indent=2).encode("utf-8"),
-                        ContentType="application/json"
-                    )
-                    print(f"Saved grounding data: {grounding_key}")
-                    
-                    # Create individual chunk JSON files for Knowledge Base
-                    print(f"Creating individual chunk files for Knowledge Base...")
-                    chunk_count = 0
-                    for chunk in chunks_data:
-                        chunk_id = chunk.get('id', '')
-                        if not chunk_id:
-                            continue
-                        
-                        # Extract bbox from grounding
-                        grounding = chunk.get('grounding', {})
-                        box = grounding.get('box', {})
-                        bbox = [
-                            box.get('left', 0),
-                            box.get('top', 0),
-                            box.get('right', 1),
-                            box.get('bottom', 1)
-                        ]
-                        
-                        # Create chunk JSON for Knowledge Base
-                        chunk_json = {
-                            "chunk_id": chunk_id,
-                            "chunk_type": chunk.get('type', 'text'),
-                            "text": chunk.get('markdown', ''),
-                            "bbox": bbox,
-                            "page": grounding.get('page', 0),
-                            "source_document": filename_without_ext
-                        }
-                        
-                        # Save individual chunk JSON
-                        chunk_key = f"{chunks_folder}{filename_without_ext}_{chunk_id}.json"
-                        s3.put_object(
-                            Bucket=bucket,
-                            Key=chunk_key,
-                            Body=json.dumps(chunk_json, indent=2).encode("utf-8"),
-                            ContentType="application/json"
-                        )
-                        chunk_count += 1
-                    
-                    print(f"Created {chunk_count} chunk files in {chunks_folder}")
-                else:
-                    print(f"No chunks found in response for grounding data")
-                    
-            except Exception as e:
-                print(f"Could not save grounding data: {e}")
-
-            results.append({
-                "source": f"s3://{bucket}/{key}",
-                "output": f"s3://{bucket}/{output_key}",
-                "status": "success"
-            })
-
-            print(f"Completed pipeline for {doc_id} → {output_key} (clean name: {filename_without_ext}.md)")
+def process_records(records: list, context) -> list:
+    """
+    Ingest input records concurrently, up to INGESTION_RECORD_CONCURRENCY at a time.
 
+    Returns:
+        (result, needs_another_run) per record, in record order
+    """
+    # One-time setup for every bucket of the batch
+    buckets = sorted({record["s3"]["bucket"]["name"] for record in records})
+    for bucket in buckets:
+        ensure_s3_folders(bucket)
+
+    def run(record):
+        # A bug in one record must not take down the others
+        try:
+            return process_record(record, context)
         except Exception as e:
-            print(f"Error processing {doc_id}: {e}")
-            results.append({
-                "source": f"s3://{bucket}/{key}",
+            print(f"Error processing {record['s3']['object']['key']}: {e}")
+            return {
+                "source": f"s3://{record['s3']['bucket']['name']}/{unquote_plus(record['s3']['object']['key'])}",
                 "error": str(e),
                 "status": "failed"
-            })
+            }, False
+
+    if len(records) > 1 and INGESTION_RECORD_CONCURRENCY > 1:
+        with ThreadPoolExecutor(max_workers=min(INGESTION_RECORD_CONCURRENCY, len(records))) as executor:
+            outcomes = list(executor.map(run, records))
+    else:
+        outcomes = [run(record) for record in records]
+
+    for bucket in buckets:
+        grounding_manifest.flush(s3, bucket)
+    return outcomes
+
+
+def ade_handler(event, context):
+    """
+    AWS Lambda handler for automatically parsing documents uploaded to S3/input/
+    and saving Markdown results to S3/output/ with preserved folder structure.
+    
+    Records are processed concurrently, up to INGESTION_RECORD_CONCURRENCY at a
+    time; results keep the order of the records. Documents that run out of time
+    are checkpointed, and the handler re-invokes itself with their records,
+    up to INGESTION_MAX_CONTINUATIONS times and only while they make progress.
+    """
+    records = select_input_records(event.get("Records", []))
+    outcomes = process_records(records, context)
+
+    unfinished = []
+    continued_results = []
+    for record, (result, again) in zip(records, outcomes):
+        if not again:
+            continue
+        continuation, reason = next_continuation(record, result)
+        if continuation is None:
+            print(f"Giving up on {result['source']}: {reason}")
+            result.update(status="failed", error=reason)
+            continue
+        unfinished.append({**record, CONTINUATION_KEY: continuation})
+        continued_results.append(result)
+
+    # Without a continuation nothing would pick these documents up again;
+    # their checkpoints are kept, so a new upload event resumes them
+    if unfinished and not reinvoke(context, {"Records": unfinished}):
+        for result in continued_results:
+            result.update(status="failed", error="Could not re-invoke to continue ingestion")
+
+    results = [result for result, _ in outcomes if result is not None]
 
     print("All records processed.")
-    return {"status": "ok", "results": results}
\ No newline at end of file
+    return {"status": "ok", "results": results}
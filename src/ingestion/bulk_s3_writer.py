@@ -0,0 +1,163 @@
+"""
+Bulk S3 Writer
+Uploads ingestion outputs concurrently with retries on S3 throttling
+"""
+
+import os
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+BULK_WRITE_WORKERS = int(os.environ.get("BULK_WRITE_WORKERS", "16"))
+BULK_WRITE_MAX_ATTEMPTS = int(os.environ.get("BULK_WRITE_MAX_ATTEMPTS", "6"))
+BULK_WRITE_BACKOFF_BASE = 0.2
+BULK_WRITE_BACKOFF_MAX = 10.0
+
+# Error codes S3 returns when a prefix is being written too fast or is briefly unavailable
+RETRYABLE_ERROR_CODES = {
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "ServiceUnavailable",
+    "InternalError",
+    "RequestTimeout",
+    "503",
+    "500",
+}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether a failed put should be retried"""
+    code = str(getattr(error, "response", {}).get("Error", {}).get("Code", ""))
+    return code in RETRYABLE_ERROR_CODES
+
+
+def backoff_delay(attempt: int, base: float = BULK_WRITE_BACKOFF_BASE, cap: float = BULK_WRITE_BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff: a random delay up to base * 2^attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class BulkS3Writer:
+    """
+    Writes many S3 objects through a bounded pool of upload threads.
+
+    put() queues an upload and returns a Future; at most a few uploads per
+    worker are queued at once, so producers never hold a whole document's
+    outputs in memory. Throttled puts are retried with jittered backoff.
+    flush() waits for every queued upload and returns the write summary.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        workers: int = BULK_WRITE_WORKERS,
+        max_attempts: int = BULK_WRITE_MAX_ATTEMPTS,
+        label: str = ""
+    ):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.max_attempts = max(1, max_attempts)
+        self.label = label
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.bytes_written = 0
+        self.failed_keys: List[str] = []
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="s3-writer")
+        self._slots = threading.BoundedSemaphore(max(1, workers) * 4)
+        self._pending: List[Future] = []
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def put(self, key: str, body: bytes, content_type: Optional[str] = None) -> Future:
+        """Queue an upload; blocks while the queue is full"""
+        self._slots.acquire()
+        with self._lock:
+            self.submitted += 1
+        try:
+            future = self._executor.submit(self._put_with_retry, key, body, content_type)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        with self._lock:
+            self._pending.append(future)
+        return future
+
+    def _put_with_retry(self, key: str, body: bytes, content_type: Optional[str]):
+        kwargs = {"Bucket": self.bucket, "Key": key, "Body": body}
+        if content_type:
+            kwargs["ContentType"] = content_type
+        attempt = 0
+        while True:
+            try:
+                self.s3_client.put_object(**kwargs)
+                with self._lock:
+                    self.completed += 1
+                    self.bytes_written += len(body)
+                return key
+            except Exception as e:
+                attempt += 1
+                if attempt >= self.max_attempts or not is_retryable(e):
+                    print(f"Could not write s3://{self.bucket}/{key}: {e}")
+                    with self._lock:
+                        self.failed += 1
+                        self.failed_keys.append(key)
+                    raise
+                with self._lock:
+                    self.retries += 1
+                time.sleep(backoff_delay(attempt))
+
+    def progress(self) -> Dict:
+        """Counters of the uploads queued so far"""
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "retries": self.retries,
+                "bytes": self.bytes_written
+            }
+
+    def flush(self) -> Dict:
+        """Wait for every queued upload and return the write summary"""
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                break
+            for future in pending:
+                # Failures are counted and reported in the summary
+                future.exception()
+        return self.summary()
+
+    def summary(self) -> Dict:
+        summary = self.progress()
+        summary["seconds"] = round(time.time() - self._started, 3)
+        return summary
+
+    def report(self) -> Dict:
+        """Flush and print the summary of this writer"""
+        summary = self.flush()
+        name = f" for {self.label}" if self.label else ""
+        print(
+            f"Wrote {summary['completed']} objects ({summary['bytes']} bytes){name} "
+            f"in {summary['seconds']:.1f}s ({summary['retries']} retries, {summary['failed']} failed)"
+        )
+        return summary
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
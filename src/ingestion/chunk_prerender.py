@@ -0,0 +1,306 @@
+"""
+Chunk Image Pre-rendering
+Renders chunk crops at ingestion time so PDF rendering stays off the query path
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+try:
+    from bulk_s3_writer import BulkS3Writer
+    from grounding_manifest import grounding_manifest
+    from image_encoding import CHUNK_IMAGE_PROFILE
+    from visual_grounding_helper import chunk_image_key, render_chunk_image
+except ImportError:
+    from src.ingestion.bulk_s3_writer import BulkS3Writer
+    from src.rag.grounding_manifest import grounding_manifest
+    from src.rag.image_encoding import CHUNK_IMAGE_PROFILE
+    from src.rag.visual_grounding_helper import chunk_image_key, render_chunk_image
+
+PRERENDER_CHUNK_IMAGES = os.environ.get("PRERENDER_CHUNK_IMAGES", "false").lower() == "true"
+# Comma-separated chunk types to pre-render (e.g. "table,figure"); empty means all
+PRERENDER_CHUNK_TYPES = {t.strip().lower() for t in os.environ.get("PRERENDER_CHUNK_TYPES", "").split(",") if t.strip()}
+# Render processes across all documents ingested concurrently in this process
+PRERENDER_WORKERS = int(os.environ.get("PRERENDER_WORKERS", "0")) or (os.cpu_count() or 1)
+# Stop and checkpoint when less than this much Lambda time is left
+PRERENDER_TIME_MARGIN_MS = int(os.environ.get("PRERENDER_TIME_MARGIN_MS", "60000"))
+PRERENDER_CHECKPOINT_EVERY = 50
+# Render processes are started from a clean server process: ingestion runs several
+# documents on threads, and forking a multi-threaded process can copy held locks
+_MP_CONTEXT = multiprocessing.get_context(os.environ.get("PRERENDER_START_METHOD", "forkserver"))
+# Outside output/, which the Knowledge Base data source indexes
+CHECKPOINT_PREFIX = "internal/prerender_checkpoints/"
+
+# Must match the crops requested by search_tool at query time
+CROP_HIGHLIGHT = True
+CROP_PADDING = 10
+
+
+class RenderSlots:
+    """
+    Budget of render processes shared by the documents ingested concurrently.
+
+    Each document takes as many free slots as it can use, so a lone document
+    still gets every worker while concurrent ones never exceed the total.
+    """
+
+    def __init__(self, total: int = PRERENDER_WORKERS):
+        self.total = total
+        self.free = total
+        self._condition = threading.Condition()
+
+    def acquire(self, wanted: int, context=None) -> int:
+        """
+        Take up to `wanted` slots, waiting for at least one.
+
+        Returns:
+            Number of slots taken; 0 if the Lambda ran low on time while waiting
+        """
+        with self._condition:
+            while self.free == 0:
+                if context is not None and context.get_remaining_time_in_millis() < PRERENDER_TIME_MARGIN_MS:
+                    return 0
+                self._condition.wait(timeout=1.0)
+            taken = min(wanted, self.free)
+            self.free -= taken
+            return taken
+
+    def release(self, count: int):
+        with self._condition:
+            self.free += count
+            self._condition.notify_all()
+
+
+render_slots = RenderSlots()
+
+
+def checkpoint_key(source_document: str) -> str:
+    return f"{CHECKPOINT_PREFIX}{source_document}.json"
+
+
+def load_checkpoint(s3, bucket: str, source_document: str) -> Optional[Dict]:
+    """Load the pre-render checkpoint of a document, or None if there is none"""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=checkpoint_key(source_document))
+        return json.loads(obj["Body"].read().decode("utf-8"))
+    except Exception:
+        return None
+
+
+def save_checkpoint(s3, bucket: str, source_document: str, rendered: Set[str], total: int, complete: bool):
+    checkpoint = {
+        "source_document": source_document,
+        "rendered": sorted(rendered),
+        "total": total,
+        "complete": complete
+    }
+    s3.put_object(
+        Bucket=bucket,
+        Key=checkpoint_key(source_document),
+        Body=json.dumps(checkpoint).encode("utf-8"),
+        ContentType="application/json"
+    )
+
+
+def prerender_incomplete(s3, bucket: str, source_document: str) -> bool:
+    """Check whether a previous pre-render run stopped before finishing"""
+    checkpoint = load_checkpoint(s3, bucket, source_document)
+    return checkpoint is not None and not checkpoint.get("complete", False)
+
+
+def select_chunks(chunks: List[Dict], chunk_types: Set[str] = None) -> List[Dict]:
+    """
+    Pick the chunk JSON records to pre-render.
+
+    Args:
+        chunks: Chunk records as written to the _chunks/ folder
+        chunk_types: Chunk types to keep; empty or None keeps every type
+    """
+    chunk_types = PRERENDER_CHUNK_TYPES if chunk_types is None else chunk_types
+    return [
+        chunk for chunk in chunks
+        if chunk.get("chunk_id") and (not chunk_types or chunk.get("chunk_type", "text").lower() in chunk_types)
+    ]
+
+
+def _render_worker(pdf_path: str, jobs: List[Dict], out_dir: str, conn):
+    """Process entry point: render each job to a PNG file and report its chunk_id"""
+    for job in jobs:
+        image_path = None
+        try:
+            image_data = render_chunk_image(
+                pdf_path, job["page"], job["bbox"], CROP_HIGHLIGHT, CROP_PADDING,
+                profile=CHUNK_IMAGE_PROFILE, chunk_type=job.get("chunk_type", "text")
+            )
+            if image_data is not None:
+                image_name = hashlib.sha1(job["chunk_id"].encode("utf-8")).hexdigest()
+                image_path = str(Path(out_dir) / f"{image_name}.{CHUNK_IMAGE_PROFILE.extension}")
+                Path(image_path).write_bytes(image_data)
+        except Exception as e:
+            print(f"Could not pre-render chunk {job['chunk_id']}: {e}")
+        conn.send((job["chunk_id"], image_path))
+    conn.send(None)
+    conn.close()
+
+
+def _split_by_page(jobs: List[Dict], workers: int) -> List[List[Dict]]:
+    # Keep each page on one worker so its page raster is rendered once
+    by_page = {}
+    for job in jobs:
+        by_page.setdefault(job["page"], []).append(job)
+    pages = sorted(by_page.values(), key=len, reverse=True)
+    buckets = [[] for _ in range(min(workers, len(pages)))]
+    for page_jobs in pages:
+        min(buckets, key=len).extend(page_jobs)
+    return [b for b in buckets if b]
+
+
+def prerender_chunk_images(
+    s3,
+    bucket: str,
+    pdf_path: str,
+    source_document: str,
+    chunks: List[Dict],
+    context=None,
+    chunk_types: Set[str] = None,
+    workers: int = PRERENDER_WORKERS,
+    writer: BulkS3Writer = None
+) -> Dict:
+    """
+    Render and upload the chunk images of a document with a pool of worker processes.
+
+    Progress is checkpointed to S3, so a run cut short by the Lambda timeout
+    resumes where it stopped on the next invocation.
+
+    Args:
+        s3: Boto3 S3 client
+        bucket: S3 bucket name
+        pdf_path: Local path of the source PDF
+        source_document: Document name without extension
+        chunks: Chunk records (chunk_id, chunk_type, page, bbox)
+        context: Lambda context, used to stop before the timeout
+        chunk_types: Chunk types to render; defaults to PRERENDER_CHUNK_TYPES
+        workers: Maximum number of render processes, taken from render_slots
+        writer: Bulk writer for the image uploads; a private one is used if omitted
+
+    Returns:
+        Summary dict with rendered, failed, total and complete
+    """
+    selected = select_chunks(chunks, chunk_types)
+    checkpoint = load_checkpoint(s3, bucket, source_document) or {}
+    chunk_types_by_id = {chunk["chunk_id"]: chunk.get("chunk_type", "text") for chunk in selected}
+    # Chunks removed by a re-ingestion drop out of the checkpoint
+    rendered = set(checkpoint.get("rendered", [])) & chunk_types_by_id.keys()
+    jobs = [chunk for chunk in selected if chunk["chunk_id"] not in rendered]
+    print(f"Pre-rendering {len(jobs)} of {len(selected)} chunk images for {source_document} ({len(rendered)} already done)")
+
+    out_dir = Path("/tmp") / "prerender" / source_document
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Other documents of the batch may hold part of the render budget
+    slots = render_slots.acquire(min(workers, len({job["page"] for job in jobs})), context) if jobs else 0
+    stopped_early = bool(jobs) and slots == 0
+    if stopped_early:
+        print(f"No render slot for {source_document} before the Lambda timeout")
+
+    processes, connections = [], []
+    own_writer = writer is None
+    if own_writer:
+        writer = BulkS3Writer(s3, bucket, label=f"{source_document} chunk images")
+    uploads = []
+
+    def settle_uploads():
+        # Only chunks whose upload finished count as rendered in the checkpoint
+        nonlocal failed
+        writer.flush()
+        for chunk_id, future in uploads:
+            if future.exception() is None:
+                rendered.add(chunk_id)
+            else:
+                failed += 1
+        uploads.clear()
+
+    failed = 0
+    since_checkpoint = 0
+    start = time.time()
+    try:
+        # multiprocessing.Pool needs /dev/shm, which Lambda lacks; plain processes and pipes work
+        for worker_jobs in (_split_by_page(jobs, slots) if slots else []):
+            parent_conn, child_conn = _MP_CONTEXT.Pipe(duplex=False)
+            process = _MP_CONTEXT.Process(
+                target=_render_worker,
+                args=(str(pdf_path), worker_jobs, str(out_dir), child_conn)
+            )
+            process.start()
+            child_conn.close()
+            processes.append(process)
+            connections.append(parent_conn)
+
+        while connections:
+            if context is not None and context.get_remaining_time_in_millis() < PRERENDER_TIME_MARGIN_MS:
+                print(f"Stopping pre-render of {source_document} before the Lambda timeout")
+                stopped_early = True
+                break
+
+            for conn in wait(connections, timeout=1.0):
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    message = None
+                if message is None:
+                    connections.remove(conn)
+                    continue
+
+                chunk_id, image_path = message
+                if image_path is None:
+                    failed += 1
+                    continue
+                key = chunk_image_key(source_document, chunk_id, CHUNK_IMAGE_PROFILE, chunk_types_by_id[chunk_id])
+                body = Path(image_path).read_bytes()
+                Path(image_path).unlink(missing_ok=True)
+                uploads.append((chunk_id, writer.put(key, body, CHUNK_IMAGE_PROFILE.content_type)))
+                since_checkpoint += 1
+                if since_checkpoint >= PRERENDER_CHECKPOINT_EVERY:
+                    settle_uploads()
+                    save_checkpoint(s3, bucket, source_document, rendered, len(selected), complete=False)
+                    since_checkpoint = 0
+    finally:
+        # Workers still holding a connection were cut off by the deadline or an
+        # error and may block forever on a full pipe; stop them before joining
+        for process in processes:
+            if connections and process.is_alive():
+                process.terminate()
+            process.join()
+        for conn in connections:
+            conn.close()
+        render_slots.release(slots)
+        settle_uploads()
+        if own_writer:
+            writer.close()
+
+    # A worker that crashed (OOM, MuPDF fault) closes its pipe like one that
+    # finished, so completeness is judged by the chunks accounted for
+    crashed = [process.exitcode for process in processes if process.exitcode != 0]
+    if crashed and not stopped_early:
+        print(f"{len(crashed)} pre-render workers of {source_document} exited abnormally: {crashed}")
+    complete = not stopped_early and not crashed and len(rendered) + failed == len(selected)
+    save_checkpoint(s3, bucket, source_document, rendered, len(selected), complete=complete)
+    grounding_manifest.add_images(bucket, [
+        chunk_image_key(source_document, chunk_id, CHUNK_IMAGE_PROFILE, chunk_types_by_id[chunk_id])
+        for chunk_id in rendered if chunk_id in chunk_types_by_id
+    ])
+    grounding_manifest.flush(s3, bucket)
+    print(f"Pre-rendered {len(rendered)}/{len(selected)} chunk images for {source_document} in {time.time() - start:.1f}s")
+    return {
+        "rendered": len(rendered),
+        "failed": failed,
+        "total": len(selected),
+        "complete": complete
+    }
@@ -0,0 +1,154 @@
+"""
+Ingestion Manifest
+Content hashes of ingested documents and their chunks for incremental re-ingestion
+"""
+
+import os
+import re
+import json
+import hashlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Outside output/, which the Knowledge Base data source indexes
+INGESTION_MANIFEST_PREFIX = os.environ.get("INGESTION_MANIFEST_PREFIX", "internal/ingestion_manifest/")
+INGESTION_MANIFEST_FORMAT = 1
+DELETE_BATCH_SIZE = 1000
+
+# Anchor ADE puts before a chunk's markdown; it carries the per-parse chunk id
+ANCHOR_PATTERN = re.compile(r"<a id=[\"'][^\"']*[\"']></a>\s*")
+
+
+class ChunkDiff(NamedTuple):
+    """How the chunks of a re-parsed document relate to the previous ingestion"""
+    id_map: Dict[str, str]      # new ADE chunk_id -> reused chunk_id of identical content
+    unchanged: set              # chunk_ids (after remapping) whose outputs already exist
+    orphans: Dict[str, str]     # chunk_id -> chunk_type of chunks that no longer exist
+
+
+def manifest_key(source_document: str) -> str:
+    return f"{INGESTION_MANIFEST_PREFIX}{source_document}.json"
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of a source document"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_hash(record: Dict) -> str:
+    """
+    Hash of everything a chunk's outputs depend on.
+
+    Text, type, page and bbox are covered, so a chunk that moved to another
+    page or region gets new files and a new crop. The id anchor in the text
+    changes on every parse and is left out.
+    """
+    payload = [
+        record.get("chunk_type", "text"),
+        ANCHOR_PATTERN.sub("", record.get("text", "")).strip(),
+        record.get("page", 0),
+        [round(float(v), 6) for v in record.get("bbox") or []]
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def load_manifest(s3, bucket: str, source_document: str) -> Optional[Dict]:
+    """Load the ingestion manifest of a document, or None if it was never ingested with one"""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=manifest_key(source_document))
+        manifest = json.loads(obj["Body"].read().decode("utf-8"))
+    except Exception:
+        return None
+    if manifest.get("format") != INGESTION_MANIFEST_FORMAT:
+        return None
+    return manifest
+
+
+def build_manifest(source_key: str, document_hash: str, records: List[Dict], chunk_layout: str) -> Dict:
+    return {
+        "format": INGESTION_MANIFEST_FORMAT,
+        "source_key": source_key,
+        "content_hash": document_hash,
+        "chunk_layout": chunk_layout,
+        "chunks": {
+            record["chunk_id"]: {"hash": chunk_hash(record), "type": record.get("chunk_type", "text")}
+            for record in records
+        }
+    }
+
+
+def diff_chunks(records: List[Dict], previous: Optional[Dict]) -> ChunkDiff:
+    """
+    Match re-parsed chunks against the previous manifest by content hash.
+
+    ADE assigns fresh chunk ids on every parse, so chunks with identical
+    content are mapped back to their previous ids to keep their files,
+    images and Knowledge Base entries.
+    """
+    previous_chunks = (previous or {}).get("chunks", {})
+    ids_by_hash = defaultdict(list)
+    for chunk_id, entry in previous_chunks.items():
+        ids_by_hash[entry["hash"]].append(chunk_id)
+
+    id_map = {}
+    for record in records:
+        matches = ids_by_hash.get(chunk_hash(record))
+        if matches:
+            id_map[record["chunk_id"]] = matches.pop(0)
+
+    reused = set(id_map.values())
+    orphans = {
+        chunk_id: entry.get("type", "text")
+        for chunk_id, entry in previous_chunks.items() if chunk_id not in reused
+    }
+    return ChunkDiff(id_map, reused, orphans)
+
+
+def apply_chunk_ids(parsed: Dict, id_map: Dict[str, str]) -> Dict:
+    """Rename chunk ids in a parse result's chunks, splits and markdown anchors"""
+    renames = {new: old for new, old in id_map.items() if new != old}
+    if not renames:
+        return parsed
+    pattern = re.compile("|".join(re.escape(chunk_id) for chunk_id in sorted(renames, key=len, reverse=True)))
+
+    def rename(text):
+        return pattern.sub(lambda m: renames[m.group(0)], text) if isinstance(text, str) else text
+
+    chunks = [
+        {**chunk, "id": renames.get(chunk.get("id"), chunk.get("id")), "markdown": rename(chunk.get("markdown", ""))}
+        for chunk in parsed["chunks"]
+    ]
+    splits = [
+        {
+            **split,
+            "chunks": [renames.get(c, c) for c in split.get("chunks") or []],
+            "markdown": rename(split.get("markdown", ""))
+        } if isinstance(split, dict) else split
+        for split in parsed["splits"]
+    ]
+    return {**parsed, "markdown": rename(parsed["markdown"]), "chunks": chunks, "splits": splits}
+
+
+def delete_keys(s3, bucket: str, keys: Iterable[str]) -> int:
+    """
+    Delete S3 objects in batches.
+
+    Returns:
+        Number of keys S3 reported as deleted
+    """
+    keys = sorted(set(keys))
+    deleted = 0
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start:start + DELETE_BATCH_SIZE]
+        try:
+            response = s3.delete_objects(
+                Bucket=bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+            )
+            errors = response.get("Errors", [])
+            for error in errors:
+                print(f"Could not delete {error.get('Key')}: {error.get('Message')}")
+            deleted += len(batch) - len(errors)
+        except Exception as e:
+            print(f"Could not delete {len(batch)} objects: {e}")
+    return deleted
@@ -0,0 +1,150 @@
+"""
+Ingestion State
+Stage checkpoints that let a document's ingestion resume across Lambda invocations
+"""
+
+import os
+import json
+from typing import Dict, Optional, Tuple
+
+import boto3
+
+# Outside output/, which the Knowledge Base data source indexes
+INGESTION_STATE_PREFIX = os.environ.get("INGESTION_STATE_PREFIX", "internal/ingestion_state/")
+# Checkpoint and re-invoke when less than this much Lambda time is left
+INGESTION_TIME_MARGIN_MS = int(os.environ.get("INGESTION_TIME_MARGIN_MS", "120000"))
+# Chunk files written between two checkpoints
+INGESTION_CHECKPOINT_EVERY = int(os.environ.get("INGESTION_CHECKPOINT_EVERY", "500"))
+# Times a document is handed to a new invocation before it is given up as failed
+INGESTION_MAX_CONTINUATIONS = int(os.environ.get("INGESTION_MAX_CONTINUATIONS", "20"))
+
+# Key of the continuation marker carried by the S3 record of a re-invoked document
+CONTINUATION_KEY = "ingestion_continuation"
+
+# Stages in the order they complete
+STAGE_PARSED = "parsed"
+STAGE_OUTPUTS_WRITTEN = "outputs_written"
+STAGE_CHUNKS_WRITTEN = "chunks_written"
+STAGES = [STAGE_PARSED, STAGE_OUTPUTS_WRITTEN, STAGE_CHUNKS_WRITTEN]
+
+_lambda_client = None
+
+
+def state_key(source_document: str) -> str:
+    return f"{INGESTION_STATE_PREFIX}{source_document}/state.json"
+
+
+def parsed_key(source_document: str) -> str:
+    return f"{INGESTION_STATE_PREFIX}{source_document}/parsed.json"
+
+
+def stage_reached(state: Optional[Dict], stage: str) -> bool:
+    """Check whether a checkpointed ingestion already completed a stage"""
+    return state is not None and STAGES.index(state["stage"]) >= STAGES.index(stage)
+
+
+def load_state(s3, bucket: str, source_document: str) -> Optional[Dict]:
+    """Load the checkpoint of an unfinished ingestion, or None"""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=state_key(source_document))
+        return json.loads(obj["Body"].read().decode("utf-8"))
+    except Exception:
+        return None
+
+
+def save_state(s3, bucket: str, source_document: str, state: Dict):
+    s3.put_object(
+        Bucket=bucket,
+        Key=state_key(source_document),
+        Body=json.dumps(state).encode("utf-8"),
+        ContentType="application/json"
+    )
+
+
+def save_parsed(s3, bucket: str, source_document: str, parsed: Dict):
+    """Persist a parse result so a resumed ingestion does not parse again"""
+    s3.put_object(
+        Bucket=bucket,
+        Key=parsed_key(source_document),
+        Body=json.dumps(parsed).encode("utf-8"),
+        ContentType="application/json"
+    )
+
+
+def load_parsed(s3, bucket: str, source_document: str) -> Dict:
+    obj = s3.get_object(Bucket=bucket, Key=parsed_key(source_document))
+    return json.loads(obj["Body"].read().decode("utf-8"))
+
+
+def clear_state(s3, bucket: str, source_document: str):
+    """Remove the checkpoint of a finished ingestion"""
+    try:
+        s3.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": state_key(source_document)}, {"Key": parsed_key(source_document)}], "Quiet": True}
+        )
+    except Exception as e:
+        print(f"Could not clear ingestion state of {source_document}: {e}")
+
+
+def time_running_low(context, margin_ms: int = INGESTION_TIME_MARGIN_MS) -> bool:
+    """Check whether the Lambda invocation is close to its timeout"""
+    return context is not None and context.get_remaining_time_in_millis() < margin_ms
+
+
+def result_progress(result: Dict) -> list:
+    """Stage and work done of an in-progress ingestion result"""
+    done = result.get("chunks_written") or (result.get("prerender") or {}).get("rendered", 0)
+    return [result.get("stage", ""), done]
+
+
+def next_continuation(record: Dict, result: Dict,
+                      max_continuations: int = INGESTION_MAX_CONTINUATIONS) -> Tuple[Optional[Dict], str]:
+    """
+    Continuation marker for handing a record to a new invocation after an in-progress result.
+
+    The marker counts the hand-offs and remembers how far the document got, so a
+    document that keeps running out of time without moving on is not re-invoked
+    forever. Records deferred before they started keep their previous progress.
+
+    Returns:
+        (marker, "") to continue, or (None, reason) to give the document up
+    """
+    previous = record.get(CONTINUATION_KEY) or {}
+    hops = previous.get("hops", 0) + 1
+    if result.get("stage") == "queued":
+        progress = previous.get("progress")
+    else:
+        progress = result_progress(result)
+        if progress == previous.get("progress"):
+            return None, f"no progress since the last continuation (stage {progress[0]}, {progress[1]} done)"
+    if hops > max_continuations:
+        return None, f"gave up after {max_continuations} continuations"
+    return {"hops": hops, "progress": progress}, ""
+
+
+def reinvoke(context, event: Dict) -> bool:
+    """
+    Queue an asynchronous invocation of the running function with an event.
+
+    Returns:
+        True if the invocation was accepted
+    """
+    global _lambda_client
+    function_name = getattr(context, "invoked_function_arn", None) or getattr(context, "function_name", None)
+    if not function_name:
+        print("Cannot re-invoke without a Lambda context")
+        return False
+    try:
+        if _lambda_client is None:
+            _lambda_client = boto3.client("lambda")
+        _lambda_client.invoke(
+            FunctionName=function_name,
+            InvocationType="Event",
+            Payload=json.dumps(event).encode("utf-8")
+        )
+        print(f"Re-invoked {function_name} to continue ingestion")
+        return True
+    except Exception as e:
+        print(f"Could not re-invoke {function_name}: {e}")
+        return False
@@ -14,17 +14,53 @@ env_vars = {
     "INPUT_FOLDER": "input/",
     "OUTPUT_FOLDER": "output/",
     "S3_BUCKET": os.getenv("S3_BUCKET"),
-    "FORCE_REPROCESS": "false" 
+    "FORCE_REPROCESS": "false",
+    "PRERENDER_CHUNK_IMAGES": os.getenv("PRERENDER_CHUNK_IMAGES", "false"),
+    "PRERENDER_CHUNK_TYPES": os.getenv("PRERENDER_CHUNK_TYPES", ""),
+    # Must match the profile of the query-time agent so image keys line up
+    "CHUNK_IMAGE_PROFILE": os.getenv("CHUNK_IMAGE_PROFILE", "png"),
+    # "shards" drops the per-chunk files the Knowledge Base data source indexes; opt in
+    # only after migrating the data source
+    "CHUNK_LAYOUT": os.getenv("CHUNK_LAYOUT", "both"),
+    "BULK_WRITE_WORKERS": os.getenv("BULK_WRITE_WORKERS", "16"),
+    # Large PDFs are parsed as concurrent ranges of this many pages ("0" parses whole documents)
+    "PARSE_PAGES_PER_RANGE": os.getenv("PARSE_PAGES_PER_RANGE", "50"),
+    "PARSE_CONCURRENCY": os.getenv("PARSE_CONCURRENCY", "4"),
+    # Documents of one S3 event ingested at the same time
+    "INGESTION_RECORD_CONCURRENCY": os.getenv("INGESTION_RECORD_CONCURRENCY", "4"),
+    # ADE calls per Lambda instance; the queue's maximum concurrency bounds the instances
+    "ADE_CALLS_PER_SECOND": os.getenv("ADE_CALLS_PER_SECOND", "2"),
+    "ADE_MAX_IN_FLIGHT": os.getenv("ADE_MAX_IN_FLIGHT", "4"),
+    # Opt-in: read plain running-text pages from the PDF text layer instead of ADE
+    "NATIVE_TEXT_FAST_PATH": os.getenv("NATIVE_TEXT_FAST_PATH", "false")
 }
 
 s3_client = session.client("s3")
+sqs_client = session.client("sqs")
 iam = session.client("iam")
 lambda_client = session.client("lambda")
 
 
 def create_deploy_lambda():
-    source_files = ["ade_s3_handler.py"]
-    requirements = ["pydantic", "landingai-ade", "typing-extensions"]
+    source_files = [
+        "ade_s3_handler.py",
+        "chunk_prerender.py",
+        "bulk_s3_writer.py",
+        "page_range_parser.py",
+        "native_text.py",
+        "ingestion_manifest.py",
+        "ingestion_state.py",
+        "rate_limiter.py",
+        "queue_handler.py",
+        "../rag/visual_grounding_helper.py",
+        "../rag/grounding_manifest.py",
+        "../rag/chunk_index.py",
+        "../rag/chunk_shards.py",
+        "../rag/image_encoding.py",
+        "../rag/pdf_cache.py",
+        "../rag/render_cache.py"
+    ]
+    requirements = ["pydantic", "landingai-ade", "typing-extensions", "pymupdf", "pillow"]
 
     zip_path = create_deployment_package(
         source_files=source_files,
@@ -36,7 +72,33 @@ def create_deploy_lambda():
     role_arn = create_or_update_lambda_role(
     iam_client=iam,
     role_name="lambda-ade-exec-role",
-    description="Execution role for LandingAI ADE Lambda"
+    description="Execution role for LandingAI ADE Lambda",
+    # Long documents continue in a new invocation of the same function
+    inline_policies={
+        "ade-self-invoke": {
+            "Version": "2012-10-17",
+            "Statement": [{
+                "Effect": "Allow",
+                "Action": "lambda:InvokeFunction",
+                "Resource": "arn:aws:lambda:*:*:function:ade-s3-handler*"
+            }]
+        },
+        # Queue-driven ingestion (see setup_queue)
+        "ade-ingestion-queue": {
+            "Version": "2012-10-17",
+            "Statement": [{
+                "Effect": "Allow",
+                "Action": [
+                    "sqs:ReceiveMessage",
+                    "sqs:SendMessage",
+                    "sqs:DeleteMessage",
+                    "sqs:GetQueueAttributes",
+                    "sqs:ChangeMessageVisibility"
+                ],
+                "Resource": "arn:aws:sqs:*:*:ade-ingestion-queue"
+            }]
+        }
+    }
     )
 
     deploy_lambda_function(
@@ -63,3 +125,38 @@ def setup_trigger():
 )
 
 
+def create_deploy_queue_lambda():
+    """Deploy the SQS entry point from the package built by create_deploy_lambda"""
+    role_arn = create_or_update_lambda_role(
+    iam_client=iam,
+    role_name="lambda-ade-exec-role",
+    description="Execution role for LandingAI ADE Lambda"
+    )
+
+    deploy_lambda_function(
+    lambda_client=lambda_client,
+    function_name="ade-queue-handler",
+    zip_file="../ade_lambda.zip",
+    role_arn=role_arn,
+    handler="queue_handler.queue_handler",
+    env_vars=env_vars,
+    runtime="python3.10",
+    timeout=900,
+    memory_size=1024
+    )
+
+
+def setup_queue():
+    """Alternative to setup_trigger: S3 uploads → SQS → ade-queue-handler"""
+    setup_sqs_event_source(
+    sqs_client=sqs_client,
+    s3_client=s3_client,
+    lambda_client=lambda_client,
+    bucket=os.getenv("S3_BUCKET"),
+    prefix="input/",
+    function_name="ade-queue-handler",
+    queue_name="ade-ingestion-queue",
+    suffix=".pdf",
+    batch_size=int(os.getenv("INGESTION_QUEUE_BATCH_SIZE", "4")),
+    max_concurrency=int(os.getenv("INGESTION_QUEUE_MAX_CONCURRENCY", "2"))
+)
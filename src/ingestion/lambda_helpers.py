@@ -16,11 +16,15 @@ from typing import Dict, List, Optional, Any
 def create_or_update_lambda_role(
     iam_client, 
     role_name: str, 
-    description: str = "Lambda execution role"
+    description: str = "Lambda execution role",
+    inline_policies: dict = None
 ) -> str:
     """
     Create or reuse IAM role for Lambda execution
     
+    Args:
+        inline_policies: Optional {policy_name: policy_document} added to the role
+    
     Returns:
         role_arn: ARN of the created/existing role
     """
@@ -62,6 +66,14 @@ def create_or_update_lambda_role(
         role_arn = role["Role"]["Arn"]
         print(f"ℹ️ Using existing role: {role_name}")
     
+    for policy_name, policy_document in (inline_policies or {}).items():
+        iam_client.put_role_policy(
+            RoleName=role_name,
+            PolicyName=policy_name,
+            PolicyDocument=json.dumps(policy_document)
+        )
+        print(f"✅ Attached inline policy: {policy_name}")
+    
     return role_arn
 
 
@@ -271,6 +283,106 @@ def setup_s3_trigger(
     print(f"✅ S3 trigger set for s3://{bucket}/{prefix} → {function_name}")
 
 
+def setup_sqs_event_source(
+    sqs_client,
+    s3_client,
+    lambda_client,
+    bucket: str,
+    prefix: str,
+    function_name: str,
+    queue_name: str,
+    suffix: Optional[str] = None,
+    batch_size: int = 5,
+    max_concurrency: int = 2,
+    visibility_timeout: int = 5400,
+    max_receives: int = 5
+) -> str:
+    """
+    Route S3 uploads through an SQS queue to a Lambda function
+    
+    Creates the queue and its dead-letter queue, lets S3 publish to it and maps
+    it to the function with partial batch failure reporting.
+    
+    Args:
+        batch_size: Messages per invocation
+        max_concurrency: Concurrent invocations the queue may drive (minimum 2)
+        visibility_timeout: Seconds a received message stays hidden; keep it
+            above the function timeout (AWS recommends six times)
+        max_receives: Deliveries before a message moves to the dead-letter queue
+    
+    Returns:
+        queue_url: URL of the ingestion queue
+    """
+    print(f"⚙️ Setting up SQS ingestion: s3://{bucket}/{prefix} → {queue_name} → {function_name}")
+    
+    dlq_url = sqs_client.create_queue(QueueName=f"{queue_name}-dlq")["QueueUrl"]
+    dlq_arn = sqs_client.get_queue_attributes(
+        QueueUrl=dlq_url, AttributeNames=["QueueArn"]
+    )["Attributes"]["QueueArn"]
+    
+    queue_url = sqs_client.create_queue(QueueName=queue_name)["QueueUrl"]
+    queue_arn = sqs_client.get_queue_attributes(
+        QueueUrl=queue_url, AttributeNames=["QueueArn"]
+    )["Attributes"]["QueueArn"]
+    
+    # Allow S3 notifications from the bucket into the queue
+    queue_policy = {
+        "Version": "2012-10-17",
+        "Statement": [{
+            "Effect": "Allow",
+            "Principal": {"Service": "s3.amazonaws.com"},
+            "Action": "sqs:SendMessage",
+            "Resource": queue_arn,
+            "Condition": {"ArnLike": {"aws:SourceArn": f"arn:aws:s3:::{bucket}"}}
+        }]
+    }
+    sqs_client.set_queue_attributes(
+        QueueUrl=queue_url,
+        Attributes={
+            "Policy": json.dumps(queue_policy),
+            "VisibilityTimeout": str(visibility_timeout),
+            "RedrivePolicy": json.dumps({"deadLetterTargetArn": dlq_arn, "maxReceiveCount": str(max_receives)})
+        }
+    )
+    print(f"   ✅ Queue ready: {queue_url}")
+    
+    # Configure filter rules
+    filter_rules = [{"Name": "prefix", "Value": prefix}]
+    if suffix:
+        filter_rules.append({"Name": "suffix", "Value": suffix})
+    
+    # Note: This replaces ALL existing notifications, including a direct Lambda trigger
+    s3_client.put_bucket_notification_configuration(
+        Bucket=bucket,
+        NotificationConfiguration={
+            "QueueConfigurations": [
+                {
+                    "QueueArn": queue_arn,
+                    "Events": ["s3:ObjectCreated:*"],
+                    "Filter": {"Key": {"FilterRules": filter_rules}}
+                }
+            ]
+        }
+    )
+    print(f"   ✅ S3 notifications → {queue_name}")
+    
+    mapping = {
+        "BatchSize": batch_size,
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+        "ScalingConfig": {"MaximumConcurrency": max(2, max_concurrency)}
+    }
+    existing = lambda_client.list_event_source_mappings(
+        EventSourceArn=queue_arn, FunctionName=function_name
+    ).get("EventSourceMappings", [])
+    if existing:
+        lambda_client.update_event_source_mapping(UUID=existing[0]["UUID"], FunctionName=function_name, **mapping)
+    else:
+        lambda_client.create_event_source_mapping(EventSourceArn=queue_arn, FunctionName=function_name, **mapping)
+    
+    print(f"✅ SQS ingestion set for s3://{bucket}/{prefix} → {function_name} (batch {batch_size}, concurrency {max(2, max_concurrency)})")
+    return queue_url
+
+
 def invoke_lambda_sync(
     lambda_client,
     function_name: str,
@@ -0,0 +1,124 @@
+"""
+Local Queue
+In-memory stand-in for the SQS ingestion queue, to run the queue pipeline without AWS
+"""
+
+import json
+import uuid
+from typing import Callable, Dict, List, Optional
+
+
+class InMemoryQueue:
+    """
+    Minimal SQS queue with Lambda event source semantics.
+
+    Received messages stay invisible for the visibility timeout; the handler's
+    batchItemFailures decide which are deleted. Messages received more than
+    max_receives times move to dead_letters. Time is simulated: advance()
+    moves the queue clock, and run() advances it when only invisible
+    messages are left.
+
+    Also implements SQS-style send_message and change_message_visibility, so
+    it can replace the SQS client.
+    """
+
+    def __init__(self, name: str = "ingestion-queue", visibility_timeout: int = 900, max_receives: int = 3):
+        self.name = name
+        self.arn = f"arn:aws:sqs:us-east-1:000000000000:{name}"
+        self.visibility_timeout = visibility_timeout
+        self.max_receives = max_receives
+        self.now = 0.0
+        self.dead_letters: List[Dict] = []
+        self._messages: Dict[str, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+    def send_message(self, body=None, delay_seconds: int = 0, QueueUrl: str = None,
+                     MessageBody: str = None, DelaySeconds: int = None):
+        """
+        Queue a message body (dict bodies are sent as JSON).
+
+        Called like the SQS client (QueueUrl, MessageBody, DelaySeconds) it
+        returns the SQS response dict instead of the message ID.
+        """
+        message_id = str(uuid.uuid4())
+        if MessageBody is not None:
+            body, delay_seconds = MessageBody, DelaySeconds or 0
+        self._messages[message_id] = {
+            "body": body if isinstance(body, str) else json.dumps(body),
+            "visible_at": self.now + delay_seconds,
+            "receive_count": 0,
+            "receipt_handle": None
+        }
+        return {"MessageId": message_id} if MessageBody is not None else message_id
+
+    def send_s3_event(self, bucket: str, key: str, etag: str = "") -> str:
+        """Queue the notification S3 sends for an uploaded object"""
+        return self.send_message({"Records": [{
+            "eventSource": "aws:s3",
+            "eventName": "ObjectCreated:Put",
+            "s3": {"bucket": {"name": bucket}, "object": {"key": key, "eTag": etag}}
+        }]})
+
+    def receive_batch(self, batch_size: int = 10) -> Dict:
+        """Receive up to batch_size visible messages as a Lambda SQS event"""
+        batch = []
+        for message_id, message in list(self._messages.items()):
+            if len(batch) >= batch_size:
+                break
+            if message["visible_at"] > self.now:
+                continue
+            if message["receive_count"] >= self.max_receives:
+                self.dead_letters.append({"messageId": message_id, "body": message["body"]})
+                del self._messages[message_id]
+                continue
+            message["receive_count"] += 1
+            message["receipt_handle"] = str(uuid.uuid4())
+            message["visible_at"] = self.now + self.visibility_timeout
+            batch.append({
+                "messageId": message_id,
+                "receiptHandle": message["receipt_handle"],
+                "body": message["body"],
+                "attributes": {"ApproximateReceiveCount": str(message["receive_count"])},
+                "eventSource": "aws:sqs",
+                "eventSourceARN": self.arn
+            })
+        return {"Records": batch}
+
+    def change_message_visibility(self, QueueUrl: str, ReceiptHandle: str, VisibilityTimeout: int):
+        for message in self._messages.values():
+            if message["receipt_handle"] == ReceiptHandle:
+                message["visible_at"] = self.now + VisibilityTimeout
+                return
+        raise ValueError("Invalid receipt handle")
+
+    def complete_batch(self, event: Dict, response: Optional[Dict]):
+        """Delete the messages of a batch that the handler did not report as failed"""
+        failed = {item["itemIdentifier"] for item in (response or {}).get("batchItemFailures", [])}
+        for message in event["Records"]:
+            if message["messageId"] not in failed:
+                self._messages.pop(message["messageId"], None)
+
+    def run(self, handler: Callable, context=None, batch_size: int = 10, max_batches: int = 100) -> int:
+        """
+        Deliver batches to a handler until the queue is empty.
+
+        Returns:
+            Number of batches delivered
+        """
+        batches = 0
+        while self._messages and batches < max_batches:
+            event = self.receive_batch(batch_size)
+            if not event["Records"]:
+                pending = [m["visible_at"] for m in self._messages.values()]
+                if not pending:
+                    break
+                self.now = max(self.now, min(pending))
+                continue
+            batches += 1
+            self.complete_batch(event, handler(event, context))
+        return batches
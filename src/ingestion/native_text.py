@@ -0,0 +1,157 @@
+"""
+Native Text Fast Path
+Emits chunks of plain running-text pages from the PDF text layer and sends only complex pages to ADE
+"""
+
+import os
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import fitz  # PyMuPDF
+
+try:
+    from page_range_parser import PARSE_CONCURRENCY, merge_parse_results, parse_ranges
+    from render_cache import MUPDF_LOCK
+except ImportError:
+    from src.ingestion.page_range_parser import PARSE_CONCURRENCY, merge_parse_results, parse_ranges
+    from src.rag.render_cache import MUPDF_LOCK
+
+# Opt-in: a page misclassified as simple loses ADE's table and figure parsing
+NATIVE_TEXT_FAST_PATH = os.environ.get("NATIVE_TEXT_FAST_PATH", "false").lower() == "true"
+# Pages with less text are covers, scans or figures
+NATIVE_MIN_CHARS = int(os.environ.get("NATIVE_MIN_CHARS", "200"))
+# Vector drawings beyond this count mean table rules or charts
+NATIVE_MAX_DRAWINGS = int(os.environ.get("NATIVE_MAX_DRAWINGS", "8"))
+# Share of the page an embedded image may cover (logos are fine, figures are not)
+NATIVE_MAX_IMAGE_AREA = 0.02
+# Share of numeric tokens above which text is treated as a table without rules
+NATIVE_MAX_NUMERIC_SHARE = 0.25
+# Blocks within this share of the page height from the top or bottom edge are headers and footers
+MARGIN_SHARE = 0.06
+
+PAGE_SIMPLE = "simple"
+PAGE_COMPLEX = "complex"
+
+
+def _is_numeric(token: str) -> bool:
+    stripped = token.strip("$%()€£,.-+")
+    return bool(stripped) and stripped.replace(",", "").replace(".", "").isdigit()
+
+
+def classify_page(page) -> str:
+    """
+    Classify a PDF page as simple running text or complex.
+
+    Complex pages have little or broken text (scans), figures, vector
+    drawings (table rules, charts) or mostly numeric text (tables).
+    """
+    text = page.get_text("text")
+    if len(text.strip()) < NATIVE_MIN_CHARS or "\ufffd" in text:
+        return PAGE_COMPLEX
+
+    page_area = abs(page.rect) or 1
+    for image in page.get_image_info():
+        if abs(fitz.Rect(image["bbox"]) & page.rect) / page_area > NATIVE_MAX_IMAGE_AREA:
+            return PAGE_COMPLEX
+
+    if len(page.get_drawings()) > NATIVE_MAX_DRAWINGS:
+        return PAGE_COMPLEX
+
+    tokens = text.split()
+    if sum(1 for token in tokens if _is_numeric(token)) / len(tokens) > NATIVE_MAX_NUMERIC_SHARE:
+        return PAGE_COMPLEX
+    return PAGE_SIMPLE
+
+
+def native_page_result(page) -> Dict:
+    """
+    Chunks of a simple page in the serialized ADE format, one per text block.
+
+    Pages are 0 (local to the page) and boxes are normalized to the page size,
+    like ADE output of a single-page document.
+    """
+    width, height = page.rect.width or 1, page.rect.height or 1
+    chunks = []
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", sort=True):
+        text = " ".join(text.split())
+        if block_type != 0 or not text:
+            continue
+        top, bottom = y0 / height, y1 / height
+        in_margin = bottom < MARGIN_SHARE or top > 1 - MARGIN_SHARE
+        chunk_id = str(uuid.uuid4())
+        chunks.append({
+            'id': chunk_id,
+            'type': 'marginalia' if in_margin else 'text',
+            'markdown': f"<a id='{chunk_id}'></a>\n\n{text}",
+            'grounding': {
+                'page': 0,
+                'box': {
+                    'left': round(max(0.0, x0 / width), 6),
+                    'top': round(max(0.0, top), 6),
+                    'right': round(min(1.0, x1 / width), 6),
+                    'bottom': round(min(1.0, bottom), 6)
+                }
+            }
+        })
+    return {
+        'markdown': "\n\n".join(chunk['markdown'] for chunk in chunks),
+        'chunks': chunks,
+        'splits': [],
+        'metadata': {'page_count': 1, 'credit_usage': 0}
+    }
+
+
+def _complex_runs(kinds: List[str], pages_per_range: int) -> List[Tuple[int, int]]:
+    """Contiguous runs of complex pages, at most pages_per_range long"""
+    runs = []
+    start = None
+    for page_num, kind in enumerate(kinds + [PAGE_SIMPLE]):
+        if kind == PAGE_COMPLEX and start is None:
+            start = page_num
+        elif kind != PAGE_COMPLEX and start is not None:
+            for first in range(start, page_num, pages_per_range):
+                runs.append((first, min(first + pages_per_range, page_num) - 1))
+            start = None
+    return runs
+
+
+def parse_with_native_text(
+    parse: Callable,
+    pdf_path,
+    pages_per_range: int,
+    concurrency: int = PARSE_CONCURRENCY,
+    out_dir=None
+) -> Dict:
+    """
+    Parse a PDF with simple pages read from the text layer and the rest through ADE.
+
+    Args:
+        parse: Function taking a document path and returning an ADE parse response
+        pdf_path: Local path of the PDF
+        pages_per_range: Maximum pages per ADE call
+        concurrency: Maximum number of ADE calls in flight
+
+    Returns:
+        Merged serialized result; metadata.native_pages counts the pages that skipped ADE
+    """
+    pdf_path = Path(pdf_path)
+    parts = []
+    with MUPDF_LOCK, fitz.open(str(pdf_path)) as doc:
+        kinds = [classify_page(page) for page in doc]
+        for page_num, kind in enumerate(kinds):
+            if kind == PAGE_SIMPLE:
+                parts.append((page_num, native_page_result(doc[page_num])))
+
+    native_pages = len(parts)
+    print(f"{pdf_path.name}: {native_pages}/{len(kinds)} pages read from the text layer, "
+          f"{len(kinds) - native_pages} sent to ADE")
+
+    runs = _complex_runs(kinds, max(1, pages_per_range))
+    if runs:
+        parts.extend(parse_ranges(parse, pdf_path, runs, concurrency, out_dir))
+
+    merged = merge_parse_results(parts, filename=pdf_path.name)
+    merged['metadata']['page_count'] = len(kinds)
+    merged['metadata']['native_pages'] = native_pages
+    return merged
@@ -0,0 +1,223 @@
+"""
+Page Range Parser
+Parses large PDFs through ADE as concurrent page ranges and merges the results
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import fitz  # PyMuPDF
+
+try:
+    from render_cache import MUPDF_LOCK
+except ImportError:
+    from src.rag.render_cache import MUPDF_LOCK
+
+# Pages per ADE call; documents with more pages are split. 0 disables the fan-out
+PARSE_PAGES_PER_RANGE = int(os.environ.get("PARSE_PAGES_PER_RANGE", "50"))
+# Maximum number of page ranges parsed at the same time
+PARSE_CONCURRENCY = int(os.environ.get("PARSE_CONCURRENCY", "4"))
+
+
+def _serialize_chunk(chunk) -> Dict:
+    # Parse chunk data - handle both object and dict formats
+    if not hasattr(chunk, '__dict__'):
+        return chunk
+    chunk_dict = {
+        'id': getattr(chunk, 'id', ''),
+        'type': getattr(chunk, 'type', ''),
+        'markdown': getattr(chunk, 'markdown', ''),
+    }
+    if hasattr(chunk, 'grounding'):
+        grounding = chunk.grounding
+        if hasattr(grounding, 'page') and hasattr(grounding, 'box'):
+            box = grounding.box
+            chunk_dict['grounding'] = {
+                'page': grounding.page,
+                'box': {
+                    'left': getattr(box, 'left', 0),
+                    'top': getattr(box, 'top', 0),
+                    'right': getattr(box, 'right', 0),
+                    'bottom': getattr(box, 'bottom', 0)
+                }
+            }
+    return chunk_dict
+
+
+def _serialize_split(split) -> Dict:
+    if not hasattr(split, '__dict__'):
+        return split
+    return {
+        'chunks': getattr(split, 'chunks', []),
+        'pages': getattr(split, 'pages', []),
+        'markdown': getattr(split, 'markdown', ''),
+        'class_': getattr(split, 'class_', '')
+    }
+
+
+def _serialize_metadata(metadata) -> Dict:
+    if not hasattr(metadata, '__dict__'):
+        return metadata
+    return {
+        'filename': getattr(metadata, 'filename', ''),
+        'page_count': getattr(metadata, 'page_count', 0),
+        'version': getattr(metadata, 'version', ''),
+        'job_id': getattr(metadata, 'job_id', ''),
+        'org_id': getattr(metadata, 'org_id', ''),
+        'credit_usage': getattr(metadata, 'credit_usage', 0),
+        'duration_ms': getattr(metadata, 'duration_ms', 0)
+    }
+
+
+def serialize_parse_response(response) -> Dict:
+    """
+    Convert an ADE parse response into plain data.
+
+    Returns:
+        Dict with markdown, chunks, splits and metadata
+    """
+    return {
+        'markdown': getattr(response, 'markdown', '') or '',
+        'chunks': [_serialize_chunk(c) for c in getattr(response, 'chunks', None) or []],
+        'splits': [_serialize_split(s) for s in getattr(response, 'splits', None) or []],
+        'metadata': _serialize_metadata(getattr(response, 'metadata', None) or {})
+    }
+
+
+def count_pages(pdf_path) -> int:
+    """Number of pages of a PDF, or 0 if it cannot be opened as one"""
+    try:
+        with MUPDF_LOCK, fitz.open(str(pdf_path)) as doc:
+            return doc.page_count if doc.is_pdf else 0
+    except Exception as e:
+        print(f"Could not count pages of {pdf_path}: {e}")
+        return 0
+
+
+def page_ranges(page_count: int, pages_per_range: int) -> List[Tuple[int, int]]:
+    """Split [0, page_count) into (first_page, last_page) ranges, 0-indexed and inclusive"""
+    return [
+        (start, min(start + pages_per_range, page_count) - 1)
+        for start in range(0, page_count, pages_per_range)
+    ]
+
+
+def split_pdf(pdf_path, ranges: List[Tuple[int, int]], out_dir) -> List[Path]:
+    """Write each page range of a PDF to its own file"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = Path(pdf_path).stem
+    paths = []
+    with MUPDF_LOCK, fitz.open(str(pdf_path)) as doc:
+        for first, last in ranges:
+            part = fitz.open()
+            part.insert_pdf(doc, from_page=first, to_page=last)
+            path = out_dir / f"{stem}_p{first + 1:05d}-{last + 1:05d}.pdf"
+            part.save(str(path), garbage=3, deflate=True)
+            part.close()
+            paths.append(path)
+    return paths
+
+
+def _rebase(part: Dict, offset: int) -> Dict:
+    """Shift the page numbers of a partial result by the first page of its range"""
+    chunks = []
+    for chunk in part['chunks']:
+        grounding = chunk.get('grounding')
+        if grounding and 'page' in grounding:
+            chunk = {**chunk, 'grounding': {**grounding, 'page': grounding['page'] + offset}}
+        chunks.append(chunk)
+    splits = [
+        {**split, 'pages': [page + offset for page in split.get('pages') or []]}
+        if isinstance(split, dict) else split
+        for split in part['splits']
+    ]
+    return {**part, 'chunks': chunks, 'splits': splits}
+
+
+def merge_parse_results(parts: List[Tuple[int, Dict]], filename: str = '') -> Dict:
+    """
+    Merge partial parse results into one grounding document.
+
+    Args:
+        parts: (first_page, serialized result) per page range, in any order
+        filename: Name of the original document for the merged metadata
+    """
+    parts = [_rebase(part, first) for first, part in sorted(parts, key=lambda p: p[0])]
+    metadata = [part['metadata'] for part in parts if isinstance(part['metadata'], dict)]
+    return {
+        'markdown': "\n\n".join(part['markdown'] for part in parts if part['markdown']),
+        'chunks': [chunk for part in parts for chunk in part['chunks']],
+        'splits': [split for part in parts for split in part['splits']],
+        'metadata': {
+            'filename': filename or (metadata[0].get('filename', '') if metadata else ''),
+            'page_count': sum(m.get('page_count', 0) or 0 for m in metadata),
+            'version': metadata[0].get('version', '') if metadata else '',
+            'job_id': ",".join(m.get('job_id', '') for m in metadata if m.get('job_id')),
+            'org_id': metadata[0].get('org_id', '') if metadata else '',
+            'credit_usage': sum(m.get('credit_usage', 0) or 0 for m in metadata),
+            'duration_ms': sum(m.get('duration_ms', 0) or 0 for m in metadata),
+            'page_ranges': len(parts)
+        }
+    }
+
+
+def parse_ranges(
+    parse: Callable,
+    pdf_path,
+    ranges: List[Tuple[int, int]],
+    concurrency: int = PARSE_CONCURRENCY,
+    out_dir=None
+) -> List[Tuple[int, Dict]]:
+    """
+    Parse page ranges of a PDF concurrently.
+
+    Returns:
+        (first_page, serialized result with range-local pages) per range
+    """
+    pdf_path = Path(pdf_path)
+    out_dir = Path(out_dir) if out_dir else Path("/tmp") / "page_ranges" / pdf_path.stem
+    paths = split_pdf(pdf_path, ranges, out_dir)
+    print(f"Parsing {pdf_path.name} as {len(ranges)} page ranges ({concurrency} at a time)")
+
+    def parse_range(item):
+        (first, last), path = item
+        start = time.time()
+        result = serialize_parse_response(parse(path))
+        print(f"Parsed pages {first + 1}-{last + 1} of {pdf_path.name} in {time.time() - start:.1f}s")
+        return first, result
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            return list(executor.map(parse_range, zip(ranges, paths)))
+    finally:
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+
+def parse_page_ranges(
+    parse: Callable,
+    pdf_path,
+    pages_per_range: int = PARSE_PAGES_PER_RANGE,
+    concurrency: int = PARSE_CONCURRENCY,
+    out_dir=None
+) -> Dict:
+    """
+    Parse a PDF as concurrent page ranges.
+
+    Args:
+        parse: Function taking a document path and returning an ADE parse response
+        pdf_path: Local path of the PDF
+        pages_per_range: Pages per parse call
+        concurrency: Maximum number of parse calls in flight
+        out_dir: Where the range PDFs are written; defaults to /tmp
+
+    Returns:
+        Merged serialized result with page numbers of the whole document
+    """
+    ranges = page_ranges(count_pages(pdf_path), pages_per_range)
+    parts = parse_ranges(parse, pdf_path, ranges, concurrency, out_dir)
+    return merge_parse_results(parts, filename=Path(pdf_path).name)
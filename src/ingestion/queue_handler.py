@@ -0,0 +1,158 @@
+"""
+Queue Handler
+SQS entry point for ingestion with partial batch failure reporting
+"""
+
+import os
+import json
+from collections import defaultdict
+from typing import Dict, List
+
+import boto3
+
+try:
+    from ade_s3_handler import process_records, select_input_records
+    from ingestion_state import CONTINUATION_KEY, next_continuation, time_running_low
+except ImportError:
+    from src.ingestion.ade_s3_handler import process_records, select_input_records
+    from src.ingestion.ingestion_state import CONTINUATION_KEY, next_continuation, time_running_low
+
+# Documents that were checkpointed, or not started in time, continue in a fresh
+# message delivered after this delay, instead of waiting out the queue's full
+# visibility timeout
+QUEUE_RETRY_DELAY_SECONDS = int(os.environ.get("QUEUE_RETRY_DELAY_SECONDS", "5"))
+
+# Created on first use, so tests can substitute an in-memory queue
+sqs = None
+
+
+def get_sqs():
+    global sqs
+    if sqs is None:
+        sqs = boto3.client("sqs")
+    return sqs
+
+
+def queue_url_from_arn(queue_arn: str) -> str:
+    """Queue URL of an SQS queue ARN (arn:aws:sqs:<region>:<account>:<name>)"""
+    _, _, _, region, account, name = queue_arn.split(":", 5)
+    return f"https://sqs.{region}.amazonaws.com/{account}/{name}"
+
+
+def message_records(message: Dict) -> List[Dict]:
+    """
+    S3 event records carried by an SQS message.
+
+    The body is an S3 event notification, or a single S3 record. The test
+    event S3 sends when a notification is configured carries no records.
+    """
+    body = json.loads(message["body"])
+    if body.get("Event") == "s3:TestEvent":
+        return []
+    if "Records" in body:
+        return [record for record in body["Records"] if "s3" in record]
+    if "s3" in body:
+        return [body]
+    raise ValueError("Message is not an S3 event")
+
+
+def requeue_message(message: Dict, body: str, delay_seconds: int = QUEUE_RETRY_DELAY_SECONDS) -> bool:
+    """
+    Send a fresh message to the queue a message came from.
+
+    A fresh message starts with a receive count of zero, so a document that
+    continues over many invocations never reaches the dead-letter queue.
+
+    Returns:
+        True if the message was sent
+    """
+    try:
+        get_sqs().send_message(
+            QueueUrl=queue_url_from_arn(message["eventSourceARN"]),
+            MessageBody=body,
+            DelaySeconds=delay_seconds
+        )
+        return True
+    except Exception as e:
+        print(f"Could not requeue message {message['messageId']}: {e}")
+        return False
+
+
+def release_message(message: Dict, delay_seconds: int = QUEUE_RETRY_DELAY_SECONDS):
+    """Make a message visible again after a short delay"""
+    try:
+        get_sqs().change_message_visibility(
+            QueueUrl=queue_url_from_arn(message["eventSourceARN"]),
+            ReceiptHandle=message["receiptHandle"],
+            VisibilityTimeout=delay_seconds
+        )
+    except Exception as e:
+        print(f"Could not release message {message['messageId']}: {e}")
+
+
+def queue_handler(event, context):
+    """
+    AWS Lambda handler for an SQS queue of S3 upload events.
+
+    Documents of the batch are ingested concurrently through the same pipeline
+    as ade_handler. Messages whose document failed are reported in
+    batchItemFailures and retried after the visibility timeout, until the queue
+    dead-letters them. Documents checkpointed before the Lambda timeout, or not
+    started in time, continue in a fresh message and their message is deleted,
+    so continuations never count as receives; they are only reported as
+    failures when the fresh message cannot be sent.
+    """
+    messages = event.get("Records", [])
+    records, owners = [], []
+    failed, retry, unstarted = set(), set(), set()
+    continued = defaultdict(list)
+
+    for message in messages:
+        message_id = message["messageId"]
+        # Messages left when time is running low are sent again untouched
+        if time_running_low(context):
+            unstarted.add(message_id)
+            continue
+        try:
+            selected = select_input_records(message_records(message))
+        except ValueError as e:
+            # Redelivery cannot fix a malformed message; drop it
+            print(f"Dropping message {message_id}: {e}")
+            continue
+        records.extend(selected)
+        owners.extend([message_id] * len(selected))
+
+    for message_id, record, (result, again) in zip(owners, records, process_records(records, context)):
+        if again:
+            continuation, reason = next_continuation(record, result)
+            if continuation is None:
+                print(f"Giving up on {result['source']}: {reason}")
+                result.update(status="failed", error=reason)
+                failed.add(message_id)
+            else:
+                continued[message_id].append({**record, CONTINUATION_KEY: continuation})
+        elif result is not None and result.get("status") == "failed":
+            failed.add(message_id)
+
+    for message in messages:
+        message_id = message["messageId"]
+        # A failed message is redelivered whole, continuing documents included
+        if message_id in failed:
+            continue
+        if message_id in unstarted:
+            body = message["body"]
+        elif message_id in continued:
+            body = json.dumps({"Records": continued[message_id]})
+        else:
+            continue
+        if not requeue_message(message, body):
+            retry.add(message_id)
+            release_message(message)
+
+    failures = [
+        {"itemIdentifier": message["messageId"]}
+        for message in messages if message["messageId"] in failed | retry
+    ]
+    print(f"Processed {len(messages)} messages: {len(messages) - len(failures)} done or continued, "
+          f"{len(failed)} failed, {len(retry)} released")
+    return {"batchItemFailures": failures}
@@ -0,0 +1,69 @@
+"""
+Rate Limiter
+Token-bucket limiter that caps the rate and concurrency of ADE parse calls
+"""
+
+import os
+import time
+import threading
+
+# Sustained ADE calls per second, burst size and calls in flight per Lambda instance
+ADE_CALLS_PER_SECOND = float(os.environ.get("ADE_CALLS_PER_SECOND", "2"))
+ADE_BURST = int(os.environ.get("ADE_BURST", "4"))
+ADE_MAX_IN_FLIGHT = int(os.environ.get("ADE_MAX_IN_FLIGHT", "4"))
+
+
+class TokenBucket:
+    """
+    Token bucket shared by all threads of the process.
+
+    acquire() takes one token, waiting until the bucket has refilled if needed;
+    at most max_in_flight holders run between acquire() and release() at once.
+    Usable as a context manager around each call.
+    """
+
+    def __init__(self, rate: float, capacity: int, max_in_flight: int = 0, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.waited = 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        if self._in_flight is not None:
+            self._in_flight.acquire()
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            self._sleep(wait)
+
+    def release(self):
+        if self._in_flight is not None:
+            self._in_flight.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+ade_limiter = TokenBucket(ADE_CALLS_PER_SECOND, ADE_BURST, ADE_MAX_IN_FLIGHT)
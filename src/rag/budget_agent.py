@@ -1,24 +1,41 @@
 import os
 from strands import Agent
+from strands.models import BedrockModel
 from src.rag.search_tool import search_knowledge_base  
 
+# Created on first use; the model client is stateless and shared by all agents of the process
+shared_model = None
+
+
+def get_shared_model():
+    """Bedrock model client shared by the agents of a warm container"""
+    global shared_model
+    if shared_model is None:
+        model_id = os.getenv("BEDROCK_MODEL_ID")
+        shared_model = BedrockModel(model_id=model_id) if model_id else BedrockModel()
+    return shared_model
+
+
 class BudgetAgent:
     """Budget analysis agent with memory and visual grounding"""
     
-    def __init__(self, session_manager=None):
+    def __init__(self, session_manager=None, model=None):
         """
         Initialize budget agent
         
         Args:
             session_manager: Optional AgentCore memory session manager
+            model: Optional model client to share; defaults to BEDROCK_MODEL_ID
         """
         self.session_manager = session_manager
         self.agent = Agent(
-            model=os.getenv("BEDROCK_MODEL_ID"),
+            model=model or os.getenv("BEDROCK_MODEL_ID"),
             name="Canada Annual Budget Document Analyzer",
             system_prompt=self._get_system_prompt(),
             session_manager=session_manager,
-            tools=[search_knowledge_base]
+            tools=[search_knowledge_base],
+            # Callers print or stream the answer themselves
+            callback_handler=None
         )
     
     def _get_system_prompt(self):
@@ -60,4 +77,20 @@ class BudgetAgent:
         Returns:
             Agent's response
         """
-        return self.agent(question)
\ No newline at end of file
+        return self.agent(question)
+    
+    def reset(self):
+        """Forget the conversation, to answer an unrelated question with the same agent"""
+        self.agent.messages.clear()
+    
+    def stream_async(self, question: str):
+        """
+        Stream agent events for a question
+        
+        Args:
+            question: User's question
+            
+        Returns:
+            Async iterator of Strands stream events; the last one carries the result
+        """
+        return self.agent.stream_async(question)
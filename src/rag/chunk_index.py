@@ -0,0 +1,255 @@
+"""
+Chunk Index
+Compact in-memory index of chunk metadata built from packed per-document sidecars
+"""
+
+import os
+import sys
+import json
+import base64
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# Constants
+# Outside output/, which the Knowledge Base data source indexes
+CHUNK_INDEX_PREFIX = os.getenv("CHUNK_INDEX_PREFIX", "internal/chunk_index/")
+CHUNK_INDEX_REFRESH_SECONDS = float(os.getenv("CHUNK_INDEX_REFRESH_SECONDS", "300"))
+CHUNK_INDEX_FORMAT = 1
+CHUNK_INDEX_LOAD_WORKERS = 8
+
+
+def chunk_index_key(source_document: str) -> str:
+    """S3 key of the packed chunk index sidecar of a document"""
+    return f"{CHUNK_INDEX_PREFIX}{source_document}.json"
+
+
+def _pack(values: array) -> str:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def _unpack(typecode: str, data: str) -> array:
+    values = array(typecode)
+    values.frombytes(base64.b64decode(data))
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def pack_chunk_index(source_document: str, chunks: List[Dict]) -> bytes:
+    """
+    Pack the metadata of a document's chunks into a sidecar file.
+
+    Chunk types are stored once and referenced by index; pages and bboxes are
+    little-endian int32 and float32 arrays.
+
+    Args:
+        source_document: Document name without extension
+        chunks: Chunk records with chunk_id, chunk_type, page and bbox
+    """
+    types = []
+    type_ids = array("B")
+    pages = array("i")
+    bboxes = array("f")
+    chunk_ids = []
+    for chunk in chunks:
+        chunk_id = chunk.get("chunk_id")
+        if not chunk_id:
+            continue
+        chunk_type = chunk.get("chunk_type") or "text"
+        if chunk_type not in types:
+            types.append(chunk_type)
+        bbox = chunk.get("bbox") or [0, 0, 1, 1]
+        chunk_ids.append(chunk_id)
+        type_ids.append(types.index(chunk_type))
+        pages.append(int(chunk.get("page", 0)))
+        bboxes.extend(float(v) for v in bbox[:4])
+
+    return json.dumps({
+        "format": CHUNK_INDEX_FORMAT,
+        "source_document": source_document,
+        "chunk_ids": chunk_ids,
+        "types": types,
+        "type_ids": _pack(type_ids),
+        "pages": _pack(pages),
+        "bboxes": _pack(bboxes)
+    }, separators=(",", ":")).encode("utf-8")
+
+
+def write_chunk_index(s3_client, bucket: str, source_document: str, chunks: List[Dict], writer=None):
+    """Publish the chunk index sidecar of a document (called by ingestion)"""
+    body = pack_chunk_index(source_document, chunks)
+    if writer is not None:
+        writer.put(chunk_index_key(source_document), body, "application/json")
+        return
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=chunk_index_key(source_document),
+        Body=body,
+        ContentType="application/json"
+    )
+
+
+class _DocumentSegment:
+    """Array-backed chunk metadata of one document"""
+
+    __slots__ = ("source_document", "etag", "chunk_ids", "types", "type_ids", "pages", "bboxes")
+
+    def __init__(self, data: Dict, etag: str):
+        if data.get("format") != CHUNK_INDEX_FORMAT:
+            raise ValueError(f"Unsupported chunk index format: {data.get('format')}")
+        self.source_document = sys.intern(data["source_document"])
+        self.etag = etag
+        self.chunk_ids = data["chunk_ids"]
+        self.types = [sys.intern(t) for t in data["types"]]
+        self.type_ids = _unpack("B", data["type_ids"])
+        self.pages = _unpack("i", data["pages"])
+        self.bboxes = _unpack("f", data["bboxes"])
+        if not len(self.chunk_ids) == len(self.type_ids) == len(self.pages) == len(self.bboxes) // 4:
+            raise ValueError(f"Corrupt chunk index for {self.source_document}")
+
+    def record(self, row: int) -> Dict:
+        return {
+            "chunk_id": self.chunk_ids[row],
+            "chunk_type": self.types[self.type_ids[row]],
+            "page": self.pages[row],
+            # float32 storage; round away the widening noise
+            "bbox": [round(v, 6) for v in self.bboxes[row * 4:row * 4 + 4]],
+            "source_document": self.source_document
+        }
+
+
+class ChunkIndex:
+    """
+    In-memory chunk metadata index over all documents.
+
+    The first lookup loads every sidecar; afterwards the index is refreshed in
+    the background at most once per refresh interval, reloading only sidecars
+    whose ETag changed. Lookups never do I/O once the index is loaded.
+    """
+
+    def __init__(self, prefix: str = CHUNK_INDEX_PREFIX, refresh_seconds: float = CHUNK_INDEX_REFRESH_SECONDS):
+        self.prefix = prefix
+        self.refresh_seconds = refresh_seconds
+        self.loads = 0
+        self._bucket = None
+        self._segments: Dict[str, _DocumentSegment] = {}
+        self._rows: Dict[str, Tuple[_DocumentSegment, int]] = {}
+        self._refreshed_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def ensure_loaded(self, s3_client, bucket: str):
+        """Load the index on first use, or start a background refresh when it is stale"""
+        with self._lock:
+            loaded = self._bucket == bucket and self._refreshed_at is not None
+            stale = loaded and time.monotonic() - self._refreshed_at >= self.refresh_seconds
+            if loaded and (not stale or self._refreshing):
+                return
+            if stale:
+                self._refreshing = True
+        if not loaded:
+            self.refresh(s3_client, bucket)
+        else:
+            threading.Thread(target=self.refresh, args=(s3_client, bucket), daemon=True).start()
+
+    def get(self, chunk_id: str) -> Optional[Dict]:
+        """Metadata of a chunk by chunk_id, or None if it is not indexed"""
+        entry = self._rows.get(chunk_id)
+        if entry is None:
+            return None
+        segment, row = entry
+        return segment.record(row)
+
+    def get_by_file(self, source_file: str) -> Optional[Dict]:
+        """
+        Metadata of a chunk by its chunk file name ("<source_document>_<chunk_id>.json").
+
+        Document names may contain underscores, so every split point is tried.
+        """
+        stem = source_file[:-5] if source_file.endswith(".json") else source_file
+        position = stem.find("_")
+        while position != -1:
+            entry = self._rows.get(stem[position + 1:])
+            if entry is not None and entry[0].source_document == stem[:position]:
+                return entry[0].record(entry[1])
+            position = stem.find("_", position + 1)
+        return None
+
+    def refresh(self, s3_client, bucket: str):
+        """Reload sidecars that are new or changed since the last refresh"""
+        with self._refresh_lock:
+            try:
+                listed = {}
+                paginator = s3_client.get_paginator("list_objects_v2")
+                for page in paginator.paginate(Bucket=bucket, Prefix=self.prefix):
+                    for obj in page.get("Contents", []):
+                        if obj["Key"].endswith(".json"):
+                            listed[obj["Key"]] = obj.get("ETag", "")
+
+                with self._lock:
+                    known = {} if self._bucket != bucket else {
+                        f"{self.prefix}{doc}.json": segment.etag for doc, segment in self._segments.items()
+                    }
+                changed = [key for key, etag in listed.items() if known.get(key) != etag]
+
+                with ThreadPoolExecutor(max_workers=CHUNK_INDEX_LOAD_WORKERS) as executor:
+                    loaded = list(executor.map(lambda key: self._load_segment(s3_client, bucket, key), changed))
+
+                with self._lock:
+                    if self._bucket != bucket:
+                        self._bucket = bucket
+                        self._segments = {}
+                    for segment in loaded:
+                        if segment is not None:
+                            self._segments[segment.source_document] = segment
+                    for doc in [d for d in self._segments if f"{self.prefix}{d}.json" not in listed]:
+                        del self._segments[doc]
+                    if loaded or len(self._segments) != len(known):
+                        self._rows = {
+                            chunk_id: (segment, row)
+                            for segment in self._segments.values()
+                            for row, chunk_id in enumerate(segment.chunk_ids)
+                        }
+                    self.loads += sum(1 for segment in loaded if segment is not None)
+            except Exception as e:
+                print(f"Could not refresh chunk index: {e}")
+            finally:
+                with self._lock:
+                    if self._bucket != bucket:
+                        # Listing failed on first use; retry in the background later
+                        self._bucket = bucket
+                        self._segments = {}
+                        self._rows = {}
+                    self._refreshed_at = time.monotonic()
+                    self._refreshing = False
+
+    def clear(self):
+        with self._lock:
+            self._bucket = None
+            self._segments = {}
+            self._rows = {}
+            self._refreshed_at = None
+            self._refreshing = False
+            self.loads = 0
+
+    def _load_segment(self, s3_client, bucket: str, key: str) -> Optional[_DocumentSegment]:
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+            data = json.loads(response["Body"].read().decode("utf-8"))
+            return _DocumentSegment(data, response.get("ETag", ""))
+        except Exception as e:
+            print(f"Could not load chunk index {key}: {e}")
+            return None
+
+
+chunk_index = ChunkIndex()
@@ -0,0 +1,175 @@
+"""
+Chunk Shards
+Compact NDJSON shards of a document's chunks with a byte-offset index for S3 Range reads
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Constants
+# Outside output/, which the Knowledge Base data source indexes
+CHUNK_SHARDS_PREFIX = os.getenv("CHUNK_SHARDS_PREFIX", "internal/chunk_shards/")
+CHUNK_SHARD_MAX_BYTES = int(os.getenv("CHUNK_SHARD_MAX_BYTES", str(8 * 1024 * 1024)))
+CHUNK_SHARDS_FORMAT = 1
+SHARD_INDEX_CACHE_MAX = 64
+
+# Chunk file layouts written by ingestion: NDJSON shards, the legacy
+# one-object-per-chunk files read by the Knowledge Base data source, or both
+CHUNK_LAYOUT_SHARDS = "shards"
+CHUNK_LAYOUT_PER_CHUNK = "per_chunk"
+CHUNK_LAYOUT_BOTH = "both"
+
+
+def shard_index_key(source_document: str) -> str:
+    """S3 key of the byte-offset index of a document's shards"""
+    return f"{CHUNK_SHARDS_PREFIX}{source_document}/index.json"
+
+
+def shard_key(source_document: str, shard_name: str) -> str:
+    return f"{CHUNK_SHARDS_PREFIX}{source_document}/{shard_name}"
+
+
+def pack_chunk_shards(source_document: str, chunks: List[Dict], max_bytes: int = CHUNK_SHARD_MAX_BYTES):
+    """
+    Pack chunk records into NDJSON shards.
+
+    Args:
+        source_document: Document name without extension
+        chunks: Chunk records (one JSON line each)
+        max_bytes: Size at which a new shard is started
+
+    Returns:
+        Tuple of (list of (shard_name, bytes), index dict)
+    """
+    shards = []
+    offsets = {}
+    lines = []
+    size = 0
+
+    def close_shard():
+        shards.append((f"shard-{len(shards):05d}.ndjson", b"".join(lines)))
+
+    for chunk in chunks:
+        chunk_id = chunk.get("chunk_id")
+        if not chunk_id:
+            continue
+        line = json.dumps(chunk, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+        if lines and size + len(line) > max_bytes:
+            close_shard()
+            lines, size = [], 0
+        # Offset and length of the JSON object, without the trailing newline
+        offsets[chunk_id] = [len(shards), size, len(line) - 1]
+        lines.append(line)
+        size += len(line)
+    if lines:
+        close_shard()
+
+    index = {
+        "format": CHUNK_SHARDS_FORMAT,
+        "source_document": source_document,
+        "shards": [name for name, _ in shards],
+        "chunks": offsets
+    }
+    return shards, index
+
+
+def write_chunk_shards(s3_client, bucket: str, source_document: str, chunks: List[Dict], writer=None) -> Dict:
+    """
+    Write a document's chunks as NDJSON shards followed by their offset index.
+
+    The index is written last, so readers never see offsets into missing shards.
+
+    Args:
+        writer: Optional BulkS3Writer; shards are then uploaded concurrently
+
+    Returns:
+        The shard index
+    """
+    shards, index = pack_chunk_shards(source_document, chunks)
+    index_body = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    if writer is not None:
+        futures = [
+            writer.put(shard_key(source_document, shard_name), body, "application/x-ndjson")
+            for shard_name, body in shards
+        ]
+        # Raises if a shard could not be written, so no index points at it
+        for future in futures:
+            future.result()
+        writer.put(shard_index_key(source_document), index_body, "application/json")
+    else:
+        for shard_name, body in shards:
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=shard_key(source_document, shard_name),
+                Body=body,
+                ContentType="application/x-ndjson"
+            )
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=shard_index_key(source_document),
+            Body=index_body,
+            ContentType="application/json"
+        )
+    print(f"Wrote {len(index['chunks'])} chunks in {len(shards)} shards for {source_document}")
+    return index
+
+
+class ChunkShardReader:
+    """
+    Reads single chunks from shards with S3 Range GETs.
+
+    Shard indexes are cached per document; pass refresh=True to re-read one
+    after ingestion republished the document.
+    """
+
+    def __init__(self, max_documents: int = SHARD_INDEX_CACHE_MAX):
+        self.max_documents = max_documents
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_index(self, s3_client, bucket: str, source_document: str, refresh: bool = False) -> Optional[Dict]:
+        cache_key = (bucket, source_document)
+        with self._lock:
+            index = self._indexes.get(cache_key)
+            if index is not None and not refresh:
+                self._indexes.move_to_end(cache_key)
+                return index
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=shard_index_key(source_document))
+            index = json.loads(response["Body"].read().decode("utf-8"))
+        except Exception as e:
+            print(f"Could not load shard index for {source_document}: {e}")
+            return None
+        with self._lock:
+            self._indexes[cache_key] = index
+            self._indexes.move_to_end(cache_key)
+            while len(self._indexes) > self.max_documents:
+                self._indexes.popitem(last=False)
+        return index
+
+    def read_chunk(self, s3_client, bucket: str, source_document: str, chunk_id: str) -> Optional[Dict]:
+        """Read one chunk record, or None if the document or chunk is unknown"""
+        index = self.get_index(s3_client, bucket, source_document)
+        if index is None or chunk_id not in index["chunks"]:
+            return None
+        shard_no, offset, length = index["chunks"][chunk_id]
+        try:
+            response = s3_client.get_object(
+                Bucket=bucket,
+                Key=shard_key(source_document, index["shards"][shard_no]),
+                Range=f"bytes={offset}-{offset + length - 1}"
+            )
+            return json.loads(response["Body"].read().decode("utf-8"))
+        except Exception as e:
+            print(f"Could not read chunk {chunk_id} of {source_document}: {e}")
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+chunk_shard_reader = ChunkShardReader()
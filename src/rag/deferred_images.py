@@ -0,0 +1,96 @@
+"""
+Deferred Chunk Images
+Stable chunk image URLs that are rendered by the image endpoint on first GET
+"""
+
+import os
+import hmac
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+# Constants
+CHUNK_IMAGE_ENDPOINT = os.getenv("CHUNK_IMAGE_ENDPOINT", "")
+# Signs the crop parameters so the endpoint only renders regions the search tool handed out;
+# deferred images stay disabled without it
+CHUNK_IMAGE_URL_SECRET = os.getenv("CHUNK_IMAGE_URL_SECRET", "")
+
+
+def deferred_images_configured(endpoint: str = None, secret: str = None) -> bool:
+    """Whether image endpoint URLs can be handed out: both the endpoint and the signing secret are set"""
+    endpoint = CHUNK_IMAGE_ENDPOINT if endpoint is None else endpoint
+    secret = CHUNK_IMAGE_URL_SECRET if secret is None else secret
+    return bool(endpoint and secret)
+
+
+def _signature(params: Dict[str, str], secret: str) -> str:
+    message = "&".join(f"{name}={params[name]}" for name in sorted(params))
+    return hmac.new(secret.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def build_chunk_image_url(
+    source_document: str,
+    page_num: int,
+    bbox: List[float],
+    chunk_id: str,
+    chunk_type: str = "text",
+    endpoint: str = None,
+    secret: str = None
+) -> str:
+    """
+    Build the stable image endpoint URL of a chunk crop.
+
+    The URL only depends on the chunk, so it stays valid across queries and
+    never expires, unlike a presigned S3 URL.
+
+    Raises:
+        ValueError: If no signing secret is configured
+    """
+    endpoint = CHUNK_IMAGE_ENDPOINT if endpoint is None else endpoint
+    secret = CHUNK_IMAGE_URL_SECRET if secret is None else secret
+    if not secret:
+        raise ValueError("CHUNK_IMAGE_URL_SECRET is required for chunk image URLs")
+    params = {
+        "doc": source_document,
+        "page": str(page_num),
+        "bbox": json.dumps([round(float(v), 6) for v in bbox], separators=(",", ":")),
+        "chunk_id": chunk_id,
+        "type": chunk_type or "text",
+    }
+    params["sig"] = _signature(params, secret)
+    separator = "&" if "?" in endpoint else "?"
+    return f"{endpoint}{separator}{urlencode(params)}"
+
+
+def parse_chunk_image_request(
+    params: Dict[str, str],
+    secret: str = None
+) -> Optional[Tuple[str, int, List[float], str, str]]:
+    """
+    Validate the query parameters of an image endpoint request.
+
+    Returns:
+        (source_document, page_num, bbox, chunk_id, chunk_type), or None if the
+        parameters are missing, malformed or not signed with the secret.
+        Without a secret no request is valid.
+    """
+    secret = CHUNK_IMAGE_URL_SECRET if secret is None else secret
+    if not secret:
+        return None
+    params = dict(params or {})
+    signature = params.pop("sig", "")
+    if any(not params.get(name) for name in ("doc", "page", "bbox", "chunk_id")):
+        return None
+    signed = {name: params.get(name, "") for name in ("doc", "page", "bbox", "chunk_id", "type")}
+    if not hmac.compare_digest(signature, _signature(signed, secret)):
+        return None
+
+    try:
+        page_num = int(params["page"])
+        bbox = [float(v) for v in json.loads(params["bbox"])]
+    except (ValueError, TypeError):
+        return None
+    if len(bbox) != 4 or page_num < 0:
+        return None
+    return params["doc"], page_num, bbox, params["chunk_id"], params.get("type") or "text"
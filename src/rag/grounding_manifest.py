@@ -0,0 +1,355 @@
+"""
+Grounding Manifest
+Shared record of rendered chunk images and source PDF ETags, plus a presigned-URL cache
+"""
+
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+from botocore.exceptions import ClientError
+
+# Constants
+MANIFEST_KEY = os.getenv("GROUNDING_MANIFEST_KEY", "internal/grounding_manifest.json")
+MANIFEST_REFRESH_SECONDS = float(os.getenv("GROUNDING_MANIFEST_REFRESH_SECONDS", "60"))
+MANIFEST_FLUSH_SECONDS = float(os.getenv("GROUNDING_MANIFEST_FLUSH_SECONDS", "30"))
+# Conditional writes that lose a race re-read the manifest and merge again
+MANIFEST_WRITE_ATTEMPTS = int(os.getenv("GROUNDING_MANIFEST_WRITE_ATTEMPTS", "5"))
+MANIFEST_WRITE_BACKOFF_SECONDS = 0.1
+PRESIGNED_URL_EXPIRES_IN = 3600
+# Presigned URLs are reused until they have less than this much validity left
+PRESIGNED_URL_MIN_TTL_SECONDS = int(os.getenv("PRESIGNED_URL_MIN_TTL_SECONDS", "300"))
+PRESIGNED_URL_CACHE_MAX = 4096
+
+
+def _error_code(error: ClientError) -> str:
+    return str(error.response.get("Error", {}).get("Code", ""))
+
+
+def _is_not_modified(error: ClientError) -> bool:
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return status == 304 or _error_code(error) in ("304", "NotModified")
+
+
+def _is_write_conflict(error: ClientError) -> bool:
+    # Another writer replaced (or created) the manifest since it was read
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return status in (409, 412) or _error_code(error) in ("PreconditionFailed", "ConditionalRequestConflict")
+
+
+def normalize_etag(etag: Optional[str]) -> Optional[str]:
+    """S3 events report ETags without the quotes GetObject returns"""
+    return etag.strip('"') if etag else None
+
+
+class GroundingManifest:
+    """
+    In-memory view of an S3 manifest listing rendered chunk image keys and
+    source PDF ETags.
+
+    Lookups are served from memory. The S3 object is re-read with a conditional
+    GET at most once per refresh interval, and local additions are merged back
+    into it with conditional PUTs, so concurrent writers never overwrite each
+    other's entries and steady-state grounding needs no HEAD requests.
+    Keys missing from the manifest are not proof of absence: callers fall back
+    to checking S3 and record what they find.
+    """
+
+    def __init__(
+        self,
+        manifest_key: str = MANIFEST_KEY,
+        refresh_seconds: float = MANIFEST_REFRESH_SECONDS,
+        flush_seconds: float = MANIFEST_FLUSH_SECONDS
+    ):
+        """
+        Initialize manifest
+
+        Args:
+            manifest_key: S3 key of the manifest object
+            refresh_seconds: How long the in-memory view is trusted before checking S3 again
+            flush_seconds: Minimum interval between writes of local additions by maybe_flush
+        """
+        self.manifest_key = manifest_key
+        self.refresh_seconds = refresh_seconds
+        self.flush_seconds = flush_seconds
+        self.refreshes = 0
+        self.flushes = 0
+        self._bucket = None
+        self._images = set()
+        self._pdfs: Dict[str, str] = {}
+        self._pending_images = set()
+        self._pending_pdfs: Dict[str, str] = {}
+        self._removed_images = set()
+        self._etag = None
+        self._refreshed_at = None
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def has_image(self, s3_client, bucket: str, image_key: str) -> bool:
+        """Check whether a chunk image is known to exist"""
+        self.refresh(s3_client, bucket)
+        with self._lock:
+            return image_key in self._images
+
+    def pdf_etag(self, s3_client, bucket: str, pdf_key: str) -> Optional[str]:
+        """Return the recorded ETag of a source PDF, or None if it is unknown"""
+        self.refresh(s3_client, bucket)
+        with self._lock:
+            return self._pdfs.get(pdf_key)
+
+    def add_images(self, bucket: str, image_keys: Iterable[str]):
+        """Record chunk images that exist in S3"""
+        with self._lock:
+            self._use_bucket(bucket)
+            new_keys = set(image_keys) - self._images
+            self._images.update(new_keys)
+            self._pending_images.update(new_keys)
+            self._removed_images.difference_update(new_keys)
+
+    def remove_images(self, bucket: str, image_keys: Iterable[str]):
+        """Forget chunk images that were deleted from S3"""
+        with self._lock:
+            self._use_bucket(bucket)
+            image_keys = set(image_keys)
+            self._images.difference_update(image_keys)
+            self._pending_images.difference_update(image_keys)
+            self._removed_images.update(image_keys)
+
+    def add_pdf(self, bucket: str, pdf_key: str, etag: str):
+        """Record the current ETag of a source PDF"""
+        etag = normalize_etag(etag)
+        if not etag:
+            return
+        with self._lock:
+            self._use_bucket(bucket)
+            if self._pdfs.get(pdf_key) != etag:
+                self._pdfs[pdf_key] = etag
+                self._pending_pdfs[pdf_key] = etag
+
+    def refresh(self, s3_client, bucket: str, force: bool = False):
+        """Reload the manifest from S3 if the in-memory view is stale"""
+        with self._lock:
+            self._use_bucket(bucket)
+            fresh = self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.refresh_seconds
+            if fresh and not force:
+                return
+            etag = self._etag
+
+        get_kwargs = {"Bucket": bucket, "Key": self.manifest_key}
+        if etag:
+            get_kwargs["IfNoneMatch"] = etag
+        try:
+            response = s3_client.get_object(**get_kwargs)
+            data = json.loads(response["Body"].read().decode("utf-8"))
+        except ClientError as e:
+            if _is_not_modified(e):
+                with self._lock:
+                    self._refreshed_at = time.monotonic()
+                return
+            if _error_code(e) in ("NoSuchKey", "404"):
+                data, response = {}, {}
+            else:
+                print(f"Could not refresh grounding manifest: {e}")
+                with self._lock:
+                    self._refreshed_at = time.monotonic()
+                return
+        except Exception as e:
+            print(f"Could not refresh grounding manifest: {e}")
+            with self._lock:
+                self._refreshed_at = time.monotonic()
+            return
+
+        with self._lock:
+            if self._bucket != bucket:
+                return
+            # Local additions not yet written back stay visible
+            self._images = (set(data.get("images", [])) | self._pending_images) - self._removed_images
+            self._pdfs = {**data.get("pdfs", {}), **self._pending_pdfs}
+            self._etag = response.get("ETag")
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+
+    def flush(self, s3_client, bucket: str) -> bool:
+        """
+        Merge local additions and removals into the S3 manifest.
+
+        The manifest is written with IfMatch on the ETag it was read with (or
+        IfNoneMatch when it does not exist yet); a write that loses a race
+        re-reads and merges again, up to MANIFEST_WRITE_ATTEMPTS times.
+
+        Returns:
+            True if nothing was pending or the write succeeded
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._bucket != bucket:
+                    return True
+                images = set(self._pending_images)
+                pdfs = dict(self._pending_pdfs)
+                removed = set(self._removed_images)
+            if not images and not pdfs and not removed:
+                return True
+
+            for attempt in range(MANIFEST_WRITE_ATTEMPTS):
+                if attempt:
+                    time.sleep(MANIFEST_WRITE_BACKOFF_SECONDS * attempt)
+                try:
+                    response = s3_client.get_object(Bucket=bucket, Key=self.manifest_key)
+                    data = json.loads(response["Body"].read().decode("utf-8"))
+                    condition = {"IfMatch": response["ETag"]}
+                except ClientError as e:
+                    if _error_code(e) not in ("NoSuchKey", "404"):
+                        print(f"Could not read grounding manifest: {e}")
+                        return False
+                    data = {}
+                    condition = {"IfNoneMatch": "*"}
+                except Exception as e:
+                    print(f"Could not read grounding manifest: {e}")
+                    return False
+
+                merged_images = (set(data.get("images", [])) | images) - removed
+                merged_pdfs = {**data.get("pdfs", {}), **pdfs}
+                try:
+                    put_response = s3_client.put_object(
+                        Bucket=bucket,
+                        Key=self.manifest_key,
+                        Body=json.dumps({"images": sorted(merged_images), "pdfs": merged_pdfs}).encode("utf-8"),
+                        ContentType="application/json",
+                        **condition
+                    )
+                    break
+                except ClientError as e:
+                    if _is_write_conflict(e):
+                        continue
+                    print(f"Could not write grounding manifest: {e}")
+                    return False
+                except Exception as e:
+                    print(f"Could not write grounding manifest: {e}")
+                    return False
+            else:
+                print(f"Could not write grounding manifest: {MANIFEST_WRITE_ATTEMPTS} conflicting writes")
+                return False
+
+            with self._lock:
+                self._pending_images.difference_update(images)
+                self._removed_images.difference_update(removed)
+                for pdf_key, etag in pdfs.items():
+                    if self._pending_pdfs.get(pdf_key) == etag:
+                        del self._pending_pdfs[pdf_key]
+                self._images = (merged_images | self._pending_images) - self._removed_images
+                self._pdfs = {**merged_pdfs, **self._pending_pdfs}
+                self._etag = put_response.get("ETag") if isinstance(put_response, dict) else None
+                self._refreshed_at = time.monotonic()
+                self._flushed_at = time.monotonic()
+                self.flushes += 1
+            return True
+
+    def maybe_flush(self, s3_client, bucket: str):
+        """
+        Write local additions back, at most once per flush interval.
+
+        The write runs in the calling thread, so it completes before the
+        Lambda handler returns and cannot be frozen half-way.
+        """
+        with self._lock:
+            pending = self._pending_images or self._pending_pdfs or self._removed_images
+            due = time.monotonic() - self._flushed_at >= self.flush_seconds
+            if not pending or not due:
+                return
+            self._flushed_at = time.monotonic()
+        self.flush(s3_client, bucket)
+
+    def clear(self):
+        with self._lock:
+            self._bucket = None
+            self._reset()
+            self.refreshes = 0
+            self.flushes = 0
+
+    def _use_bucket(self, bucket: str):
+        # Caller holds self._lock; the manifest tracks a single bucket at a time
+        if self._bucket != bucket:
+            self._bucket = bucket
+            self._reset()
+
+    def _reset(self):
+        self._images = set()
+        self._pdfs = {}
+        self._pending_images = set()
+        self._pending_pdfs = {}
+        self._removed_images = set()
+        self._etag = None
+        self._refreshed_at = None
+        self._flushed_at = time.monotonic()
+
+
+class PresignedUrlCache:
+    """
+    LRU cache of presigned GET URLs, reused until shortly before they expire.
+    """
+
+    def __init__(
+        self,
+        expires_in: int = PRESIGNED_URL_EXPIRES_IN,
+        min_ttl_seconds: int = PRESIGNED_URL_MIN_TTL_SECONDS,
+        max_entries: int = PRESIGNED_URL_CACHE_MAX
+    ):
+        self.expires_in = expires_in
+        self.min_ttl_seconds = min_ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.signs = 0
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, s3_client, bucket: str, keys: List[str]) -> Dict[str, str]:
+        """
+        Get presigned URLs for many keys, signing only the missing or expiring ones.
+
+        Returns:
+            Dict of key to presigned URL
+        """
+        now = time.time()
+        urls = {}
+        with self._lock:
+            for key in keys:
+                entry = self._urls.get((bucket, key))
+                if entry and entry[1] - now > self.min_ttl_seconds:
+                    self._urls.move_to_end((bucket, key))
+                    urls[key] = entry[0]
+                    self.hits += 1
+
+        for key in keys:
+            if key in urls:
+                continue
+            url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': bucket, 'Key': key},
+                ExpiresIn=self.expires_in
+            )
+            urls[key] = url
+            with self._lock:
+                self.signs += 1
+                self._urls[(bucket, key)] = (url, now + self.expires_in)
+                self._urls.move_to_end((bucket, key))
+                while len(self._urls) > self.max_entries:
+                    self._urls.popitem(last=False)
+        return urls
+
+    def invalidate(self, bucket: str, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._urls.pop((bucket, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._urls.clear()
+            self.hits = 0
+            self.signs = 0
+
+
+grounding_manifest = GroundingManifest()
+presigned_url_cache = PresignedUrlCache()
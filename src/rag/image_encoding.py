@@ -0,0 +1,141 @@
+"""
+Image Encoding
+Encoding profiles for grounding images (format, quality, pixel budget, grayscale)
+"""
+
+import io
+import os
+import math
+from typing import NamedTuple
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Constants
+IMAGE_FORMATS = {
+    "png": ("PNG", "png", "image/png"),
+    "webp": ("WEBP", "webp", "image/webp"),
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+}
+# Chunk types that are plain text and lose nothing in grayscale
+GRAYSCALE_CHUNK_TYPES = {"text", "marginalia"}
+DEFAULT_PNG_COMPRESS_LEVEL = 6
+
+
+class EncodingProfile(NamedTuple):
+    """
+    How grounding images are encoded.
+
+    Attributes:
+        format: "png", "webp" or "jpeg"
+        quality: Quality for WebP and JPEG (1-100)
+        compress_level: zlib level for PNG (0-9)
+        max_pixels: Downscale images above this many pixels; 0 disables it
+        grayscale_text: Store text chunks as grayscale
+    """
+    format: str = "png"
+    quality: int = 80
+    compress_level: int = DEFAULT_PNG_COMPRESS_LEVEL
+    max_pixels: int = 0
+    grayscale_text: bool = False
+
+    @property
+    def extension(self) -> str:
+        return IMAGE_FORMATS[self.format][1]
+
+    @property
+    def content_type(self) -> str:
+        return IMAGE_FORMATS[self.format][2]
+
+    def is_grayscale(self, chunk_type: str = "text") -> bool:
+        return self.grayscale_text and (chunk_type or "text").lower() in GRAYSCALE_CHUNK_TYPES
+
+    def key_suffix(self, chunk_type: str = "text") -> str:
+        """
+        Suffix identifying the profile in an S3 key, extension included.
+
+        The default PNG profile maps to plain ".png" so existing keys stay valid.
+        """
+        if self.format == "png":
+            tag = "" if self.compress_level == DEFAULT_PNG_COMPRESS_LEVEL else f"z{self.compress_level}"
+        else:
+            tag = f"q{self.quality}"
+        if self.max_pixels:
+            tag += f"-px{self.max_pixels}"
+        if self.is_grayscale(chunk_type):
+            tag += "-gray"
+        return f"_{tag}.{self.extension}" if tag else f".{self.extension}"
+
+
+DEFAULT_PROFILE = EncodingProfile()
+
+
+def parse_profile(spec: str) -> EncodingProfile:
+    """
+    Parse a profile spec such as "webp,quality=75,max_pixels=1500000,grayscale_text=true".
+
+    The first item is the format; the others override EncodingProfile fields.
+    """
+    items = [item.strip() for item in (spec or "").split(",") if item.strip()]
+    if not items:
+        return DEFAULT_PROFILE
+    image_format = items[0].lower()
+    if image_format == "jpg":
+        image_format = "jpeg"
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {items[0]}")
+
+    fields = {"format": image_format}
+    for item in items[1:]:
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name == "grayscale_text":
+            fields[name] = value.strip().lower() in ("1", "true", "yes")
+        elif name in ("quality", "compress_level", "max_pixels"):
+            fields[name] = int(value)
+        else:
+            raise ValueError(f"Unknown image profile field: {name}")
+    return EncodingProfile(**fields)
+
+
+CHUNK_IMAGE_PROFILE = parse_profile(os.getenv("CHUNK_IMAGE_PROFILE", "png"))
+# Annotated pages keep their colored boxes, so grayscale_text does not apply to them
+ANNOTATION_IMAGE_PROFILE = parse_profile(os.getenv("ANNOTATION_IMAGE_PROFILE", "png"))
+
+
+def encode_image(img, profile: EncodingProfile = DEFAULT_PROFILE, chunk_type: str = "text") -> bytes:
+    """
+    Encode an image with a profile: grayscale, downscale, then compress.
+
+    Args:
+        img: PIL Image; it is not modified
+        profile: Encoding profile
+        chunk_type: Chunk type, used for grayscale_text
+
+    Returns:
+        Encoded image bytes
+    """
+    if profile.is_grayscale(chunk_type):
+        img = img.convert("L")
+    elif img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    if profile.max_pixels and img.width * img.height > profile.max_pixels:
+        scale = math.sqrt(profile.max_pixels / (img.width * img.height))
+        size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        img = img.resize(size, Image.LANCZOS)
+
+    pil_format = IMAGE_FORMATS[profile.format][0]
+    save_kwargs = {}
+    if profile.format == "png":
+        save_kwargs["compress_level"] = profile.compress_level
+    elif profile.format == "webp":
+        save_kwargs.update(quality=profile.quality, method=4)
+    else:
+        save_kwargs.update(quality=profile.quality, optimize=True)
+
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format=pil_format, **save_kwargs)
+    return img_bytes.getvalue()
@@ -1,5 +1,60 @@
+import time
+
+
 def invoke_agent(agent, user_input:str):
 
     response = agent(user_input)
 
-    return response
\ No newline at end of file
+    return response
+
+
+async def stream_agent(agent, user_input: str):
+    """
+    Run the agent and yield its progress as plain events.
+
+    Events are dicts with a type of:
+        token: {"text"} - a piece of the answer
+        tool_start: {"tool", "id"} - the agent called a tool
+        tool_end: {"tool", "id", "status"} - the tool returned
+        done: {"response", "first_token_ms", "total_ms"} - the full answer
+    """
+    start = time.perf_counter()
+    first_token = None
+    tools = {}
+
+    async for event in agent.stream_async(user_input):
+        if "data" in event:
+            if not event["data"]:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter()
+            yield {"type": "token", "text": event["data"]}
+
+        elif "current_tool_use" in event:
+            # Emitted for every delta of the tool input; report each call once
+            tool_use = event["current_tool_use"]
+            tool_id = tool_use.get("toolUseId")
+            if tool_id and tool_id not in tools:
+                tools[tool_id] = tool_use.get("name", "")
+                yield {"type": "tool_start", "tool": tools[tool_id], "id": tool_id}
+
+        elif "message" in event and event["message"].get("role") == "user":
+            for content in event["message"].get("content", []):
+                tool_result = content.get("toolResult")
+                if tool_result:
+                    tool_id = tool_result.get("toolUseId")
+                    yield {
+                        "type": "tool_end",
+                        "tool": tools.get(tool_id, ""),
+                        "id": tool_id,
+                        "status": tool_result.get("status", "")
+                    }
+
+        elif "result" in event:
+            end = time.perf_counter()
+            yield {
+                "type": "done",
+                "response": str(event["result"]),
+                "first_token_ms": round((first_token - start) * 1000, 1) if first_token else None,
+                "total_ms": round((end - start) * 1000, 1)
+            }
@@ -1,66 +1,191 @@
 import os
+import time
+import json
+import threading
 from datetime import datetime
+import boto3
 from bedrock_agentcore.memory import MemoryClient
 from bedrock_agentcore.memory.integrations.strands.config import AgentCoreMemoryConfig
 from bedrock_agentcore.memory.integrations.strands.session_manager import AgentCoreMemorySessionManager
 
-def setup_memory():
-    memory_client = MemoryClient(region_name=os.getenv("AWS_REGION", "ca-central-1"))
+MEMORY_NAME_PREFIX = "BudgetAgentMemory"
+# Seconds a resolved memory ID is trusted before it is looked up again
+MEMORY_ID_TTL_SECONDS = float(os.environ.get("MEMORY_ID_TTL_SECONDS", "3600"))
+# Seconds before looking again when no memory was found
+MEMORY_ID_MISS_TTL_SECONDS = float(os.environ.get("MEMORY_ID_MISS_TTL_SECONDS", "60"))
+# Optional s3://bucket/key of the {"memory_id": ...} config written by provision_memory
+MEMORY_CONFIG_S3_URI = os.environ.get("MEMORY_CONFIG_S3_URI", "")
 
+# Created on first use and shared by every request of a warm container
+memory_client = None
+
+# Resolved memory ID per region: region -> (memory_id, expires_at)
+_memory_ids = {}
+_memory_ids_lock = threading.Lock()
+
+
+def get_memory_client():
+    global memory_client
+    if memory_client is None:
+        memory_client = MemoryClient(region_name=os.getenv("AWS_REGION", "ca-central-1"))
+    return memory_client
+
+
+def find_memory_id(memory_client):
+    """ID of the most recent BudgetAgentMemory resource, or None"""
+    existing_memories = memory_client.gmcp_client.list_memories()
+    memory_list = existing_memories.get('memories', [])
+
+    budget_memories = [m for m in memory_list if MEMORY_NAME_PREFIX in m.get('id', '')]
+    if not budget_memories:
+        return None
+
+    # Sort by creation date and take the most recent
+    budget_memories.sort(key=lambda x: x.get('createdAt', ''), reverse=True)
+    return budget_memories[0].get('id')
+
+
+def _split_s3_uri(uri: str):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def read_memory_config(uri: str = None):
+    """Memory ID stored in the S3 config object, or None"""
+    uri = MEMORY_CONFIG_S3_URI if uri is None else uri
+    if not uri:
+        return None
+    bucket, key = _split_s3_uri(uri)
+    try:
+        response = boto3.client("s3").get_object(Bucket=bucket, Key=key)
+        return json.loads(response["Body"].read()).get("memory_id")
+    except Exception as e:
+        print(f" Could not read memory config {uri}: {e}")
+        return None
+
+
+def write_memory_config(memory_id: str, uri: str = None):
+    uri = MEMORY_CONFIG_S3_URI if uri is None else uri
+    if not uri:
+        return
+    bucket, key = _split_s3_uri(uri)
+    boto3.client("s3").put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps({"memory_id": memory_id, "updated_at": datetime.now().isoformat()}),
+        ContentType="application/json"
+    )
+    print(f" Memory config written to {uri}")
+
+
+def _lookup_memory_id():
+    memory_id = read_memory_config()
+    if memory_id:
+        return memory_id
     try:
-        existing_memories = memory_client.gmcp_client.list_memories()
-        memory_list = existing_memories.get('memories', [])
-        
-        budget_memories = [m for m in memory_list if 'BudgetAgentMemory' in m.get('id', '')]
-        
-        if budget_memories:
-            # Sort by creation date and take the most recent
-            budget_memories.sort(key=lambda x: x.get('createdAt', ''), reverse=True)
-            existing_budget_memory = budget_memories[0]
-            MEMORY_ID = existing_budget_memory.get('id')
-        else:
-            # Only create if none exist
-            raise Exception("No existing BudgetAgentMemory found, will create new one")
-            
+        return find_memory_id(get_memory_client())
     except Exception as e:
-        print(f" Creating new memory... (Reason: {e})")
-        try:
-            # Add timestamp to make name unique
-            comprehensive_memory = memory_client.create_memory_and_wait(
-                name=f"BudgetAgentMemory_{datetime.now().strftime('%Y%m%d_%H%M%S')}", 
-                description="Memory for budget document analysis with user preferences",
-                strategies=[
-                    {
-                        "summaryMemoryStrategy": {
-                            "name": "SessionSummarizer",
-                            "namespaces": ["/summaries/{actorId}/{sessionId}"]
-                        }
-                    },
-                    {
-                        "userPreferenceMemoryStrategy": {
-                            "name": "PreferenceLearner",
-                            "namespaces": ["/preferences/{actorId}"]
-                        }
-                    },
-                    {
-                        "semanticMemoryStrategy": {
-                            "name": "FactExtractor",
-                            "namespaces": ["/facts/{actorId}"]
-                        }
+        print(f" Could not list memories: {e}")
+        return None
+
+
+def resolve_memory_id():
+    """
+    Memory ID for this request, without ever creating the resource.
+
+    BUDGET_MEMORY_ID wins; otherwise the ID comes from the S3 config or the
+    most recent BudgetAgentMemory and is cached per process for
+    MEMORY_ID_TTL_SECONDS, so warm requests only do a dictionary lookup.
+    """
+    memory_id = os.environ.get("BUDGET_MEMORY_ID")
+    if memory_id:
+        return memory_id
+
+    region = os.getenv("AWS_REGION", "ca-central-1")
+    cached = _memory_ids.get(region)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    with _memory_ids_lock:
+        cached = _memory_ids.get(region)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        memory_id = _lookup_memory_id()
+        ttl = MEMORY_ID_TTL_SECONDS if memory_id else MEMORY_ID_MISS_TTL_SECONDS
+        _memory_ids[region] = (memory_id, time.monotonic() + ttl)
+    return memory_id
+
+
+def clear_memory_id_cache():
+    with _memory_ids_lock:
+        _memory_ids.clear()
+
+
+def provision_memory():
+    """
+    Find or create the BudgetAgentMemory resource.
+
+    Creation waits until the resource is active, which takes minutes, so this
+    runs as a deployment step and never inside a user request.
+
+    Returns:
+        Memory ID
+    """
+    memory_client = get_memory_client()
+    memory_id = find_memory_id(memory_client)
+    if memory_id:
+        print(f" Using existing memory: {memory_id}")
+    else:
+        print(" Creating new memory...")
+        # Add timestamp to make name unique
+        comprehensive_memory = memory_client.create_memory_and_wait(
+            name=f"{MEMORY_NAME_PREFIX}_{datetime.now().strftime('%Y%m%d_%H%M%S')}", 
+            description="Memory for budget document analysis with user preferences",
+            strategies=[
+                {
+                    "summaryMemoryStrategy": {
+                        "name": "SessionSummarizer",
+                        "namespaces": ["/summaries/{actorId}/{sessionId}"]
+                    }
+                },
+                {
+                    "userPreferenceMemoryStrategy": {
+                        "name": "PreferenceLearner",
+                        "namespaces": ["/preferences/{actorId}"]
                     }
-                ]
-            )
-            MEMORY_ID = comprehensive_memory.get('id')
-            print(f" New memory created: {MEMORY_ID}")
-        except Exception as create_error:
-            print(f" Could not create memory: {create_error}")
-            print("Continuing without memory functionality...")
-            MEMORY_ID = None
+                },
+                {
+                    "semanticMemoryStrategy": {
+                        "name": "FactExtractor",
+                        "namespaces": ["/facts/{actorId}"]
+                    }
+                }
+            ]
+        )
+        memory_id = comprehensive_memory.get('id')
+        print(f" New memory created: {memory_id}")
+
+    write_memory_config(memory_id)
+    with _memory_ids_lock:
+        _memory_ids[os.getenv("AWS_REGION", "ca-central-1")] = (memory_id, time.monotonic() + MEMORY_ID_TTL_SECONDS)
+    return memory_id
+
+
+def setup_memory(actor_id: str = None, session_id: str = None):
+    """
+    Session manager of a conversation, or None when no memory is provisioned.
 
+    Args:
+        actor_id: User the long-term preferences and facts belong to
+        session_id: Conversation whose history is restored; a new one by default
+    """
+    MEMORY_ID = resolve_memory_id()
+    if not MEMORY_ID:
+        print(" No BudgetAgentMemory provisioned (run: python -m src.rag.memory)")
 
     if MEMORY_ID:
-        ACTOR_ID = f"user_{datetime.now().strftime('%H%M%S')}"
-        SESSION_ID = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        ACTOR_ID = actor_id or f"user_{datetime.now().strftime('%H%M%S')}"
+        SESSION_ID = session_id or f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
         print(f"   Actor: {ACTOR_ID}")
         print(f"   Session: {SESSION_ID}")
@@ -81,4 +206,21 @@ def setup_memory():
         session_manager = None
         print("Agent will run without memory")
 
-    return session_manager
\ No newline at end of file
+    return session_manager
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # Deployment step; scripts read the memory ID from --output, not from the log
+    parser = argparse.ArgumentParser(description="Find or create the agent memory")
+    parser.add_argument("--output", metavar="FILE", help="Write the memory ID alone to this file")
+    args = parser.parse_args()
+
+    provisioned_id = provision_memory()
+    if not provisioned_id:
+        raise SystemExit("Memory provisioning returned no memory ID")
+    print(provisioned_id)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(provisioned_id)
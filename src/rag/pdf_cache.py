@@ -0,0 +1,210 @@
+"""
+PDF Cache
+Process-wide local disk cache of source PDFs, validated against S3 ETags
+"""
+
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional
+from botocore.exceptions import ClientError
+
+try:
+    from src.rag.render_cache import document_cache
+except ImportError:
+    # Flat layout of the ingestion Lambda package
+    from render_cache import document_cache
+
+# Constants
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "/tmp/pdf_cache")
+# Cached files live in this subdirectory of the cache directory, under names
+# only this cache produces, so nothing else in the directory is ever removed
+PDF_CACHE_SUBDIR = "budget_rag_pdfs"
+_ENTRY_NAME = re.compile(r"^[0-9a-f]{40}\.pdf$|^.*\.part$")
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(400 * 1024 * 1024)))
+PDF_CACHE_REVALIDATE_SECONDS = float(os.getenv("PDF_CACHE_REVALIDATE_SECONDS", "300"))
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def _is_not_modified(error: ClientError) -> bool:
+    """Check whether a conditional GET failed only because the object is unchanged"""
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    code = str(error.response.get("Error", {}).get("Code", ""))
+    return status == 304 or code in ("304", "NotModified")
+
+
+class PdfCache:
+    """
+    LRU cache of S3 PDFs stored as local files.
+
+    Entries are validated against the S3 ETag (and version ID when the bucket
+    is versioned) with a conditional GET at most once per revalidate interval,
+    so a warm container opens PDFs straight from disk without downloading them.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = PDF_CACHE_DIR,
+        max_bytes: int = PDF_CACHE_MAX_BYTES,
+        revalidate_seconds: float = PDF_CACHE_REVALIDATE_SECONDS,
+        on_evict: Optional[Callable[[Path], None]] = None
+    ):
+        """
+        Initialize PDF cache
+
+        Nothing touches the disk until the first download, so importing the
+        module (e.g. in render worker processes) never removes files.
+
+        Args:
+            cache_dir: Local directory; PDFs are kept in its PDF_CACHE_SUBDIR
+            max_bytes: Total size cap; least recently used PDFs are evicted above it
+            revalidate_seconds: How long a cached PDF is trusted before checking its ETag again
+            on_evict: Called with the path of a PDF before its file is removed,
+                e.g. to close open document handles
+        """
+        self.cache_dir = Path(cache_dir) / PDF_CACHE_SUBDIR
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.on_evict = on_evict
+        self.hits = 0
+        self.downloads = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[tuple, threading.Lock] = {}
+        self._prepared = False
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry["size"] for entry in self._entries.values())
+
+    def get_path(self, s3_client, bucket: str, key: str, expected_etag: Optional[str] = None) -> Path:
+        """
+        Get a local path for an S3 PDF, downloading it only if missing or changed.
+
+        Args:
+            s3_client: Boto3 S3 client
+            bucket: S3 bucket name
+            key: S3 key of the PDF
+            expected_etag: Known current ETag (e.g. from the grounding manifest);
+                a cached copy with this ETag is used without revalidating it
+
+        Returns:
+            Path of the cached local copy
+        """
+        cache_key = (bucket, key)
+        with self._key_lock(cache_key):
+            entry = self._lookup(cache_key)
+            if entry and expected_etag:
+                # The known ETag decides: reuse on a match, fetch again on a mismatch
+                if entry["etag"].strip('"') == expected_etag.strip('"'):
+                    entry["validated_at"] = time.monotonic()
+                    self.hits += 1
+                    return entry["path"]
+            elif entry and time.monotonic() - entry["validated_at"] < self.revalidate_seconds:
+                self.hits += 1
+                return entry["path"]
+
+            get_kwargs = {"Bucket": bucket, "Key": key}
+            if entry:
+                get_kwargs["IfNoneMatch"] = entry["etag"]
+            try:
+                response = s3_client.get_object(**get_kwargs)
+            except ClientError as e:
+                if entry and _is_not_modified(e):
+                    entry["validated_at"] = time.monotonic()
+                    self.hits += 1
+                    return entry["path"]
+                raise
+
+            return self._store(cache_key, response)
+
+    def get_etag(self, bucket: str, key: str) -> Optional[str]:
+        """Return the ETag of the cached copy of a PDF, if any"""
+        entry = self._lookup((bucket, key))
+        return entry["etag"] if entry else None
+
+    def clear(self):
+        """Remove every cached PDF"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        self._remove(entries)
+
+    def _prepare(self):
+        # Caller holds self._lock. Entries of a previous process in this
+        # directory are not tracked, so only those are dropped
+        if self._prepared:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for path in self.cache_dir.iterdir():
+            if path.is_file() and _ENTRY_NAME.match(path.name):
+                path.unlink(missing_ok=True)
+        self._prepared = True
+
+    def _remove(self, entries):
+        # Open handles are closed before their file goes away
+        for entry in entries:
+            if self.on_evict is not None:
+                self.on_evict(entry["path"])
+            entry["path"].unlink(missing_ok=True)
+
+    def _key_lock(self, cache_key: tuple) -> threading.Lock:
+        # One lock per PDF so concurrent crops of the same document share one download
+        with self._lock:
+            return self._key_locks.setdefault(cache_key, threading.Lock())
+
+    def _lookup(self, cache_key: tuple) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+            return entry
+
+    def _store(self, cache_key: tuple, response: Dict) -> Path:
+        bucket, key = cache_key
+        name = hashlib.sha1(f"{bucket}/{key}".encode("utf-8")).hexdigest()
+        path = self.cache_dir / f"{name}.pdf"
+
+        with self._lock:
+            self._prepare()
+
+        # Write to a temp file and rename, so open documents keep reading the old copy
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(response["Body"], f, COPY_BUFFER_SIZE)
+        os.replace(tmp_name, path)
+        self.downloads += 1
+
+        entry = {
+            "path": path,
+            "etag": response.get("ETag", ""),
+            "version_id": response.get("VersionId"),
+            "size": path.stat().st_size,
+            "validated_at": time.monotonic()
+        }
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            evicted = self._evict()
+        self._remove(evicted)
+        return path
+
+    def _evict(self) -> list:
+        # Caller holds self._lock; the newest entry is always kept
+        evicted = []
+        total = sum(entry["size"] for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            evicted.append(entry)
+            total -= entry["size"]
+        return evicted
+
+
+pdf_cache = PdfCache(on_evict=document_cache.discard)
@@ -0,0 +1,166 @@
+"""
+Render Cache
+In-process LRU caches of open PDF documents and rendered page rasters
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+# Constants
+DOCUMENT_CACHE_MAX_OPEN = int(os.getenv("DOCUMENT_CACHE_MAX_OPEN", "8"))
+RASTER_CACHE_MAX_BYTES = int(os.getenv("RASTER_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+RASTER_SEEN_MAX_KEYS = 1024
+
+# MuPDF is not thread-safe; grounding and ingestion both run PyMuPDF on thread
+# pools, so every PyMuPDF call of the process goes through this one lock
+MUPDF_LOCK = threading.RLock()
+
+
+def document_version(pdf_source) -> Optional[Tuple]:
+    """
+    Version key of a local PDF file: (path, mtime_ns, size).
+
+    The PDF cache replaces a file whenever its ETag changes, so the key changes
+    with the S3 object version. In-memory bytes are not cached and return None.
+    """
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return None
+    path = Path(pdf_source)
+    stat = path.stat()
+    return (str(path), stat.st_mtime_ns, stat.st_size)
+
+
+def _image_bytes(img) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class DocumentCache:
+    """
+    LRU cache of open fitz.Document handles keyed by document version.
+
+    Callers must hold the MuPDF lock while using a document and must not close it.
+    """
+
+    def __init__(self, max_documents: int = DOCUMENT_CACHE_MAX_OPEN):
+        self.max_documents = max_documents
+        self.hits = 0
+        self.opens = 0
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version: Tuple, opener: Callable):
+        """
+        Get the open document for a version, opening it on a miss.
+
+        Args:
+            version: Key from document_version()
+            opener: Zero-argument callable that opens the document
+        """
+        with self._lock:
+            doc = self._documents.get(version)
+            if doc is not None:
+                self._documents.move_to_end(version)
+                self.hits += 1
+                return doc
+
+            # A new version of the same file makes older handles stale
+            for stale in [v for v in self._documents if v[0] == version[0]]:
+                self._documents.pop(stale).close()
+
+            doc = opener()
+            self.opens += 1
+            self._documents[version] = doc
+            while len(self._documents) > self.max_documents:
+                _, evicted = self._documents.popitem(last=False)
+                evicted.close()
+            return doc
+
+    def discard(self, path):
+        """Close the open handles of a local PDF, before its file is removed"""
+        with MUPDF_LOCK, self._lock:
+            for version in [v for v in self._documents if v[0] == str(path)]:
+                self._documents.pop(version).close()
+
+    def clear(self):
+        with self._lock:
+            for doc in self._documents.values():
+                doc.close()
+            self._documents.clear()
+            self.hits = 0
+            self.opens = 0
+
+
+class PageRasterCache:
+    """
+    Memory-bounded LRU cache of rendered page images keyed by (version, page, dpi).
+
+    Entries are (PIL Image, page_width, page_height) tuples as returned by
+    render_pdf_page. Cached images are shared between callers and must not be
+    modified in place.
+    """
+
+    def __init__(self, max_bytes: int = RASTER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.renders = 0
+        self._images = OrderedDict()
+        self._seen = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get(self, key: Tuple) -> Optional[Tuple]:
+        with self._lock:
+            entry = self._images.get(key)
+            if entry is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def put(self, key: Tuple, img, page_width: float, page_height: float):
+        size = _image_bytes(img)
+        with self._lock:
+            self.renders += 1
+            if size > self.max_bytes:
+                return
+            old = self._images.pop(key, None)
+            if old is not None:
+                self._total_bytes -= _image_bytes(old[0])
+            self._images[key] = (img, page_width, page_height)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._total_bytes -= _image_bytes(evicted[0])
+
+    def mark_seen(self, key: Tuple) -> bool:
+        """
+        Record a request for a page and report whether it was requested before.
+
+        Used to rasterize a page in full only once it is hot, so one-off crops
+        stay on the cheaper clip path.
+        """
+        with self._lock:
+            seen = key in self._seen
+            self._seen[key] = True
+            self._seen.move_to_end(key)
+            while len(self._seen) > RASTER_SEEN_MAX_KEYS:
+                self._seen.popitem(last=False)
+            return seen
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._seen.clear()
+            self._total_bytes = 0
+            self.hits = 0
+            self.renders = 0
+
+
+document_cache = DocumentCache()
+page_raster_cache = PageRasterCache()
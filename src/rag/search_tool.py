@@ -1,11 +1,16 @@
 import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 import boto3
 from dotenv import load_dotenv
 import strands
+from src.rag.chunk_index import chunk_index
+from src.rag.chunk_shards import chunk_shard_reader
+from src.rag.deferred_images import CHUNK_IMAGE_ENDPOINT, build_chunk_image_url, deferred_images_configured
 from src.rag.visual_grounding_helper import (
     extract_chunk_id_from_markdown,
-    extract_chunk_image 
+    extract_chunk_images
 )
 _ = load_dotenv()
 
@@ -16,6 +21,99 @@ session = boto3.Session(
 )
 s3_client = session.client("s3")
 
+# Chunk metadata fetches run on a shared, bounded pool and crops go through the
+# batch chunk-image API, so grounding for all results of a query overlaps
+# instead of running one result after another
+GROUNDING_MAX_WORKERS = int(os.getenv("GROUNDING_MAX_WORKERS", "8"))
+GROUNDING_TIME_BUDGET_SECONDS = float(os.getenv("GROUNDING_TIME_BUDGET_SECONDS", "8"))
+
+# Only the results that make the final cut are grounded: the first
+# SEARCH_GROUNDED_RESULTS get a cropped image, the rest up to
+# SEARCH_MAX_RESULTS are returned with page/bbox metadata only
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "2"))
+SEARCH_GROUNDED_RESULTS = int(os.getenv("SEARCH_GROUNDED_RESULTS", "2"))
+
+# "eager" renders crops before answering; "deferred" returns stable image
+# endpoint URLs and leaves rendering to the first GET (needs CHUNK_IMAGE_ENDPOINT)
+GROUNDING_MODE_EAGER = "eager"
+GROUNDING_MODE_DEFERRED = "deferred"
+GROUNDING_MODE = os.getenv("GROUNDING_MODE", GROUNDING_MODE_EAGER).lower()
+if GROUNDING_MODE == GROUNDING_MODE_DEFERRED and not deferred_images_configured():
+    # Unsigned image URLs would let anyone render and store arbitrary crops
+    print("GROUNDING_MODE=deferred needs CHUNK_IMAGE_ENDPOINT and CHUNK_IMAGE_URL_SECRET; rendering crops eagerly")
+    GROUNDING_MODE = GROUNDING_MODE_EAGER
+
+_grounding_executor = ThreadPoolExecutor(
+    max_workers=GROUNDING_MAX_WORKERS,
+    thread_name_prefix="grounding"
+)
+
+
+def _run_grounding_tasks(tasks, deadline):
+    """
+    Run grounding tasks concurrently and collect their results in input order.
+    
+    Args:
+        tasks: List of (callable, kwargs) tuples
+        deadline: time.monotonic() value after which unfinished tasks are dropped
+    
+    Returns:
+        List of results aligned with tasks; None for tasks that failed or missed the deadline
+    """
+    if not tasks:
+        return []
+    
+    futures = [_grounding_executor.submit(fn, **kwargs) for fn, kwargs in tasks]
+    done, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+    
+    for future in not_done:
+        # Queued tasks are skipped; already running ones finish in the background
+        future.cancel()
+    if not_done:
+        print(f"Grounding time budget exceeded, dropped {len(not_done)} of {len(futures)} tasks")
+    
+    results = []
+    for future in futures:
+        if future in done and future.exception() is None:
+            results.append(future.result())
+        else:
+            results.append(None)
+    return results
+
+
+def _fetch_chunk_metadata(bucket: str, source_uri: str):
+    """Download and parse the chunk JSON file a retrieval result points at."""
+    chunk_key = source_uri.replace(f"s3://{bucket}/", "")
+    chunk_response = s3_client.get_object(Bucket=bucket, Key=chunk_key)
+    return json.loads(chunk_response['Body'].read().decode('utf-8'))
+
+
+def _read_chunk_record(bucket: str, hit: dict):
+    """
+    Chunk record of a hit the metadata index does not know.
+
+    The record is read from the document's chunk shards with a Range GET;
+    chunk file hits fall back to their per-chunk JSON file.
+
+    Returns:
+        (record or None, True if it came from the shards, which the deferred
+        image endpoint can verify too)
+    """
+    if hit["is_chunk_file"]:
+        # "<source_document>_<chunk_id>.json"; ADE chunk ids have no underscores
+        source_document, _, chunk_id = hit["source_file"][:-len(".json")].rpartition("_")
+    else:
+        # A markdown hit of "<source_document>.md" with a chunk anchor
+        source_document, chunk_id = hit["source_file"].rsplit(".", 1)[0], hit["anchor_id"]
+    record = None
+    if source_document and chunk_id:
+        record = chunk_shard_reader.read_chunk(s3_client, bucket, source_document, chunk_id)
+    if record is not None:
+        return record, True
+    if hit["is_chunk_file"]:
+        return _fetch_chunk_metadata(bucket, hit["source_uri"]), False
+    return None, False
+
 
 @strands.tool
 def search_knowledge_base(query: str) -> str:
@@ -41,81 +139,135 @@ def search_knowledge_base(query: str) -> str:
         
         raw_results = response.get("retrievalResults", [])
         sorted_results = sorted(raw_results, key=lambda x: x.get("score", 0), reverse=True)
+        deadline = time.monotonic() + GROUNDING_TIME_BUDGET_SECONDS
         
-        results = []
-        seen_chunk_ids = set()  
-
-        # 2. For each result, get the location and check if this is a chunk JSON file from budget_chunks folder
+        # 1. Get the location of each result and check if it is a chunk JSON file from budget_chunks folder
+        hits = []
         for result in sorted_results:
-            content = result.get("content", {}).get("text", "")
-            score = result.get("score", 0)
-            location = result.get("location", {})
-            
-            s3_location = location.get("s3Location", {})
+            s3_location = result.get("location", {}).get("s3Location", {})
             source_uri = s3_location.get("uri", "")
             source_file = source_uri.split("/")[-1] if source_uri else "Unknown source"
+            hits.append({
+                "content": result.get("content", {}).get("text", ""),
+                "score": result.get("score", 0),
+                "source_uri": source_uri,
+                "source_file": source_file,
+                "is_chunk_file": source_file.endswith('.json') and 'chunks' in source_uri
+            })
+        
+        # 2. Look up chunk metadata in the in-memory index; read the chunks it
+        # does not know yet from their shards or chunk files, all at once
+        chunk_index.ensure_loaded(s3_client, bucket)
+        missing_hits = []
+        for hit in hits:
+            if hit["is_chunk_file"]:
+                hit["chunk_data"] = chunk_index.get_by_file(hit["source_file"])
+            else:
+                # Not a chunk file, try to extract chunk ID from markdown
+                hit["anchor_id"] = extract_chunk_id_from_markdown(hit["content"])
+                hit["chunk_data"] = chunk_index.get(hit["anchor_id"]) if hit["anchor_id"] else None
+            # Deferred image links only for chunks the image endpoint can look up
+            hit["deferrable"] = hit["chunk_data"] is not None
+            if hit["chunk_data"] is None and (hit["is_chunk_file"] or hit["anchor_id"]):
+                missing_hits.append(hit)
+        chunk_metadata = _run_grounding_tasks(
+            [(_read_chunk_record, {"bucket": bucket, "hit": hit}) for hit in missing_hits],
+            deadline
+        )
+        for hit, fetched in zip(missing_hits, chunk_metadata):
+            hit["chunk_data"], hit["deferrable"] = fetched or (None, False)
+        
+        # 3. Dedupe in score order, exactly as the results will be listed
+        entries = []
+        seen_chunk_ids = set()  
+        for hit in hits:
+            entry = dict(hit, chunk_id=None, chunk_type="text", page=None, bbox=None, source_document=None)
             
-            chunk_id = None
-            visual_info = None
-            cropped_image_url = None
-            chunk_type = "text"
-            page = None
-            bbox = None
-            source_document = None
-            
-            if source_file.endswith('.json') and 'chunks' in source_uri:
-                try:
-                    chunk_key = source_uri.replace(f"s3://{bucket}/", "")
-                    chunk_response = s3_client.get_object(Bucket=bucket, Key=chunk_key)
-                    chunk_data = json.loads(chunk_response['Body'].read().decode('utf-8'))
+            if hit["is_chunk_file"]:
+                chunk_data = hit.get("chunk_data")
+                if chunk_data is not None:
+                    entry["chunk_id"] = chunk_data.get('chunk_id', '')
+                    entry["chunk_type"] = chunk_data.get('chunk_type', 'text')
+                    entry["page"] = chunk_data.get('page', 0)
+                    entry["bbox"] = chunk_data.get('bbox', [0, 0, 1, 1])
+                    entry["source_document"] = chunk_data.get('source_document', '')
                     
-                    chunk_id = chunk_data.get('chunk_id', '')
-                    chunk_type = chunk_data.get('chunk_type', 'text')
-                    page = chunk_data.get('page', 0)
-                    bbox = chunk_data.get('bbox', [0, 0, 1, 1])
-                    source_document = chunk_data.get('source_document', '')
-                    
-                    text = chunk_data.get('text', content)
-                    
-                    if chunk_id and chunk_id in seen_chunk_ids:
+                    if entry["chunk_id"] and entry["chunk_id"] in seen_chunk_ids:
                         continue
-                    seen_chunk_ids.add(chunk_id)
-                    
-                    # Generate cropped chunk image
-                    if chunk_id and source_document:
-                        source_pdf_key = f"input/gov_data/{source_document}.pdf"
-                        try:
-                            s3_client.head_object(Bucket=bucket, Key=source_pdf_key)
-                            cropped_image_url = extract_chunk_image(
-                                s3_client=s3_client,
-                                bucket=bucket,
-                                source_pdf_key=source_pdf_key,
-                                bbox=bbox,
-                                page_num=page,
-                                chunk_id=chunk_id,
-                                source_document=source_document,
-                                highlight=True,
-                                padding=10
-                            )
-                        except:
-                            pass  
-                            
-                except Exception as e:
-                    pass
+                    seen_chunk_ids.add(entry["chunk_id"])
             else:
-                # Not a chunk file, try to extract chunk ID from markdown
-                chunk_id = extract_chunk_id_from_markdown(content)
-                if chunk_id and chunk_id in seen_chunk_ids:
+                entry["chunk_id"] = hit["anchor_id"]
+                if entry["chunk_id"] and entry["chunk_id"] in seen_chunk_ids:
+                    continue
+                if entry["chunk_id"]:
+                    seen_chunk_ids.add(entry["chunk_id"])
+                    # Ground the anchored chunk from the index or its shard
+                    chunk_data = hit.get("chunk_data")
+                    if chunk_data is not None:
+                        entry["chunk_type"] = chunk_data.get("chunk_type", "text")
+                        entry["page"] = chunk_data.get("page", 0)
+                        entry["bbox"] = chunk_data.get("bbox", [0, 0, 1, 1])
+                        entry["source_document"] = chunk_data.get("source_document", "")
+            
+            if not (entry["chunk_id"] and entry["page"] is not None):
+                # No visual grounding available - use content hash as unique ID
+                content_hash = hash(hit["content"][:200])  # Hash first 200 chars for uniqueness
+                if content_hash in seen_chunk_ids:
                     continue
-                if chunk_id:
-                    seen_chunk_ids.add(chunk_id)
+                seen_chunk_ids.add(content_hash)
+            
+            entries.append(entry)
+        
+        # 4. Keep only the results that will be returned, then render the cropped chunk
+        # images of the top ones concurrently; crops that miss the budget are dropped
+        entries = entries[:SEARCH_MAX_RESULTS]
+        crop_entries = [
+            e for e in entries[:SEARCH_GROUNDED_RESULTS]
+            if e["chunk_id"] and e["source_document"]
+        ]
+        chunk_requests = [
+            (e["source_document"], e["page"], e["bbox"], e["chunk_id"], e["chunk_type"])
+            for e in crop_entries
+        ]
+        if GROUNDING_MODE == GROUNDING_MODE_DEFERRED and deferred_images_configured(CHUNK_IMAGE_ENDPOINT):
+            deferred = [e["deferrable"] for e in crop_entries]
+        else:
+            deferred = [False] * len(crop_entries)
+        # Chunks only known from their per-chunk JSON are rendered now, since
+        # the image endpoint would reject them
+        eager_requests = [request for request, defer in zip(chunk_requests, deferred) if not defer]
+        eager_urls = iter(extract_chunk_images(
+            s3_client=s3_client,
+            bucket=bucket,
+            chunk_requests=eager_requests,
+            highlight=True,
+            padding=10,
+            max_workers=GROUNDING_MAX_WORKERS,
+            timeout=max(0.0, deadline - time.monotonic())
+        ) if eager_requests else [])
+        cropped_image_urls = [
+            build_chunk_image_url(*request, endpoint=CHUNK_IMAGE_ENDPOINT) if defer else next(eager_urls)
+            for request, defer in zip(chunk_requests, deferred)
+        ]
+        for entry, cropped_image_url in zip(crop_entries, cropped_image_urls):
+            entry["cropped_image_url"] = cropped_image_url
+        
+        results = []
+        for entry in entries:
+            content = entry["content"]
+            score = entry["score"]
+            chunk_id = entry["chunk_id"]
+            page = entry["page"]
+            source_document = entry["source_document"]
+            source_file = entry["source_file"]
+            cropped_image_url = entry.get("cropped_image_url")
             
             if cropped_image_url and chunk_id and page is not None:
                 result_text = f"""
                 **Source:** {source_document or source_file} (Relevance: {score:.2f})
                 **Chunk ID:** {chunk_id}
                 **Page:** {page}
-                **Chunk Type:** {chunk_type}
+                **Chunk Type:** {entry["chunk_type"]}
                 **Cropped Chunk Image:** {cropped_image_url}
                 
                 **Content:**
@@ -123,31 +275,25 @@ def search_knowledge_base(query: str) -> str:
                 results.append(result_text)
             elif chunk_id and page is not None:
                 # Partial visual info (no image but has metadata)
+                bbox = entry["bbox"]
                 result_text = f"""
                 **Source:** {source_document or source_file} (Relevance: {score:.2f})
                 **Chunk ID:** {chunk_id}
                 **Page:** {page}
-                **Chunk Type:** {chunk_type}
+                **Chunk Type:** {entry["chunk_type"]}
                 **Bbox:** {bbox if bbox else 'Not available'}
                 
                 **Content:**
                 {content}"""
                 results.append(result_text)
             else:
-                # No visual grounding available - use content hash as unique ID
-                content_hash = hash(content[:200])  # Hash first 200 chars for uniqueness
-                if content_hash in seen_chunk_ids:
-                    continue
-                seen_chunk_ids.add(content_hash)
-                
                 clean_source = source_file.replace('_grounding.json', '').replace('.json', '').replace('.md', '')
                 result_text = f"""**Source:** {clean_source} (Relevance: {score:.2f})
                                 **Content:**{content}"""
                 results.append(result_text)
         
         if results:
-            # Return only top 2 most relevant results with visual references
-            return "\n\n---\n\n".join(results[:2])
+            return "\n\n---\n\n".join(results)
         else:
             return f"No documents found for query: '{query}'. The knowledge base may be empty or still processing."
             
@@ -158,4 +304,4 @@ def search_knowledge_base(query: str) -> str:
         elif "ValidationException" in error_msg:
             return f"Error: Invalid query or configuration. Details: {error_msg}"
         else:
-            return f"Error searching knowledge base: {error_msg}"
\ No newline at end of file
+            return f"Error searching knowledge base: {error_msg}"
@@ -3,11 +3,26 @@ Visual Grounding Helper Functions
 Utilities for creating annotated images with bounding boxes from document chunks
 """
 
+import os
 import json
 import boto3
 from typing import Dict, List, Optional, Tuple
 import io
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from pathlib import Path
+try:
+    from src.rag.grounding_manifest import grounding_manifest, presigned_url_cache
+    from src.rag.image_encoding import ANNOTATION_IMAGE_PROFILE, CHUNK_IMAGE_PROFILE, EncodingProfile, encode_image
+    from src.rag.pdf_cache import pdf_cache
+    from src.rag.render_cache import MUPDF_LOCK, document_cache, document_version, page_raster_cache
+except ImportError:
+    # Flat layout of the ingestion Lambda package
+    from grounding_manifest import grounding_manifest, presigned_url_cache
+    from image_encoding import ANNOTATION_IMAGE_PROFILE, CHUNK_IMAGE_PROFILE, EncodingProfile, encode_image
+    from pdf_cache import pdf_cache
+    from render_cache import MUPDF_LOCK, document_cache, document_version, page_raster_cache
 
 # Check if dynamic cropping dependencies are available
 try:
@@ -17,43 +32,296 @@ try:
 except ImportError:
     DYNAMIC_CROPPING_ENABLED = False
 
+# NumPy is optional and only used for annotation blending when enabled
+try:
+    import numpy as np
+    NUMPY_BLENDING_AVAILABLE = True
+except ImportError:
+    NUMPY_BLENDING_AVAILABLE = False
+NUMPY_BLENDING_ENABLED = NUMPY_BLENDING_AVAILABLE and os.getenv("ANNOTATION_NUMPY_BLENDING", "false").lower() == "true"
+
 # Constants
 CHUNK_IMAGES_PATH = "chunk_images"
+CHUNK_IMAGES_PREFIX = "output/budget_chunk_images/"
+SOURCE_PDF_KEY_TEMPLATE = "input/gov_data/{source_document}.pdf"
 DEFAULT_DPI = 150
 DEFAULT_PADDING = 20
 BOX_COLOR = "red"
 BOX_WIDTH = 3
+RENDER_MODE_CLIP = "clip"    # rasterize only the padded chunk region
+RENDER_MODE_FULL = "full"    # rasterize the whole page, then crop
+ANNOTATION_FILL_ALPHA = 30
+ANNOTATION_OUTLINE_WIDTH = 3
+
+# Define colors based on chunk type (matching ADE chunk types)
+CHUNK_TYPE_COLORS = {
+    "text": (40, 167, 69),           # Green
+    "table": (0, 123, 255),          # Blue  
+    "marginalia": (111, 66, 193),    # Purple
+    "figure": (255, 0, 255),         # Magenta
+    "logo": (144, 238, 144),         # Light green
+    "card": (255, 165, 0),           # Orange
+    "attestation": (0, 255, 255),    # Cyan
+    "scancode": (255, 193, 7),       # Yellow
+    "form": (220, 20, 60),           # Red
+    "tablecell": (173, 216, 230),    # Light blue
+    "default": (128, 128, 128)       # Gray for unknown types
+}
+
+
+def _open_pdf(pdf_source):
+    """Open a PDF from in-memory bytes or from a local file path"""
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return fitz.open(stream=pdf_source, filetype="pdf")
+    # Opening by path lets MuPDF read only the pages it needs from disk
+    return fitz.open(str(pdf_source))
+
+
+def _get_document(pdf_source):
+    """
+    Get an open document, reusing the cached handle for local files.
+    Must be called with MUPDF_LOCK held.
+    
+    Returns:
+        Tuple of (fitz.Document, owned) where owned documents must be closed by the caller
+    """
+    version = document_version(pdf_source)
+    if version is None:
+        return _open_pdf(pdf_source), True
+    return document_cache.get(version, lambda: _open_pdf(pdf_source)), False
 
 
-def render_pdf_page(pdf_bytes: bytes, page_num: int, dpi: int = 150):
+def render_pdf_page(pdf_source, page_num: int, dpi: int = 150):
     """
     Render a PDF page to PIL image.
     
     Args:
-        pdf_bytes: PDF file content as bytes
+        pdf_source: PDF file content as bytes, or path of a local PDF file
         page_num: Page number (0-indexed)
         dpi: Resolution for PDF rendering (default 150)
     
     Returns:
-        Tuple of (PIL Image, page_width, page_height) or (None, None, None) if disabled
+        Tuple of (PIL Image, page_width, page_height) or (None, None, None) if disabled.
+        Pages of local files are cached, so the image must not be modified in place.
     """
     if not DYNAMIC_CROPPING_ENABLED:
         return None, None, None
     
     try:
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        page = doc[page_num]
-        mat = fitz.Matrix(dpi/72.0, dpi/72.0)
-        pix = page.get_pixmap(matrix=mat)
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        page_width, page_height = page.rect.width, page.rect.height
-        doc.close()
+        version = document_version(pdf_source)
+        raster_key = (version, page_num, dpi)
+        if version is not None:
+            cached = page_raster_cache.get(raster_key)
+            if cached is not None:
+                return cached
+        
+        with MUPDF_LOCK:
+            doc, owned = _get_document(pdf_source)
+            try:
+                page = doc[page_num]
+                mat = fitz.Matrix(dpi/72.0, dpi/72.0)
+                pix = page.get_pixmap(matrix=mat)
+                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                page_width, page_height = page.rect.width, page.rect.height
+            finally:
+                if owned:
+                    doc.close()
+        
+        if version is not None:
+            page_raster_cache.put(raster_key, img, page_width, page_height)
         return img, page_width, page_height
     except Exception as e:
         print(f"Error rendering PDF page: {e}")
         return None, None, None
 
 
+def _chunk_crop_box(
+    bbox: List[float],
+    page_width: float,
+    page_height: float,
+    img_width: int,
+    img_height: int,
+    padding: int
+) -> Tuple[int, int, int, int]:
+    """
+    Pixel crop box of a normalized bbox on a page rendered at img_width x img_height.
+    
+    Returns:
+        Tuple of (crop_x0, crop_y0, crop_x1, crop_y1) clamped to the rendered page
+    """
+    # Extract normalized bbox coordinates (0-1 range)
+    norm_x0, norm_y0, norm_x1, norm_y1 = bbox
+    
+    # Convert normalized coordinates to PDF points
+    pdf_x0 = norm_x0 * page_width
+    pdf_y0 = norm_y0 * page_height
+    pdf_x1 = norm_x1 * page_width
+    pdf_y1 = norm_y1 * page_height
+    
+    # Scale PDF points to image pixels
+    scale_x = img_width / page_width
+    scale_y = img_height / page_height
+    
+    # Apply scaling and padding
+    crop_x0 = max(0, int(pdf_x0 * scale_x) - padding)
+    crop_y0 = max(0, int(pdf_y0 * scale_y) - padding)
+    crop_x1 = min(img_width, int(pdf_x1 * scale_x) + padding)
+    crop_y1 = min(img_height, int(pdf_y1 * scale_y) + padding)
+    
+    return crop_x0, crop_y0, crop_x1, crop_y1
+
+
+def render_chunk_region(
+    pdf_source,
+    page_num: int,
+    bbox: List[float],
+    padding: int = 10,
+    dpi: int = DEFAULT_DPI,
+    mode: str = RENDER_MODE_CLIP
+):
+    """
+    Render the padded region of a chunk on a PDF page.
+    
+    In clip mode only the region is rasterized, using the pixel grid of the
+    full-page render, so the result matches cropping render_pdf_page output
+    pixel for pixel. Pages requested more than once are rasterized in full
+    and cached instead, so further crops from them share one render.
+    
+    Args:
+        pdf_source: PDF file content as bytes, or path of a local PDF file
+        page_num: Page number (0-indexed)
+        bbox: [x0, y0, x1, y1] in NORMALIZED coordinates (0-1 range)
+        padding: Extra pixels around bbox (default 10)
+        dpi: Resolution for PDF rendering (default 150)
+        mode: RENDER_MODE_CLIP or RENDER_MODE_FULL
+    
+    Returns:
+        Cropped PIL Image or None if rendering failed or is disabled
+    """
+    if not DYNAMIC_CROPPING_ENABLED:
+        return None
+    
+    if mode == RENDER_MODE_CLIP:
+        try:
+            version = document_version(pdf_source)
+            if version is not None:
+                raster_key = (version, page_num, dpi)
+                if page_raster_cache.get(raster_key) is not None or page_raster_cache.mark_seen(raster_key):
+                    return render_chunk_region(pdf_source, page_num, bbox, padding, dpi, RENDER_MODE_FULL)
+            
+            with MUPDF_LOCK:
+                doc, owned = _get_document(pdf_source)
+                page = doc[page_num]
+                if page.rotation:
+                    # Clip rectangles on rotated pages do not map 1:1 to the page grid
+                    if owned:
+                        doc.close()
+                    return render_chunk_region(pdf_source, page_num, bbox, padding, dpi, RENDER_MODE_FULL)
+                
+                scale = dpi/72.0
+                mat = fitz.Matrix(scale, scale)
+                page_rect = (page.rect * mat).irect
+                crop_x0, crop_y0, crop_x1, crop_y1 = _chunk_crop_box(
+                    bbox, page.rect.width, page.rect.height, page_rect.width, page_rect.height, padding
+                )
+                
+                # One extra pixel on each side so MuPDF's rounding never cuts the region short
+                clip = fitz.Rect((crop_x0 - 1) / scale, (crop_y0 - 1) / scale, (crop_x1 + 1) / scale, (crop_y1 + 1) / scale)
+                # Images are resampled relative to the clip, so take whole images to keep their pixels identical
+                for image_info in page.get_image_info():
+                    image_rect = fitz.Rect(image_info["bbox"])
+                    if image_rect.intersects(clip):
+                        clip |= image_rect
+                
+                pix = page.get_pixmap(matrix=mat, clip=clip)
+                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                if owned:
+                    doc.close()
+            return img.crop((crop_x0 - pix.x, crop_y0 - pix.y, crop_x1 - pix.x, crop_y1 - pix.y))
+        except Exception as e:
+            print(f"Error rendering chunk region: {e}")
+            return None
+    
+    img, page_width, page_height = render_pdf_page(pdf_source, page_num, dpi)
+    if img is None:
+        return None
+    return img.crop(_chunk_crop_box(bbox, page_width, page_height, img.width, img.height, padding))
+
+
+def chunk_image_key(
+    source_document: str,
+    chunk_id: str,
+    profile: EncodingProfile = CHUNK_IMAGE_PROFILE,
+    chunk_type: str = "text"
+) -> str:
+    """S3 key of the cropped image of a chunk; the encoding profile is part of the key"""
+    return f"{CHUNK_IMAGES_PREFIX}{source_document}_{chunk_id}{profile.key_suffix(chunk_type)}"
+
+
+def render_chunk_image(
+    pdf_source,
+    page_num: int,
+    bbox: List[float],
+    highlight: bool = True,
+    padding: int = 10,
+    render_mode: str = RENDER_MODE_CLIP,
+    profile: EncodingProfile = CHUNK_IMAGE_PROFILE,
+    chunk_type: str = "text"
+) -> Optional[bytes]:
+    """
+    Render the cropped image of a chunk, encoded with an encoding profile.
+    
+    Args:
+        pdf_source: PDF file content as bytes, or path of a local PDF file
+        page_num: Page number (0-indexed)
+        bbox: [x0, y0, x1, y1] in NORMALIZED coordinates; the full page is rendered if missing
+        highlight: Add red border around chunk (default True)
+        padding: Extra pixels around bbox (default 10)
+        render_mode: RENDER_MODE_CLIP or RENDER_MODE_FULL
+        profile: Output encoding (format, quality, pixel budget, grayscale)
+        chunk_type: Chunk type, used by grayscale profiles
+    
+    Returns:
+        Encoded image bytes or None if rendering failed
+    """
+    # If no bbox or invalid bbox, return full page
+    if not bbox or len(bbox) != 4:
+        img, _, _ = render_pdf_page(pdf_source, page_num)
+        if img is None:
+            return None
+        return encode_image(img, profile, chunk_type)
+    
+    # Render the chunk region only
+    chunk_img = render_chunk_region(pdf_source, page_num, bbox, padding, mode=render_mode)
+    if chunk_img is None:
+        return None
+    
+    # Add red border highlight
+    if highlight:
+        draw = ImageDraw.Draw(chunk_img)
+        draw.rectangle(
+            [padding, padding, chunk_img.width - padding - 1, chunk_img.height - padding - 1],
+            outline="red",
+            width=3
+        )
+    
+    return encode_image(chunk_img, profile, chunk_type)
+
+
+def _presign_urls(s3_client, bucket: str, keys: List[str]) -> Dict[str, str]:
+    """Presigned GET URLs for many keys, reusing cached ones that are not about to expire"""
+    return presigned_url_cache.get_many(s3_client, bucket, keys)
+
+
+def _get_source_pdf(s3_client, bucket: str, source_pdf_key: str) -> Path:
+    """Local path of a source PDF, validated against the manifest ETag when it is known"""
+    expected_etag = grounding_manifest.pdf_etag(s3_client, bucket, source_pdf_key)
+    pdf_path = pdf_cache.get_path(s3_client, bucket, source_pdf_key, expected_etag=expected_etag)
+    if expected_etag is None:
+        grounding_manifest.add_pdf(bucket, source_pdf_key, pdf_cache.get_etag(bucket, source_pdf_key))
+    return pdf_path
+
+
 def extract_chunk_image(
     s3_client,
     bucket: str,
@@ -63,7 +331,10 @@ def extract_chunk_image(
     chunk_id: str,
     source_document: str,
     highlight: bool = True,
-    padding: int = 10
+    padding: int = 10,
+    render_mode: str = RENDER_MODE_CLIP,
+    profile: EncodingProfile = CHUNK_IMAGE_PROFILE,
+    chunk_type: str = "text"
 ) -> Optional[str]:
     """
     Dynamically extract and crop a specific chunk from PDF stored in S3.
@@ -78,6 +349,10 @@ def extract_chunk_image(
         source_document: Document name without extension
         highlight: Add red border around chunk (default True)
         padding: Extra pixels around bbox (default 10)
+        render_mode: RENDER_MODE_CLIP rasterizes only the chunk region,
+            RENDER_MODE_FULL renders the whole page and crops it
+        profile: Output encoding (format, quality, pixel budget, grayscale)
+        chunk_type: Chunk type, used by grayscale profiles
     
     Returns:
         S3 presigned URL of the cropped chunk image or None
@@ -87,229 +362,364 @@ def extract_chunk_image(
         return None
     
     try:
-        # Check if chunk image already exists
-        image_key = f"output/budget_chunk_images/{source_document}_{chunk_id}.png"
+        # Check if chunk image already exists (manifest first, S3 only for unknown keys)
+        image_key = chunk_image_key(source_document, chunk_id, profile, chunk_type)
+        if grounding_manifest.has_image(s3_client, bucket, image_key):
+            return _presign_urls(s3_client, bucket, [image_key])[image_key]
         try:
             s3_client.head_object(Bucket=bucket, Key=image_key)
             # Image exists, return presigned URL
-            presigned_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': bucket, 'Key': image_key},
-                ExpiresIn=3600
-            )
-            return presigned_url
+            grounding_manifest.add_images(bucket, [image_key])
+            grounding_manifest.maybe_flush(s3_client, bucket)
+            return _presign_urls(s3_client, bucket, [image_key])[image_key]
         except:
             pass  # Image doesn't exist, create it
         
-        # Download PDF from S3
-        response = s3_client.get_object(Bucket=bucket, Key=source_pdf_key)
-        pdf_bytes = response['Body'].read()
-        
-        # Render the PDF page
-        img, page_width, page_height = render_pdf_page(pdf_bytes, page_num)
+        # Get PDF from the local cache (downloaded from S3 only if missing or changed)
+        pdf_path = _get_source_pdf(s3_client, bucket, source_pdf_key)
         
-        if img is None:
+        image_data = render_chunk_image(pdf_path, page_num, bbox, highlight, padding, render_mode, profile, chunk_type)
+        if image_data is None:
             return None
         
-        # If no bbox or invalid bbox, return full page
-        if not bbox or len(bbox) != 4:
-            img_bytes = io.BytesIO()
-            img.save(img_bytes, format='PNG')
-            img_bytes.seek(0)
-            image_data = img_bytes.getvalue()
-        else:
-            # Extract normalized bbox coordinates (0-1 range)
-            norm_x0, norm_y0, norm_x1, norm_y1 = bbox
-            
-            # Convert normalized coordinates to PDF points
-            pdf_x0 = norm_x0 * page_width
-            pdf_y0 = norm_y0 * page_height
-            pdf_x1 = norm_x1 * page_width
-            pdf_y1 = norm_y1 * page_height
-            
-            # Scale PDF points to image pixels
-            scale_x = img.width / page_width
-            scale_y = img.height / page_height
-            
-            # Apply scaling and padding
-            crop_x0 = max(0, int(pdf_x0 * scale_x) - padding)
-            crop_y0 = max(0, int(pdf_y0 * scale_y) - padding)
-            crop_x1 = min(img.width, int(pdf_x1 * scale_x) + padding)
-            crop_y1 = min(img.height, int(pdf_y1 * scale_y) + padding)
-            
-            # Crop to chunk region
-            chunk_img = img.crop((crop_x0, crop_y0, crop_x1, crop_y1))
-            
-            # Add red border highlight
-            if highlight:
-                draw = ImageDraw.Draw(chunk_img)
-                draw.rectangle(
-                    [padding, padding, chunk_img.width - padding - 1, chunk_img.height - padding - 1],
-                    outline="red",
-                    width=3
-                )
-            
-            # Convert to PNG bytes
-            img_bytes = io.BytesIO()
-            chunk_img.save(img_bytes, format='PNG')
-            img_bytes.seek(0)
-            image_data = img_bytes.getvalue()
-        
         # Upload to S3
         s3_client.put_object(
             Bucket=bucket,
             Key=image_key,
             Body=image_data,
-            ContentType='image/png'
+            ContentType=profile.content_type
         )
+        grounding_manifest.add_images(bucket, [image_key])
+        grounding_manifest.maybe_flush(s3_client, bucket)
         
         # Generate presigned URL
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket, 'Key': image_key},
-            ExpiresIn=3600
-        )
-        
-        return presigned_url
+        return _presign_urls(s3_client, bucket, [image_key])[image_key]
         
     except Exception as e:
         print(f"Error extracting chunk image: {e}")
         return None
 
 
-def create_annotated_image_from_pdf(
-    pdf_bytes: bytes,
+def _render_page_group(
+    s3_client,
+    bucket: str,
+    source_pdf_key: str,
     page_num: int,
-    bounding_boxes: List[Dict],
+    group: List[Tuple[str, List[float], str]],
+    highlight: bool,
+    padding: int,
+    render_mode: str,
+    profile: EncodingProfile
+) -> List[Tuple[str, Optional[bytes]]]:
+    """Render all crops of one PDF page, rasterizing the page once when it has several"""
+    pdf_path = _get_source_pdf(s3_client, bucket, source_pdf_key)
+    if len(group) > 1:
+        # Fills the page raster cache, every crop below is cut from the same render
+        render_pdf_page(pdf_path, page_num)
+        render_mode = RENDER_MODE_FULL
+    return [
+        (image_key, render_chunk_image(pdf_path, page_num, bbox, highlight, padding, render_mode, profile, chunk_type))
+        for image_key, bbox, chunk_type in group
+    ]
+
+
+def extract_chunk_images(
+    s3_client,
+    bucket: str,
+    chunk_requests: List[Tuple],
+    source_pdf_key_template: str = SOURCE_PDF_KEY_TEMPLATE,
+    highlight: bool = True,
+    padding: int = 10,
+    render_mode: str = RENDER_MODE_CLIP,
+    max_workers: int = 8,
+    timeout: Optional[float] = None,
+    profile: EncodingProfile = CHUNK_IMAGE_PROFILE
+) -> List[Optional[str]]:
+    """
+    Batch counterpart of extract_chunk_image.
+    
+    Requests are grouped by PDF and page: each PDF is fetched once, each page
+    with several crops is rendered once, and uploads run in parallel.
+    
+    Args:
+        s3_client: Boto3 S3 client
+        bucket: S3 bucket name
+        chunk_requests: List of (source_document, page_num, bbox, chunk_id) tuples,
+            optionally with a fifth chunk_type element (default "text")
+        source_pdf_key_template: S3 key of a source PDF, formatted with source_document
+        highlight: Add red border around chunks (default True)
+        padding: Extra pixels around bbox (default 10)
+        render_mode: RENDER_MODE_CLIP or RENDER_MODE_FULL for single crops on a page
+        max_workers: Size of the thread pool for S3 I/O and rendering
+        timeout: Optional seconds after which unfinished crops are dropped
+        profile: Output encoding (format, quality, pixel budget, grayscale)
+    
+    Returns:
+        List of presigned URLs aligned with chunk_requests, None where a crop failed or timed out
+    """
+    if not chunk_requests:
+        return []
+    if not DYNAMIC_CROPPING_ENABLED:
+        print("Dynamic cropping disabled. Install PyMuPDF and Pillow.")
+        return [None] * len(chunk_requests)
+    
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+    
+    chunk_requests = [tuple(request) + ("text",) * (5 - len(request)) for request in chunk_requests]
+    image_keys = [
+        chunk_image_key(doc, chunk_id, profile, chunk_type)
+        for doc, _, _, chunk_id, chunk_type in chunk_requests
+    ]
+    requests_by_key = {}
+    for image_key, request in zip(image_keys, chunk_requests):
+        requests_by_key.setdefault(image_key, request)
+    
+    ready_keys = {
+        image_key for image_key in requests_by_key
+        if grounding_manifest.has_image(s3_client, bucket, image_key)
+    }
+    found_keys = set()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chunk-images")
+    try:
+        # 1. Check which chunk images missing from the manifest already exist
+        head_futures = {
+            executor.submit(s3_client.head_object, Bucket=bucket, Key=image_key): image_key
+            for image_key in requests_by_key if image_key not in ready_keys
+        }
+        if head_futures:
+            done, _ = wait(head_futures, timeout=remaining())
+            found_keys.update(head_futures[f] for f in done if f.exception() is None)
+            ready_keys.update(found_keys)
+        
+        # 2. Group the missing ones by PDF and page
+        groups = {}
+        for image_key, (source_document, page_num, bbox, _, chunk_type) in requests_by_key.items():
+            if image_key in ready_keys:
+                continue
+            source_pdf_key = source_pdf_key_template.format(source_document=source_document)
+            groups.setdefault((source_pdf_key, page_num), []).append((image_key, bbox, chunk_type))
+        
+        # 3. Render each page group, uploading its crops as soon as the group is done
+        render_futures = [
+            executor.submit(
+                _render_page_group, s3_client, bucket, source_pdf_key, page_num,
+                group, highlight, padding, render_mode, profile
+            )
+            for (source_pdf_key, page_num), group in groups.items()
+        ]
+        upload_futures = {}
+        try:
+            for future in as_completed(render_futures, timeout=remaining()):
+                if future.exception() is not None:
+                    print(f"Error rendering chunk images: {future.exception()}")
+                    continue
+                for image_key, image_data in future.result():
+                    if image_data is None:
+                        continue
+                    upload = executor.submit(
+                        s3_client.put_object,
+                        Bucket=bucket,
+                        Key=image_key,
+                        Body=image_data,
+                        ContentType=profile.content_type
+                    )
+                    upload_futures[upload] = image_key
+        except FuturesTimeoutError:
+            pass
+        
+        done, _ = wait(upload_futures, timeout=remaining())
+        for future in done:
+            if future.exception() is None:
+                ready_keys.add(upload_futures[future])
+                found_keys.add(upload_futures[future])
+            else:
+                print(f"Error uploading chunk image {upload_futures[future]}: {future.exception()}")
+    finally:
+        # Do not wait for work that missed the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    if found_keys:
+        grounding_manifest.add_images(bucket, found_keys)
+        grounding_manifest.maybe_flush(s3_client, bucket)
+    
+    # 4. Sign every available image in one pass
+    urls = _presign_urls(s3_client, bucket, sorted(ready_keys))
+    return [urls.get(image_key) for image_key in image_keys]
+
+
+def _annotation_box_pixels(bbox: Dict, img_width: int, img_height: int) -> Tuple[int, int, int, int]:
+    """Convert a normalized ADE box (left, top, right, bottom) to pixel coordinates"""
+    # Ensure coordinates are in 0-1 range
+    left = max(0, min(1, float(bbox.get('left', 0))))
+    top = max(0, min(1, float(bbox.get('top', 0))))
+    right = max(0, min(1, float(bbox.get('right', 1))))
+    bottom = max(0, min(1, float(bbox.get('bottom', 1))))
+    return (
+        int(left * img_width),
+        int(top * img_height),
+        int(right * img_width),
+        int(bottom * img_height)
+    )
+
+
+def annotate_page_image(img, boxes: List[Tuple[Tuple[int, int, int, int], Tuple[int, int, int]]], use_numpy: Optional[bool] = None):
+    """
+    Highlight boxes on a page image with one fill pass and one outline pass.
+    
+    All fills go into a single overlay that is blended once, so the cost no
+    longer grows with boxes x page pixels. Overlapping fills are tinted once
+    rather than darkening with every box.
+    
+    Args:
+        img: Page image; it is not modified
+        boxes: List of ((x1, y1, x2, y2) in pixels, RGB color) tuples
+        use_numpy: Blend with NumPy instead of one Pillow composite; defaults to
+            ANNOTATION_NUMPY_BLENDING (Pillow is usually faster on full pages)
+    
+    Returns:
+        New RGB image with the boxes drawn
+    """
+    use_numpy = NUMPY_BLENDING_ENABLED if use_numpy is None else use_numpy and NUMPY_BLENDING_AVAILABLE
+    img = img.convert('RGB')
+    
+    if boxes and use_numpy:
+        pixels = np.array(img)
+        fill = np.zeros_like(pixels)
+        mask = np.zeros(pixels.shape[:2], dtype=bool)
+        for (x1, y1, x2, y2), color in boxes:
+            fill[y1:y2 + 1, x1:x2 + 1] = color
+            mask[y1:y2 + 1, x1:x2 + 1] = True
+        # Blend only the rows and columns covered by boxes
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if rows.size:
+            region = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+            alpha = ANNOTATION_FILL_ALPHA
+            # Same rounding as Image.alpha_composite over an opaque page
+            blended = (fill[region].astype(np.uint16) * alpha + pixels[region].astype(np.uint16) * (255 - alpha) + 127) // 255
+            pixels[region] = np.where(mask[region][..., None], blended.astype(np.uint8), pixels[region])
+            img = Image.fromarray(pixels, 'RGB')
+    elif boxes:
+        overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
+        overlay_draw = ImageDraw.Draw(overlay)
+        for box, color in boxes:
+            overlay_draw.rectangle(box, fill=color + (ANNOTATION_FILL_ALPHA,))
+        img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
+    
+    # Draw rectangles with thick outline for visibility
+    draw = ImageDraw.Draw(img)
+    for box, color in boxes:
+        draw.rectangle(box, outline=color, width=ANNOTATION_OUTLINE_WIDTH)
+    return img
+
+
+def create_annotated_page_image(
+    pdf_source,
+    page_num: int,
+    chunks: List[Dict],
     output_s3_key: str,
     s3_client,
     bucket: str,
     dpi: int = 150,
-    chunk_type: str = "text"
-) -> str:
+    profile: EncodingProfile = ANNOTATION_IMAGE_PROFILE
+) -> Optional[str]:
     """
-    Create an annotated image from a PDF page with bounding boxes
+    Create one annotated image of a PDF page highlighting many chunks
     
     Args:
-        pdf_bytes: PDF file content as bytes
+        pdf_source: PDF file content as bytes, or path of a local PDF file
         page_num: Page number (1-indexed)
-        bounding_boxes: List of bounding box dictionaries with 'left', 'top', 'right', 'bottom'
+        chunks: List of dictionaries with 'boxes' (list of bounding boxes) or 'box',
+            and an optional 'chunk_type' for color coding
         output_s3_key: S3 key for the output annotated image
         s3_client: Boto3 S3 client
         bucket: S3 bucket name
         dpi: Resolution for PDF rendering
-        chunk_type: Type of chunk for color coding
+        profile: Output encoding (format, quality, pixel budget)
     
     Returns:
         S3 URL of the uploaded annotated image
     """
     try:
-        # Open PDF with PyMuPDF
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-        
         # Get the specific page (0-indexed in PyMuPDF)
-        page = pdf_document[page_num - 1] if page_num > 0 else pdf_document[page_num]
-        
-        # Render page to image at specified DPI
-        mat = fitz.Matrix(dpi/72.0, dpi/72.0)
-        pix = page.get_pixmap(matrix=mat)
-        img_data = pix.tobytes("png")
-        
-        # Open image with PIL
-        img = Image.open(io.BytesIO(img_data))
-        draw = ImageDraw.Draw(img)
+        page_index = page_num - 1 if page_num > 0 else page_num
+        img, _, _ = render_pdf_page(pdf_source, page_index, dpi)
+        if img is None:
+            return None
         
-        # Get image dimensions
-        img_width, img_height = img.size
+        boxes = []
+        for chunk in chunks:
+            chunk_type = chunk.get('chunk_type') or "text"
+            chunk_boxes = chunk.get('boxes') or [chunk.get('box')]
+            for bbox in chunk_boxes:
+                if bbox and 'left' in bbox:
+                    # A box may override the chunk type, e.g. table cells inside a table
+                    box_type = (bbox.get('chunk_type') or chunk_type).lower()
+                    rgb_color = CHUNK_TYPE_COLORS.get(box_type, CHUNK_TYPE_COLORS["default"])
+                    boxes.append((_annotation_box_pixels(bbox, img.width, img.height), rgb_color))
         
-        # Define colors based on chunk type (matching ADE chunk types)
-        CHUNK_TYPE_COLORS = {
-            "text": (40, 167, 69),           # Green
-            "table": (0, 123, 255),          # Blue  
-            "marginalia": (111, 66, 193),    # Purple
-            "figure": (255, 0, 255),         # Magenta
-            "logo": (144, 238, 144),         # Light green
-            "card": (255, 165, 0),           # Orange
-            "attestation": (0, 255, 255),    # Cyan
-            "scancode": (255, 193, 7),       # Yellow
-            "form": (220, 20, 60),           # Red
-            "tablecell": (173, 216, 230),    # Light blue
-            "default": (128, 128, 128)       # Gray for unknown types
-        }
-        # Get RGB color based on chunk type
-        rgb_color = CHUNK_TYPE_COLORS.get(chunk_type.lower(), CHUNK_TYPE_COLORS["default"])
-        
-        # Draw bounding boxes
-        for bbox in bounding_boxes:
-            if bbox and 'left' in bbox:
-                # The coordinates from ADE are normalized (0-1) relative to the PDF page
-                # Convert to pixel coordinates for the rendered image
-                left = float(bbox.get('left', 0))
-                top = float(bbox.get('top', 0))
-                right = float(bbox.get('right', 1))
-                bottom = float(bbox.get('bottom', 1))
-                
-                # Ensure coordinates are in 0-1 range
-                left = max(0, min(1, left))
-                top = max(0, min(1, top))
-                right = max(0, min(1, right))
-                bottom = max(0, min(1, bottom))
-                
-                # Convert to pixel coordinates
-                x1 = int(left * img_width)
-                y1 = int(top * img_height)
-                x2 = int(right * img_width)
-                y2 = int(bottom * img_height)
-                
-                # Draw rectangle with thick outline for visibility
-                draw.rectangle(
-                    [x1, y1, x2, y2],
-                    outline=rgb_color,
-                    width=3
-                )
-                
-                # Add semi-transparent overlay for better visibility
-                overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
-                overlay_draw = ImageDraw.Draw(overlay)
-                
-                # Create semi-transparent version of the RGB color
-                fill_color = rgb_color + (30,)  # Add alpha channel for transparency
-                
-                overlay_draw.rectangle(
-                    [x1, y1, x2, y2],
-                    fill=fill_color
-                )
-                img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
-        
-        # Save to bytes
-        img_bytes = io.BytesIO()
-        img.save(img_bytes, format='PNG')
-        img_bytes.seek(0)
+        annotated = annotate_page_image(img, boxes)
         
         # Upload to S3
         s3_client.put_object(
             Bucket=bucket,
             Key=output_s3_key,
-            Body=img_bytes.getvalue(),
-            ContentType='image/png'
+            Body=encode_image(annotated, profile, chunk_type="annotation"),
+            ContentType=profile.content_type
         )
         
-        pdf_document.close()
-        
         # Generate presigned URL for the image
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket, 'Key': output_s3_key},
-            ExpiresIn=3600  # URL valid for 1 hour
-        )
-        
-        return presigned_url
+        return _presign_urls(s3_client, bucket, [output_s3_key])[output_s3_key]
         
     except Exception as e:
         print(f"Error creating annotated image: {e}")
         return None
 
 
+def create_annotated_image_from_pdf(
+    pdf_source,
+    page_num: int,
+    bounding_boxes: List[Dict],
+    output_s3_key: str,
+    s3_client,
+    bucket: str,
+    dpi: int = 150,
+    chunk_type: str = "text",
+    profile: EncodingProfile = ANNOTATION_IMAGE_PROFILE
+) -> str:
+    """
+    Create an annotated image from a PDF page with bounding boxes
+    
+    Args:
+        pdf_source: PDF file content as bytes, or path of a local PDF file
+        page_num: Page number (1-indexed)
+        bounding_boxes: List of bounding box dictionaries with 'left', 'top', 'right', 'bottom'
+            and an optional per-box 'chunk_type'
+        output_s3_key: S3 key for the output annotated image
+        s3_client: Boto3 S3 client
+        bucket: S3 bucket name
+        dpi: Resolution for PDF rendering
+        chunk_type: Type of chunk for color coding
+        profile: Output encoding (format, quality, pixel budget)
+    
+    Returns:
+        S3 URL of the uploaded annotated image
+    """
+    return create_annotated_page_image(
+        pdf_source=pdf_source,
+        page_num=page_num,
+        chunks=[{"boxes": bounding_boxes, "chunk_type": chunk_type}],
+        output_s3_key=output_s3_key,
+        s3_client=s3_client,
+        bucket=bucket,
+        dpi=dpi,
+        profile=profile
+    )
+
+
 def get_or_create_annotated_image(
     s3_client,
     bucket: str,
@@ -336,31 +746,31 @@ def get_or_create_annotated_image(
     # Generate annotation key
     page_num = grounding_info.get('page', 1)
     clean_chunk_id = chunk_id.replace('<a id=', '').replace('></a>', '').strip('"')
-    annotation_key = f"annotations/{Path(source_pdf_key).stem}_p{page_num}_{clean_chunk_id}.png"
+    annotation_key = (
+        f"annotations/{Path(source_pdf_key).stem}_p{page_num}_{clean_chunk_id}"
+        f"{ANNOTATION_IMAGE_PROFILE.key_suffix('annotation')}"
+    )
     
-    # Check if annotation already exists
+    # Check if annotation already exists (manifest first, S3 only for unknown keys)
     if not force_recreate:
+        if grounding_manifest.has_image(s3_client, bucket, annotation_key):
+            return _presign_urls(s3_client, bucket, [annotation_key])[annotation_key]
         try:
             s3_client.head_object(Bucket=bucket, Key=annotation_key)
-            # Generate presigned URL for existing annotation
-            presigned_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': bucket, 'Key': annotation_key},
-                ExpiresIn=3600  # URL valid for 1 hour
-            )
-            return presigned_url
+            grounding_manifest.add_images(bucket, [annotation_key])
+            grounding_manifest.maybe_flush(s3_client, bucket)
+            return _presign_urls(s3_client, bucket, [annotation_key])[annotation_key]
         except:
             pass  # File doesn't exist, create it
     
-    # Download source PDF
+    # Get source PDF from the local cache
     try:
-        response = s3_client.get_object(Bucket=bucket, Key=source_pdf_key)
-        pdf_bytes = response['Body'].read()
+        pdf_path = _get_source_pdf(s3_client, bucket, source_pdf_key)
         
         # Create annotated image
         bbox = grounding_info.get('box', {})
         url = create_annotated_image_from_pdf(
-            pdf_bytes=pdf_bytes,
+            pdf_source=pdf_path,
             page_num=page_num,
             bounding_boxes=[bbox],
             output_s3_key=annotation_key,
@@ -368,6 +778,9 @@ def get_or_create_annotated_image(
             bucket=bucket,
             chunk_type=chunk_type
         )
+        if url:
+            grounding_manifest.add_images(bucket, [annotation_key])
+            grounding_manifest.maybe_flush(s3_client, bucket)
         
         return url
         
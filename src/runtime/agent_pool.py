@@ -0,0 +1,123 @@
+"""
+Agent Pool
+Keeps built agents of a warm Lambda container for reuse across requests of the same session
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+# Agents kept per container and seconds an unused agent stays in the pool
+AGENT_POOL_SIZE = int(os.environ.get("AGENT_POOL_SIZE", "16"))
+AGENT_IDLE_SECONDS = float(os.environ.get("AGENT_IDLE_SECONDS", "900"))
+
+
+class AgentPool:
+    """
+    Least-recently-used pool of agents keyed by session.
+
+    get() returns the pooled agent of a key, or builds one with the factory.
+    The pool holds at most max_size agents; the least recently used one is
+    evicted when it is full, and agents unused for idle_seconds are evicted
+    on the next access. on_evict(key, agent) is called for every agent that
+    leaves the pool, outside the pool lock.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[Hashable], object],
+        max_size: int = AGENT_POOL_SIZE,
+        idle_seconds: float = AGENT_IDLE_SECONDS,
+        clock=time.monotonic,
+        on_evict: Optional[Callable[[Hashable, object], None]] = None
+    ):
+        self.factory = factory
+        self.on_evict = on_evict
+        self.max_size = max(1, max_size)
+        self.idle_seconds = idle_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clock = clock
+        self._agents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def __contains__(self, key) -> bool:
+        return key in self._agents
+
+    def _evict_idle(self, now: float, evicted: list):
+        while self._agents:
+            key, (agent, last_used) = next(iter(self._agents.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            del self._agents[key]
+            evicted.append((key, agent))
+            self.evictions += 1
+
+    def _release(self, evicted: list):
+        if self.on_evict is None:
+            return
+        for key, agent in evicted:
+            try:
+                self.on_evict(key, agent)
+            except Exception as e:
+                print(f"Could not release agent of {key}: {e}")
+
+    def get(self, key: Hashable):
+        """Pooled agent of a key, built on first use"""
+        evicted = []
+        with self._lock:
+            now = self._clock()
+            self._evict_idle(now, evicted)
+            cached = self._agents.pop(key, None)
+            if cached is not None:
+                self._agents[key] = (cached[0], now)
+                self.hits += 1
+            else:
+                self.misses += 1
+        self._release(evicted)
+        if cached is not None:
+            return cached[0]
+
+        # Built outside the lock so other sessions are not held up
+        agent = self.factory(key)
+
+        evicted = []
+        with self._lock:
+            if key in self._agents:
+                # Another thread built the same session first; keep its agent
+                evicted.append((key, agent))
+                agent, _ = self._agents.pop(key)
+            self._agents[key] = (agent, self._clock())
+            while len(self._agents) > self.max_size:
+                old_key, (old_agent, _) = self._agents.popitem(last=False)
+                evicted.append((old_key, old_agent))
+                self.evictions += 1
+        self._release(evicted)
+        return agent
+
+    def discard(self, key: Hashable):
+        """Drop the agent of a key, e.g. after it failed mid-conversation"""
+        with self._lock:
+            cached = self._agents.pop(key, None)
+        if cached is not None:
+            self._release([(key, cached[0])])
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, agent) for key, (agent, _) in self._agents.items()]
+            self._agents.clear()
+        self._release(evicted)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._agents),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,91 @@
+"""
+Batch Queries
+Runs a list of independent questions concurrently and yields the answers in input order
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from src.rag.invoke import invoke_agent
+
+# Questions answered at the same time, unless a request asks for fewer
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+# Upper bounds a request cannot exceed
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_QUERIES = int(os.environ.get("BATCH_MAX_QUERIES", "100"))
+
+
+def parse_batch(body: Dict) -> Tuple[List[str], int]:
+    """
+    Queries and concurrency of a batch request body.
+
+    Raises:
+        ValueError: If queries is not a list of 1 to BATCH_MAX_QUERIES
+            non-empty strings, or concurrency is not a positive integer
+    """
+    queries = body.get("queries")
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("'queries' must be a non-empty list of strings")
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} queries per batch")
+    if not all(isinstance(query, str) and query.strip() for query in queries):
+        raise ValueError("'queries' must be a non-empty list of strings")
+
+    concurrency = body.get("concurrency", BATCH_CONCURRENCY)
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+        raise ValueError("'concurrency' must be a positive integer")
+    return queries, min(concurrency, BATCH_MAX_CONCURRENCY)
+
+
+def run_batch(queries: List[str], build_agent: Callable[[], object], concurrency: int = BATCH_CONCURRENCY) -> Iterator[Dict]:
+    """
+    Answer queries concurrently, yielding each result as soon as it and all before it are done.
+
+    Every worker thread builds one agent and clears its conversation between
+    questions, so questions do not see each other's answers while the model
+    client and caches behind the agents are shared.
+
+    Args:
+        queries: Questions, answered independently
+        build_agent: Builds an agent without memory; called once per worker
+        concurrency: Maximum questions in flight
+
+    Yields:
+        Dicts with index, query, response, error and seconds, in input order
+    """
+    workers = threading.local()
+
+    def answer(index: int, query: str) -> Dict:
+        start = time.perf_counter()
+        try:
+            agent = getattr(workers, "agent", None)
+            if agent is None:
+                agent = workers.agent = build_agent()
+            else:
+                agent.reset()
+            response, error = str(invoke_agent(agent, query)), None
+        except Exception as e:
+            # The agent may be mid-run; the next question gets a new one
+            workers.agent = None
+            response, error = None, str(e)
+        return {
+            "index": index,
+            "query": query,
+            "response": response,
+            "error": error,
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(queries))))
+    futures = [executor.submit(answer, index, query) for index, query in enumerate(queries)]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        # Stop questions that have not started when the caller stops reading
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
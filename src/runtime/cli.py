@@ -1,9 +1,27 @@
-from src.rag.budget_agent import BudgetAgent
+import json
+import time
+import asyncio
+import argparse
+
+from src.rag.budget_agent import BudgetAgent, get_shared_model
 from src.rag.memory import setup_memory
-from src.rag.invoke import invoke_agent
+from src.rag.invoke import invoke_agent, stream_agent
+from src.runtime.batch import BATCH_CONCURRENCY, run_batch
+
+
+async def stream_reply(agent, user_input: str):
+    """Print the answer as it is generated, with a line per tool call"""
+    async for event in stream_agent(agent, user_input):
+        if event["type"] == "token":
+            print(event["text"], end="", flush=True)
+        elif event["type"] == "tool_start":
+            print(f"\n[{event['tool']}...]", flush=True)
+        elif event["type"] == "tool_end":
+            print(f"[{event['tool']} {event['status']}]", flush=True)
+    print()
 
 
-def run_interactive_chat():
+def run_interactive_chat(stream: bool = True):
     session_manager = setup_memory()
     agent = BudgetAgent(session_manager)
 
@@ -17,12 +35,74 @@ def run_interactive_chat():
                 print("Ending session.")
                 break
 
-            response = invoke_agent(agent, user_input)
-            print(f"Agent: {response}\n")
+            if stream:
+                print("Agent: ", end="", flush=True)
+                asyncio.run(stream_reply(agent, user_input))
+                print()
+            else:
+                response = invoke_agent(agent, user_input)
+                print(f"Agent: {response}\n")
 
     except Exception as e:
         print(e)
 
 
+def read_queries(path: str):
+    """Questions of a file: one per line, or JSON lines with a query field"""
+    queries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                line = json.loads(line)["query"]
+            queries.append(line)
+    return queries
+
+
+def run_batch_file(path: str, concurrency: int = BATCH_CONCURRENCY, output: str = None):
+    """
+    Answer every question of a file concurrently, printing results in file order as they complete
+
+    Args:
+        path: File of questions, see read_queries
+        concurrency: Maximum questions in flight
+        output: Optional JSON lines file for the results
+    """
+    queries = read_queries(path)
+    model = get_shared_model()
+    start = time.perf_counter()
+    failed = 0
+
+    print(f"Running {len(queries)} queries, {concurrency} at a time\n")
+    out = open(output, "w") if output else None
+    try:
+        for result in run_batch(queries, lambda: BudgetAgent(None, model), concurrency):
+            print(f"[{result['index'] + 1}/{len(queries)}] {result['seconds']:.1f}s  {result['query']}")
+            if result["error"]:
+                failed += 1
+                print(f"Error: {result['error']}\n")
+            else:
+                print(f"Agent: {result['response']}\n")
+            if out:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        if out:
+            out.close()
+
+    print(f"{len(queries) - failed} answered, {failed} failed in {time.perf_counter() - start:.1f}s")
+
+
 if __name__ == "__main__":
-    run_interactive_chat()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Interactive budget agent chat")
+    parser.add_argument("--no-stream", action="store_true", help="Print each answer once it is complete")
+    parser.add_argument("--batch", metavar="FILE", help="Answer the questions of a file instead of chatting")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Batch questions in flight")
+    parser.add_argument("--output", metavar="FILE", help="Write batch results as JSON lines")
+    args = parser.parse_args()
+    if args.batch:
+        run_batch_file(args.batch, max(1, args.concurrency), args.output)
+    else:
+        run_interactive_chat(stream=not args.no_stream)
@@ -1,13 +1,120 @@
+import os
+import re
+import time
 import json
+import uuid
 import logging
 from src.rag.memory import setup_memory
-from src.rag.budget_agent import BudgetAgent
+from src.rag.budget_agent import BudgetAgent, get_shared_model
 from src.rag.invoke import invoke_agent
+from src.runtime.agent_pool import AGENT_POOL_SIZE, AgentPool
+from src.runtime.batch import BATCH_MAX_CONCURRENCY, parse_batch, run_batch
 
 # Configure CloudWatch logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Identifiers accepted for actor_id and session_id, a subset of what AgentCore memory allows
+ID_PATTERN = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9_-]{0,99}$")
+
+# API Gateway cuts requests off after 29 s, so a batch here must finish in one
+# round of concurrent questions; larger ones go to the stream handler or the CLI
+API_BATCH_MAX_QUERIES = int(os.environ.get("API_BATCH_MAX_QUERIES", "4"))
+
+# Built on first use and kept for the life of the warm container
+agent_pool = None
+
+
+def build_agent(key):
+    """Budget agent with the memory session of an (actor_id, session_id) key, on the shared model client"""
+    actor_id, session_id = key
+    return BudgetAgent(setup_memory(actor_id, session_id), get_shared_model())
+
+
+def build_batch_agent():
+    """Budget agent without memory for batch questions, on the shared model client"""
+    return BudgetAgent(None, get_shared_model())
+
+
+def close_session(key, agent):
+    """Flush the memory events an agent's session manager still buffers when it leaves the pool"""
+    session_manager = getattr(agent, "session_manager", None)
+    if session_manager is not None and hasattr(session_manager, "close"):
+        session_manager.close()
+
+
+def get_agent_pool():
+    # A session manager serves a single agent, so it is pooled with its agent
+    # and closed when the agent is evicted
+    global agent_pool
+    if agent_pool is None:
+        agent_pool = AgentPool(build_agent, max_size=AGENT_POOL_SIZE, on_evict=close_session)
+    return agent_pool
+
+
+def session_key(body):
+    """
+    (actor_id, session_id) of a request; new identifiers for the ones it leaves out.
+
+    Raises:
+        ValueError: If an identifier is not 1-100 letters, digits, '-' or '_',
+            or a session_id comes without the actor_id it belongs to
+    """
+    if body.get("session_id") and not body.get("actor_id"):
+        raise ValueError("Missing 'actor_id' for 'session_id'")
+    actor_id = body.get("actor_id") or f"user_{uuid.uuid4().hex[:12]}"
+    session_id = body.get("session_id") or f"session_{uuid.uuid4().hex}"
+    for name, value in (("actor_id", actor_id), ("session_id", session_id)):
+        if not isinstance(value, str) or not ID_PATTERN.match(value):
+            raise ValueError(f"Invalid '{name}': use 1-100 letters, digits, '-' or '_'")
+    return actor_id, session_id
+
+
+def batch_response(body):
+    """
+    Answer a batch request body: {"queries": [...], "concurrency": n}
+
+    At most API_BATCH_MAX_QUERIES queries are accepted, and they are all
+    answered at once so the response fits in the API Gateway timeout.
+    """
+    try:
+        queries = body.get("queries")
+        if isinstance(queries, list) and len(queries) > API_BATCH_MAX_QUERIES:
+            raise ValueError(
+                f"At most {API_BATCH_MAX_QUERIES} queries per API request; "
+                "stream larger batches from the stream handler or run `python -m src.runtime.cli --batch FILE`"
+            )
+        queries, concurrency = parse_batch(body)
+        concurrency = min(max(concurrency, len(queries)), BATCH_MAX_CONCURRENCY)
+    except ValueError as e:
+        logger.warning(f"Rejected batch: {e}")
+        return {
+            "statusCode": 400,
+            "headers": {
+                "Content-Type": "application/json",
+                "Access-Control-Allow-Origin": "*"
+            },
+            "body": json.dumps({"error": str(e)})
+        }
+
+    logger.info(f"Processing batch of {len(queries)} queries, {concurrency} at a time")
+    start = time.perf_counter()
+    results = list(run_batch(queries, build_batch_agent, concurrency))
+    failed = sum(1 for result in results if result["error"])
+
+    logger.info(f"Batch processed: {len(results) - failed} answered, {failed} failed")
+    return {
+        "statusCode": 200,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": json.dumps({
+            "results": results,
+            "total_seconds": round(time.perf_counter() - start, 3)
+        })
+    }
+
 
 def lambda_handler(event, context):
     """
@@ -18,6 +125,8 @@ def lambda_handler(event, context):
         
         # Parse request body
         body = json.loads(event.get("body", "{}"))
+        if "queries" in body:
+            return batch_response(body)
         user_input = body.get("query")
 
         if not user_input:
@@ -31,12 +140,32 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "Missing 'query' parameter in request body"})
             }
 
-        logger.info(f"Processing query: {user_input}")
+        try:
+            actor_id, session_id = session_key(body)
+        except ValueError as e:
+            logger.warning(f"Rejected request: {e}")
+            return {
+                "statusCode": 400,
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Origin": "*"
+                },
+                "body": json.dumps({"error": str(e)})
+            }
+
+        logger.info(f"Processing query: {user_input} (actor {actor_id}, session {session_id})")
         
-        # Initialize agent and process query
-        session_manager = setup_memory()
-        agent = BudgetAgent(session_manager)
-        response = invoke_agent(agent, user_input)
+        # Later turns of a session reuse the agent and memory session of its first turn
+        pool = get_agent_pool()
+        agent = pool.get((actor_id, session_id))
+        logger.info(f"Agent pool: {pool.stats()}")
+
+        try:
+            response = invoke_agent(agent, user_input)
+        except Exception:
+            # The conversation state of a failed run is not trusted for the next turn
+            pool.discard((actor_id, session_id))
+            raise
 
         logger.info("Query processed successfully")
         return {
@@ -45,7 +174,12 @@ def lambda_handler(event, context):
                 "Content-Type": "application/json",
                 "Access-Control-Allow-Origin": "*"
             },
-            "body": json.dumps({"response": response})
+            # The agent returns an AgentResult; its string form is the answer text
+            "body": json.dumps({
+                "response": str(response),
+                "actor_id": actor_id,
+                "session_id": session_id
+            })
         }
 
     except json.JSONDecodeError as e:
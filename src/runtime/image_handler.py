@@ -0,0 +1,106 @@
+import os
+import logging
+import boto3
+from src.rag import deferred_images
+from src.rag.chunk_index import chunk_index
+from src.rag.chunk_shards import chunk_shard_reader
+from src.rag.deferred_images import parse_chunk_image_request
+from src.rag.visual_grounding_helper import SOURCE_PDF_KEY_TEMPLATE, extract_chunk_image
+
+# Configure CloudWatch logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+s3_client = boto3.client("s3")
+
+# Browsers may reuse the redirect, but not past the presigned URL's lifetime
+REDIRECT_MAX_AGE_SECONDS = 300
+# Tolerance between a URL's bbox and the indexed one (float32 storage, 6-digit URLs)
+BBOX_TOLERANCE = 1e-4
+
+
+def _response(status_code: int, message: str, headers: dict = None):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "text/plain",
+            "Access-Control-Allow-Origin": "*",
+            **(headers or {})
+        },
+        "body": message
+    }
+
+
+def indexed_chunk(source_document: str, page_num: int, bbox, chunk_id: str, chunk_type: str, bucket: str):
+    """
+    Chunk metadata of an image request from the chunk index, or None unless
+    the document, page, bbox and type match what ingestion recorded.
+
+    Chunks the index does not know yet, e.g. of a document ingested since its
+    last refresh, are read from the document's chunk shards.
+    """
+    chunk_index.ensure_loaded(s3_client, bucket)
+    record = chunk_index.get(chunk_id)
+    if record is None:
+        record = chunk_shard_reader.read_chunk(s3_client, bucket, source_document, chunk_id)
+    if record is None:
+        return None
+    if (record["source_document"] != source_document or record["page"] != page_num
+            or record["chunk_type"] != chunk_type):
+        return None
+    if any(abs(a - b) > BBOX_TOLERANCE for a, b in zip(record["bbox"], bbox)):
+        return None
+    return record
+
+
+def image_handler(event, context):
+    """
+    API Gateway → Lambda handler for deferred chunk images.
+
+    Renders the requested chunk crop on first GET (or reuses the stored one)
+    and redirects to its presigned S3 URL.
+    """
+    try:
+        if not deferred_images.CHUNK_IMAGE_URL_SECRET:
+            # Without a secret requests cannot be verified; serve nothing
+            logger.error("CHUNK_IMAGE_URL_SECRET is not set")
+            return _response(503, "Chunk images are not configured")
+
+        request = parse_chunk_image_request(event.get("queryStringParameters") or {})
+        if request is None:
+            logger.warning("Invalid or unsigned chunk image request")
+            return _response(400, "Invalid chunk image request")
+
+        bucket = os.getenv("S3_BUCKET")
+        record = indexed_chunk(*request, bucket=bucket)
+        if record is None:
+            logger.warning(f"Chunk image request does not match the chunk index: {request[3]}")
+            return _response(404, "Chunk image not available")
+
+        # Render from the indexed metadata, not from the query parameters
+        source_document, page_num, bbox = record["source_document"], record["page"], record["bbox"]
+        chunk_id, chunk_type = record["chunk_id"], record["chunk_type"]
+        url = extract_chunk_image(
+            s3_client=s3_client,
+            bucket=bucket,
+            source_pdf_key=SOURCE_PDF_KEY_TEMPLATE.format(source_document=source_document),
+            bbox=bbox,
+            page_num=page_num,
+            chunk_id=chunk_id,
+            source_document=source_document,
+            highlight=True,
+            padding=10,
+            chunk_type=chunk_type
+        )
+        if not url:
+            logger.warning(f"Chunk image unavailable: {source_document} {chunk_id}")
+            return _response(404, "Chunk image not available")
+
+        return _response(302, "", {
+            "Location": url,
+            "Cache-Control": f"private, max-age={REDIRECT_MAX_AGE_SECONDS}"
+        })
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+        return _response(500, "Internal server error")
@@ -0,0 +1,138 @@
+"""
+Local Stream
+In-process ASGI client, to call the streaming app and time its events without a server
+
+Usage:
+    python -m src.runtime.local_stream "What is the carbon tax?" [--actor-id ID --session-id ID]
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from typing import Callable, Dict, List, Optional
+
+
+def parse_sse(text: str) -> List[Dict]:
+    """Server-sent events of a stream as {"event", "data"} dicts with parsed JSON data"""
+    events = []
+    for block in text.split("\n\n"):
+        name, data = "message", []
+        for line in block.splitlines():
+            if line.startswith("event:"):
+                name = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+        if data:
+            events.append({"event": name, "data": json.loads("\n".join(data))})
+    return events
+
+
+class StreamedResponse:
+    """
+    Response of an ASGI app with the arrival time of every body chunk.
+
+    chunks holds (seconds since the request, bytes) pairs.
+    """
+
+    def __init__(self):
+        self.status = None
+        self.headers: Dict[str, str] = {}
+        self.chunks = []
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(chunk for _, chunk in self.chunks)
+
+    @property
+    def events(self) -> List[Dict]:
+        return parse_sse(self.body.decode("utf-8"))
+
+    def json(self):
+        return json.loads(self.body)
+
+    def first_event_seconds(self, event: str) -> Optional[float]:
+        """Arrival time of the first chunk carrying an event, e.g. token"""
+        marker = f"event: {event}\n".encode("utf-8")
+        for seconds, chunk in self.chunks:
+            if marker in chunk:
+                return seconds
+        return None
+
+
+async def call_app(
+    app,
+    method: str = "POST",
+    path: str = "/",
+    body=b"",
+    on_chunk: Optional[Callable[[bytes], None]] = None
+) -> StreamedResponse:
+    """
+    Send one HTTP request to an ASGI app and collect the streamed response.
+
+    Args:
+        body: Request body; dicts are sent as JSON
+        on_chunk: Called with each body chunk as it arrives
+    """
+    if isinstance(body, dict):
+        body = json.dumps(body).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")]
+    }
+    response = StreamedResponse()
+    start = time.perf_counter()
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            # Nothing more to read; the client waits for the response
+            await asyncio.Event().wait()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response.status = message["status"]
+            response.headers = {
+                name.decode("latin-1"): value.decode("latin-1") for name, value in message.get("headers", [])
+            }
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            if chunk:
+                response.chunks.append((time.perf_counter() - start, chunk))
+                if on_chunk:
+                    on_chunk(chunk)
+
+    await app(scope, receive, send)
+    return response
+
+
+def main():
+    from src.runtime.stream_handler import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("query")
+    parser.add_argument("--actor-id")
+    parser.add_argument("--session-id")
+    args = parser.parse_args()
+
+    body = {"query": args.query}
+    if args.actor_id:
+        body["actor_id"] = args.actor_id
+    if args.session_id:
+        body["session_id"] = args.session_id
+
+    response = asyncio.run(call_app(app, body=body, on_chunk=lambda chunk: print(chunk.decode("utf-8"), end="", flush=True)))
+    print(f"status {response.status}, first token after {response.first_event_seconds('token')}s")
+
+
+if __name__ == "__main__":
+    main()
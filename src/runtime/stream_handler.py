@@ -0,0 +1,185 @@
+"""
+Stream Handler
+ASGI entry point that streams the agent's answer as server-sent events
+
+POST a JSON body with query (and optionally actor_id, session_id) and the
+response is a text/event-stream of:
+    session: {"actor_id", "session_id"} - sent before the agent runs
+    token, tool_start, tool_end, done: see src.rag.invoke.stream_agent
+    error: {"error", "message"} - the run failed part way
+
+POST {"queries": [...], "concurrency": n} instead for a batch:
+    result: see src.runtime.batch.run_batch - one per query, in input order
+    batch_done: {"count", "failed", "total_seconds"}
+
+Serve it with any ASGI server, e.g. `uvicorn src.runtime.stream_handler:app`.
+On Lambda it runs behind the Lambda Web Adapter with
+AWS_LWA_INVOKE_MODE=response_stream and a Function URL in RESPONSE_STREAM
+mode, since API Gateway buffers responses. Agents are shared with
+lambda_handler through the same pool.
+"""
+
+import json
+import time
+import asyncio
+import logging
+
+from src.rag.invoke import stream_agent
+from src.runtime.batch import parse_batch, run_batch
+from src.runtime.handler import build_batch_agent, get_agent_pool, session_key
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET,POST,OPTIONS"),
+    (b"access-control-allow-headers", b"Content-Type,Authorization")
+]
+
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream"),
+    (b"cache-control", b"no-cache"),
+    # Keeps proxies from holding back events until the response ends
+    (b"x-accel-buffering", b"no")
+] + CORS_HEADERS
+
+
+def format_sse(event: dict) -> bytes:
+    """Frame an event as a server-sent event named after its type"""
+    payload = {key: value for key, value in event.items() if key != "type"}
+    return f"event: {event['type']}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            break
+    return body
+
+
+async def send_json(send, status: int, payload: dict):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")] + CORS_HEADERS
+    })
+    await send({"type": "http.response.body", "body": json.dumps(payload).encode("utf-8")})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def stream_batch(body: dict, send):
+    try:
+        queries, concurrency = parse_batch(body)
+    except ValueError as e:
+        logger.warning(f"Rejected batch: {e}")
+        await send_json(send, 400, {"error": str(e)})
+        return
+
+    logger.info(f"Streaming batch of {len(queries)} queries, {concurrency} at a time")
+    await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+
+    start = time.perf_counter()
+    results = run_batch(queries, build_batch_agent, concurrency)
+    failed = 0
+    try:
+        while True:
+            # run_batch blocks until the next result in order is ready
+            result = await asyncio.to_thread(next, results, None)
+            if result is None:
+                break
+            failed += 1 if result["error"] else 0
+            await send({"type": "http.response.body", "body": format_sse({"type": "result", **result}), "more_body": True})
+    finally:
+        results.close()
+
+    done = {"type": "batch_done", "count": len(queries), "failed": failed,
+            "total_seconds": round(time.perf_counter() - start, 3)}
+    await send({"type": "http.response.body", "body": format_sse(done), "more_body": False})
+
+
+async def app(scope, receive, send):
+    """
+    ASGI application for streamed budget agent queries
+    """
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    method = scope["method"]
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    if method == "GET":
+        # Readiness check of the Lambda Web Adapter
+        await send_json(send, 200, {"status": "ok"})
+        return
+    if method != "POST":
+        await send_json(send, 405, {"error": "Use POST with a JSON body"})
+        return
+
+    try:
+        body = json.loads(await read_body(receive) or b"{}")
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON decode error: {str(e)}")
+        await send_json(send, 400, {"error": "Invalid JSON in request body"})
+        return
+
+    if isinstance(body, dict) and "queries" in body:
+        await stream_batch(body, send)
+        return
+
+    user_input = body.get("query") if isinstance(body, dict) else None
+    if not user_input:
+        logger.warning("Request missing 'query' parameter")
+        await send_json(send, 400, {"error": "Missing 'query' parameter in request body"})
+        return
+
+    try:
+        actor_id, session_id = session_key(body)
+    except ValueError as e:
+        logger.warning(f"Rejected request: {e}")
+        await send_json(send, 400, {"error": str(e)})
+        return
+
+    logger.info(f"Streaming query: {user_input} (actor {actor_id}, session {session_id})")
+
+    await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+
+    async def emit(event: dict):
+        await send({"type": "http.response.body", "body": format_sse(event), "more_body": True})
+
+    await emit({"type": "session", "actor_id": actor_id, "session_id": session_id})
+
+    pool = get_agent_pool()
+    key = (actor_id, session_id)
+    try:
+        # Building an agent calls AgentCore memory; keep it off the event loop
+        agent = await asyncio.to_thread(pool.get, key)
+        async for event in stream_agent(agent, user_input):
+            await emit(event)
+        logger.info("Query streamed successfully")
+    except Exception as e:
+        # Headers are already sent, so the failure is reported in the stream
+        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+        pool.discard(key)
+        await emit({"type": "error", "error": "Internal server error", "message": str(e)})
+
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,103 @@
+"""
+Unit tests for the agent pool
+Tests reuse, LRU and idle eviction
+"""
+import threading
+from unittest.mock import Mock
+from src.runtime.agent_pool import AgentPool
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAgentPool:
+    """Test suite for AgentPool"""
+
+    def test_reuses_agent_of_key(self):
+        factory = Mock(side_effect=lambda key: object())
+        pool = AgentPool(factory, max_size=4)
+
+        first = pool.get("s1")
+        second = pool.get("s1")
+
+        assert first is second
+        factory.assert_called_once_with("s1")
+        assert pool.stats() == {"size": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+    def test_evicts_least_recently_used(self):
+        pool = AgentPool(lambda key: object(), max_size=2)
+
+        pool.get("s1")
+        pool.get("s2")
+        pool.get("s1")
+        pool.get("s3")
+
+        assert "s1" in pool and "s3" in pool
+        assert "s2" not in pool
+        assert pool.evictions == 1
+
+    def test_evicts_idle_agents(self):
+        clock = FakeClock()
+        pool = AgentPool(lambda key: object(), max_size=4, idle_seconds=60, clock=clock)
+
+        first = pool.get("s1")
+        pool.get("s2")
+        clock.now = 50
+        pool.get("s2")
+        clock.now = 100
+
+        assert pool.get("s1") is not first
+        assert "s2" in pool
+        assert pool.evictions == 1
+
+    def test_discard(self):
+        pool = AgentPool(lambda key: object())
+
+        first = pool.get("s1")
+        pool.discard("s1")
+        pool.discard("missing")
+
+        assert pool.get("s1") is not first
+
+    def test_on_evict_called_for_every_agent_leaving(self):
+        released = []
+        pool = AgentPool(lambda key: key.upper(), max_size=1, on_evict=lambda key, agent: released.append((key, agent)))
+
+        pool.get("s1")
+        pool.get("s2")
+        pool.discard("s2")
+        pool.get("s3")
+        pool.clear()
+
+        assert released == [("s1", "S1"), ("s2", "S2"), ("s3", "S3")]
+
+    def test_on_evict_failure_does_not_break_pool(self):
+        pool = AgentPool(lambda key: object(), max_size=1, on_evict=Mock(side_effect=Exception("flush failed")))
+
+        pool.get("s1")
+        agent = pool.get("s2")
+
+        assert pool.get("s2") is agent
+
+    def test_concurrent_first_use_keeps_one_agent(self):
+        started = threading.Barrier(2)
+
+        def factory(key):
+            started.wait(timeout=5)
+            return object()
+
+        pool = AgentPool(factory)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(pool.get("s1"))) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(pool) == 1
+        assert pool.get("s1") in results
@@ -0,0 +1,217 @@
+"""
+Unit tests for batch queries
+Tests ordering, concurrency, agent reuse and the handler, streaming and CLI entry points
+"""
+import json
+import time
+import asyncio
+import threading
+import pytest
+from unittest.mock import Mock, patch
+
+from src.runtime import handler
+from src.runtime.batch import parse_batch, run_batch
+from src.runtime.cli import run_batch_file
+from src.runtime.local_stream import call_app
+from src.runtime.stream_handler import app
+
+
+class FakeAgent:
+    """Agent that answers after a delay given per query and tracks concurrency"""
+
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.resets = 0
+        self.questions = []
+
+    def reset(self):
+        self.resets += 1
+
+    def __call__(self, query):
+        with FakeAgent.lock:
+            FakeAgent.active += 1
+            FakeAgent.max_active = max(FakeAgent.max_active, FakeAgent.active)
+        try:
+            self.questions.append(query)
+            time.sleep(self.delays.get(query, 0.01))
+            if query.startswith("fail"):
+                raise RuntimeError(f"could not answer {query}")
+            return f"answer to {query}"
+        finally:
+            with FakeAgent.lock:
+                FakeAgent.active -= 1
+
+
+@pytest.fixture(autouse=True)
+def reset_fake_agent():
+    FakeAgent.active = 0
+    FakeAgent.max_active = 0
+
+
+class TestRunBatch:
+    """Test suite for run_batch"""
+
+    def test_results_in_input_order(self):
+        delays = {"q0": 0.2, "q1": 0.01, "q2": 0.1}
+
+        results = list(run_batch(["q0", "q1", "q2"], lambda: FakeAgent(delays), concurrency=3))
+
+        assert [r["index"] for r in results] == [0, 1, 2]
+        assert [r["response"] for r in results] == ["answer to q0", "answer to q1", "answer to q2"]
+        assert results[0]["seconds"] >= 0.2
+        assert all(r["error"] is None for r in results)
+
+    def test_respects_concurrency(self):
+        queries = [f"q{i}" for i in range(12)]
+        delays = {q: 0.03 for q in queries}
+
+        start = time.perf_counter()
+        results = list(run_batch(queries, lambda: FakeAgent(delays), concurrency=4))
+        elapsed = time.perf_counter() - start
+
+        assert len(results) == 12
+        assert FakeAgent.max_active == 4
+        assert elapsed < 12 * 0.03
+
+    def test_each_worker_builds_one_agent_and_resets_it(self):
+        agents = []
+
+        def build():
+            agents.append(FakeAgent())
+            return agents[-1]
+
+        list(run_batch([f"q{i}" for i in range(8)], build, concurrency=2))
+
+        assert len(agents) == 2
+        assert sum(len(a.questions) for a in agents) == 8
+        assert all(a.resets == len(a.questions) - 1 for a in agents)
+
+    def test_failure_is_reported_and_agent_replaced(self):
+        agents = []
+
+        def build():
+            agents.append(FakeAgent())
+            return agents[-1]
+
+        results = list(run_batch(["q0", "fail1", "q2"], build, concurrency=1))
+
+        assert results[1]["response"] is None
+        assert "could not answer fail1" in results[1]["error"]
+        assert results[2]["response"] == "answer to q2"
+        assert len(agents) == 2
+
+    def test_first_result_before_batch_ends(self):
+        delays = {"q0": 0.01, "q1": 0.3}
+        results = run_batch(["q0", "q1"], lambda: FakeAgent(delays), concurrency=2)
+
+        start = time.perf_counter()
+        first = next(results)
+        first_seconds = time.perf_counter() - start
+        list(results)
+
+        assert first["index"] == 0
+        assert first_seconds < 0.2
+
+
+class TestParseBatch:
+    """Test suite for batch request validation"""
+
+    def test_defaults_and_cap(self):
+        assert parse_batch({"queries": ["a"]})[1] >= 1
+        with patch('src.runtime.batch.BATCH_MAX_CONCURRENCY', 3):
+            assert parse_batch({"queries": ["a"], "concurrency": 50}) == (["a"], 3)
+
+    @pytest.mark.parametrize("body", [
+        {"queries": []},
+        {"queries": "a"},
+        {"queries": ["a", ""]},
+        {"queries": ["a", 3]},
+        {"queries": ["a"], "concurrency": 0},
+        {"queries": ["a"], "concurrency": "4"}
+    ])
+    def test_rejects_invalid(self, body):
+        with pytest.raises(ValueError):
+            parse_batch(body)
+
+    def test_rejects_too_many(self):
+        with patch('src.runtime.batch.BATCH_MAX_QUERIES', 2):
+            with pytest.raises(ValueError):
+                parse_batch({"queries": ["a", "b", "c"]})
+
+
+class TestBatchEntryPoints:
+    """Batch mode of lambda_handler, the streaming app and the CLI"""
+
+    @pytest.fixture
+    def mock_agent_class(self):
+        with patch('src.runtime.handler.get_shared_model'), \
+             patch('src.runtime.handler.setup_memory') as mock_memory, \
+             patch('src.runtime.handler.BudgetAgent') as mock:
+            mock.side_effect = lambda *args: FakeAgent({"q0": 0.1})
+            yield mock
+            mock_memory.assert_not_called()
+
+    def test_lambda_handler_batch(self, mock_agent_class):
+        event = {"body": json.dumps({"queries": ["q0", "fail1", "q2"], "concurrency": 2})}
+
+        response = handler.lambda_handler(event, Mock())
+
+        assert response["statusCode"] == 200
+        body = json.loads(response["body"])
+        assert [r["query"] for r in body["results"]] == ["q0", "fail1", "q2"]
+        assert body["results"][1]["error"]
+        assert body["total_seconds"] >= 0.1
+        # Batch agents run without memory
+        assert all(call[0][0] is None for call in mock_agent_class.call_args_list)
+
+    def test_lambda_handler_rejects_invalid_batch(self, mock_agent_class):
+        response = handler.lambda_handler({"body": json.dumps({"queries": []})}, Mock())
+
+        assert response["statusCode"] == 400
+        mock_agent_class.assert_not_called()
+
+    def test_lambda_handler_rejects_batches_beyond_the_api_timeout(self, mock_agent_class):
+        queries = [f"q{i}" for i in range(handler.API_BATCH_MAX_QUERIES + 1)]
+
+        response = handler.lambda_handler({"body": json.dumps({"queries": queries})}, Mock())
+
+        assert response["statusCode"] == 400
+        assert "src.runtime.cli --batch" in json.loads(response["body"])["error"]
+        mock_agent_class.assert_not_called()
+
+    def test_lambda_handler_answers_batch_in_one_round(self, mock_agent_class):
+        event = {"body": json.dumps({"queries": ["q0", "q1", "q2"], "concurrency": 1})}
+
+        with patch('src.runtime.handler.run_batch', return_value=[]) as mock_run:
+            handler.lambda_handler(event, Mock())
+
+        assert mock_run.call_args[0][2] == 3
+
+    def test_streamed_batch_in_input_order(self, mock_agent_class):
+        response = asyncio.run(call_app(app, body={"queries": ["q0", "q1", "q2"], "concurrency": 3}))
+
+        assert response.status == 200
+        events = response.events
+        assert [e["event"] for e in events] == ["result", "result", "result", "batch_done"]
+        assert [e["data"]["index"] for e in events[:3]] == [0, 1, 2]
+        assert events[-1]["data"]["count"] == 3
+        assert events[-1]["data"]["failed"] == 0
+
+    def test_cli_batch_file(self, tmp_path, capsys):
+        questions = tmp_path / "questions.txt"
+        questions.write_text('q0\n\n{"query": "q1"}\nfail2\n')
+        output = tmp_path / "results.jsonl"
+
+        with patch('src.runtime.cli.get_shared_model'), \
+             patch('src.runtime.cli.BudgetAgent', side_effect=lambda *args: FakeAgent()):
+            run_batch_file(str(questions), concurrency=2, output=str(output))
+
+        printed = capsys.readouterr().out
+        assert printed.index("[1/3]") < printed.index("[2/3]") < printed.index("[3/3]")
+        assert "2 answered, 1 failed" in printed
+        results = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [r["query"] for r in results] == ["q0", "q1", "fail2"]
@@ -57,6 +57,34 @@ class TestBudgetAgent:
         call_kwargs = mock_agent.call_args[1]
         assert call_kwargs['model'] == 'test-model-id'
     
+    def test_uses_shared_model_client(self, mock_agent, mock_search_tool):
+        """Test that a model client passed in is used instead of the model ID"""
+        shared_model = Mock()
+        
+        BudgetAgent(model=shared_model)
+        
+        call_kwargs = mock_agent.call_args[1]
+        assert call_kwargs['model'] is shared_model
+    
+    def test_reset_clears_conversation(self, mock_agent, mock_search_tool):
+        """Test that reset forgets earlier questions"""
+        mock_agent.return_value.messages = [{"role": "user", "content": [{"text": "earlier"}]}]
+        budget_agent = BudgetAgent()
+        
+        budget_agent.reset()
+        
+        assert budget_agent.agent.messages == []
+    
+    def test_stream_async_delegates_to_agent(self, mock_agent, mock_search_tool):
+        """Test that streaming goes through the Strands async iterator"""
+        budget_agent = BudgetAgent()
+        
+        stream = budget_agent.stream_async("What is the carbon tax?")
+        
+        mock_agent.return_value.stream_async.assert_called_once_with("What is the carbon tax?")
+        assert stream is mock_agent.return_value.stream_async.return_value
+        assert mock_agent.call_args[1]['callback_handler'] is None
+    
     def test_agent_has_system_prompt(self, mock_agent, mock_search_tool):
         """Test that agent is configured with system prompt"""
         BudgetAgent()
@@ -0,0 +1,120 @@
+"""
+Unit tests for the bulk S3 writer
+Tests concurrent uploads, throttling retries and the write summary
+"""
+import threading
+import time
+import pytest
+from unittest.mock import Mock, patch
+from src.ingestion import bulk_s3_writer
+from src.ingestion.bulk_s3_writer import BulkS3Writer, backoff_delay, is_retryable
+
+
+class ClientError(Exception):
+    """Minimal botocore ClientError look-alike"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class SlowS3:
+    """S3 stand-in whose puts take a fixed time and track concurrency"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.objects = {}
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+            self.objects[Key] = Body
+
+
+@pytest.fixture(autouse=True)
+def no_backoff():
+    with patch.object(bulk_s3_writer, "backoff_delay", return_value=0):
+        yield
+
+
+class TestBulkS3Writer:
+    """Test suite for BulkS3Writer"""
+
+    def test_uploads_in_parallel_within_pool_bound(self):
+        """Test puts overlap but never exceed the worker count"""
+        s3 = SlowS3()
+        with BulkS3Writer(s3, "bucket", workers=8) as writer:
+            for i in range(64):
+                writer.put(f"chunks/{i}.json", b"{}", "application/json")
+            summary = writer.flush()
+
+        assert len(s3.objects) == 64
+        assert 1 < s3.max_active <= 8
+        assert summary["completed"] == 64
+        assert summary["bytes"] == 128
+        # 64 serial puts would take 1.28s
+        assert summary["seconds"] < 0.8
+
+    def test_retries_throttled_puts(self):
+        """Test SlowDown errors are retried until the put succeeds"""
+        s3 = Mock()
+        s3.put_object.side_effect = [ClientError("SlowDown"), ClientError("503"), None]
+        writer = BulkS3Writer(s3, "bucket", workers=2)
+
+        writer.put("output/doc.md", b"# Budget").result()
+        summary = writer.flush()
+
+        assert s3.put_object.call_count == 3
+        assert summary["retries"] == 2
+        assert summary["failed"] == 0
+        writer.close()
+
+    def test_non_retryable_errors_fail_once(self):
+        """Test access errors are not retried and are reported"""
+        s3 = Mock()
+        s3.put_object.side_effect = ClientError("AccessDenied")
+        writer = BulkS3Writer(s3, "bucket", workers=2)
+
+        future = writer.put("output/doc.md", b"# Budget")
+        summary = writer.flush()
+
+        assert isinstance(future.exception(), ClientError)
+        assert s3.put_object.call_count == 1
+        assert summary["failed"] == 1
+        assert writer.failed_keys == ["output/doc.md"]
+        writer.close()
+
+    def test_gives_up_after_max_attempts(self):
+        """Test persistent throttling fails after max_attempts puts"""
+        s3 = Mock()
+        s3.put_object.side_effect = ClientError("SlowDown")
+        writer = BulkS3Writer(s3, "bucket", workers=1, max_attempts=3)
+
+        writer.put("k", b"x")
+        summary = writer.flush()
+
+        assert s3.put_object.call_count == 3
+        assert summary["failed"] == 1
+        writer.close()
+
+
+class TestBackoff:
+    """Test suite for the retry helpers"""
+
+    def test_retryable_codes(self):
+        assert is_retryable(ClientError("SlowDown"))
+        assert not is_retryable(ClientError("NoSuchBucket"))
+        assert not is_retryable(ValueError("boom"))
+
+    def test_backoff_is_jittered_and_capped(self):
+        delays = [backoff_delay(10, base=0.2, cap=1.0) for _ in range(50)]
+
+        assert all(0 <= d <= 1.0 for d in delays)
+        assert len(set(delays)) > 1
@@ -0,0 +1,126 @@
+"""
+Unit tests for the in-memory chunk metadata index
+Tests sidecar packing, lookups and incremental refresh
+"""
+import io
+import time
+import pytest
+from unittest.mock import Mock
+from src.rag.chunk_index import ChunkIndex, chunk_index_key, pack_chunk_index
+
+
+def make_chunks(doc, count, chunk_type="text"):
+    return [
+        {
+            "chunk_id": f"{doc}-id-{i}",
+            "chunk_type": chunk_type if i % 2 else "table",
+            "text": "ignored",
+            "bbox": [0.1, 0.2 + i / 100, 0.5, 0.6],
+            "page": i,
+            "source_document": doc
+        }
+        for i in range(count)
+    ]
+
+
+class FakeS3:
+    """In-memory S3 stand-in with listing, ETags and get_object"""
+
+    def __init__(self):
+        self.objects = {}
+        self.version = 0
+        self.get_object = Mock(side_effect=self._get_object)
+
+    def put(self, key, body):
+        self.version += 1
+        self.objects[key] = (body, f'"{self.version}"')
+
+    def _get_object(self, Bucket, Key):
+        body, etag = self.objects[Key]
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+    def get_paginator(self, name):
+        paginator = Mock()
+        paginator.paginate.side_effect = lambda Bucket, Prefix: [{
+            "Contents": [
+                {"Key": key, "ETag": etag}
+                for key, (_, etag) in self.objects.items() if key.startswith(Prefix)
+            ]
+        }]
+        return paginator
+
+
+class TestChunkIndex:
+    """Test suite for ChunkIndex"""
+
+    @pytest.fixture
+    def s3(self):
+        s3 = FakeS3()
+        s3.put(chunk_index_key("budget_2024"), pack_chunk_index("budget_2024", make_chunks("budget_2024", 3)))
+        s3.put(chunk_index_key("fall_update"), pack_chunk_index("fall_update", make_chunks("fall_update", 2)))
+        return s3
+
+    def test_lookup_returns_chunk_metadata(self, s3):
+        """Test lookups return the chunk JSON fields without I/O"""
+        index = ChunkIndex()
+        index.ensure_loaded(s3, "bucket")
+        s3.get_object.reset_mock()
+
+        record = index.get("budget_2024-id-1")
+
+        assert record == {
+            "chunk_id": "budget_2024-id-1",
+            "chunk_type": "text",
+            "page": 1,
+            "bbox": [0.1, 0.21, 0.5, 0.6],
+            "source_document": "budget_2024"
+        }
+        assert len(index) == 5
+        s3.get_object.assert_not_called()
+
+    def test_lookup_by_chunk_file_name(self, s3):
+        """Test chunk file names resolve even when document names contain underscores"""
+        index = ChunkIndex()
+        index.ensure_loaded(s3, "bucket")
+
+        assert index.get_by_file("budget_2024_budget_2024-id-2.json")["page"] == 2
+        assert index.get_by_file("other_budget_2024-id-2.json") is None
+        assert index.get_by_file("budget_2024_missing.json") is None
+
+    def test_refresh_reloads_only_changed_documents(self, s3):
+        """Test a republished sidecar replaces its document and nothing else is downloaded"""
+        index = ChunkIndex()
+        index.refresh(s3, "bucket")
+        s3.put(chunk_index_key("fall_update"), pack_chunk_index("fall_update", make_chunks("fall_update", 4)))
+        s3.get_object.reset_mock()
+
+        index.refresh(s3, "bucket")
+
+        assert [call.kwargs["Key"] for call in s3.get_object.call_args_list] == [chunk_index_key("fall_update")]
+        assert index.get("fall_update-id-3")["page"] == 3
+        assert len(index) == 7
+
+    def test_deleted_documents_are_dropped(self, s3):
+        """Test documents whose sidecar disappeared leave the index"""
+        index = ChunkIndex()
+        index.refresh(s3, "bucket")
+        del s3.objects[chunk_index_key("fall_update")]
+
+        index.refresh(s3, "bucket")
+
+        assert index.get("fall_update-id-0") is None
+        assert index.get("budget_2024-id-0") is not None
+
+    def test_stale_index_refreshes_in_background(self, s3):
+        """Test a stale index keeps serving lookups while it refreshes"""
+        index = ChunkIndex(refresh_seconds=0)
+        index.ensure_loaded(s3, "bucket")
+        s3.put(chunk_index_key("new_doc"), pack_chunk_index("new_doc", make_chunks("new_doc", 1)))
+
+        index.ensure_loaded(s3, "bucket")
+        for _ in range(100):
+            if index.get("new_doc-id-0"):
+                break
+            time.sleep(0.01)
+
+        assert index.get("new_doc-id-0") is not None
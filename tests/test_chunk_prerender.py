@@ -0,0 +1,178 @@
+"""
+Unit tests for ingestion-time chunk image pre-rendering
+Tests chunk selection, uploads and checkpoint resume
+"""
+import io
+import os
+import json
+import threading
+import multiprocessing
+import pytest
+from unittest.mock import Mock
+from src.ingestion import chunk_prerender
+from src.ingestion.chunk_prerender import prerender_chunk_images, select_chunks
+from benchmarks.bench_chunk_render import build_synthetic_pdf
+
+
+def make_chunk(chunk_id, page=0, chunk_type="table"):
+    return {
+        "chunk_id": chunk_id,
+        "chunk_type": chunk_type,
+        "text": f"text of {chunk_id}",
+        "bbox": [0.1, 0.1, 0.4, 0.3],
+        "page": page,
+        "source_document": "budget"
+    }
+
+
+class FakeS3:
+    """In-memory S3 stand-in for put_object/get_object"""
+
+    def __init__(self):
+        self.objects = {}
+        self.put_object = Mock(side_effect=self._put_object)
+
+    def _put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise Exception("NoSuchKey")
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def checkpoint(self, source_document):
+        return json.loads(self.objects[chunk_prerender.checkpoint_key(source_document)])
+
+
+class TestPrerenderChunkImages:
+    """Test suite for prerender_chunk_images"""
+
+    @pytest.fixture
+    def pdf_path(self, tmp_path):
+        path = tmp_path / "budget.pdf"
+        path.write_bytes(build_synthetic_pdf(pages=2))
+        return path
+
+    def test_select_chunks_filters_types(self):
+        """Test only configured chunk types are selected"""
+        chunks = [make_chunk("a", chunk_type="table"), make_chunk("b", chunk_type="text"), make_chunk("")]
+
+        assert [c["chunk_id"] for c in select_chunks(chunks, {"table"})] == ["a"]
+        assert [c["chunk_id"] for c in select_chunks(chunks, set())] == ["a", "b"]
+
+    def test_renders_and_uploads_every_chunk(self, pdf_path):
+        """Test every selected chunk is uploaded under its query-time key"""
+        s3 = FakeS3()
+        chunks = [make_chunk("c1", page=0), make_chunk("c2", page=1), make_chunk("c3", page=1)]
+
+        summary = prerender_chunk_images(s3, "bucket", pdf_path, "budget", chunks, chunk_types=set(), workers=2)
+
+        assert summary == {"rendered": 3, "failed": 0, "total": 3, "complete": True}
+        for chunk_id in ("c1", "c2", "c3"):
+            assert s3.objects[f"output/budget_chunk_images/budget_{chunk_id}.png"].startswith(b"\x89PNG")
+        assert s3.checkpoint("budget")["complete"] is True
+
+    def test_resume_skips_checkpointed_chunks(self, pdf_path):
+        """Test chunks recorded in the checkpoint are not rendered again"""
+        s3 = FakeS3()
+        chunk_prerender.save_checkpoint(s3, "bucket", "budget", {"c1"}, 2, complete=False)
+        chunks = [make_chunk("c1"), make_chunk("c2")]
+
+        summary = prerender_chunk_images(s3, "bucket", pdf_path, "budget", chunks, chunk_types=set(), workers=1)
+
+        uploaded = [call.kwargs["Key"] for call in s3.put_object.call_args_list]
+        assert "output/budget_chunk_images/budget_c1.png" not in uploaded
+        assert "output/budget_chunk_images/budget_c2.png" in uploaded
+        assert summary["rendered"] == 2
+        assert not chunk_prerender.prerender_incomplete(s3, "bucket", "budget")
+
+    def test_stops_before_lambda_timeout(self, pdf_path):
+        """Test a run near the timeout stops and leaves a resumable checkpoint"""
+        s3 = FakeS3()
+        context = Mock()
+        context.get_remaining_time_in_millis.return_value = 1000
+
+        summary = prerender_chunk_images(
+            s3, "bucket", pdf_path, "budget", [make_chunk("c1")], context=context, chunk_types=set(), workers=1
+        )
+
+        assert summary["complete"] is False
+        assert chunk_prerender.prerender_incomplete(s3, "bucket", "budget")
+
+    def test_failed_upload_stops_blocked_workers(self, pdf_path):
+        """Test an error in the upload loop terminates workers instead of waiting on them"""
+        s3 = FakeS3()
+        writer = Mock()
+        writer.put.side_effect = RuntimeError("upload failed")
+        # Ids this long fill the pipe, so the worker blocks until it is read
+        chunks = [make_chunk(f"c{i}" + "x" * 100_000) for i in range(6)]
+        errors = []
+
+        def run():
+            try:
+                prerender_chunk_images(s3, "bucket", pdf_path, "budget", chunks, chunk_types=set(), workers=1, writer=writer)
+            except RuntimeError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(timeout=30)
+        hung = thread.is_alive()
+        for process in multiprocessing.active_children():
+            process.terminate()
+
+        assert not hung
+        assert "upload failed" in str(errors[0])
+
+    def test_crashed_worker_leaves_checkpoint_incomplete(self, pdf_path, monkeypatch):
+        """Test chunks of a worker that died are resumed instead of recorded as complete"""
+        s3 = FakeS3()
+
+        def crash(pdf_path, jobs, out_dir, conn):
+            os._exit(1)
+        # fork, so the child runs the patched worker
+        monkeypatch.setattr(chunk_prerender, "_MP_CONTEXT", multiprocessing.get_context("fork"))
+        monkeypatch.setattr(chunk_prerender, "_render_worker", crash)
+
+        summary = prerender_chunk_images(s3, "bucket", pdf_path, "budget", [make_chunk("c1")], chunk_types=set(), workers=1)
+
+        assert summary["complete"] is False
+        assert summary["rendered"] == 0
+        assert chunk_prerender.prerender_incomplete(s3, "bucket", "budget")
+
+    def test_documents_share_the_render_budget(self, pdf_path, monkeypatch):
+        """Test a document waits for render slots held by another and returns them when done"""
+        s3 = FakeS3()
+        slots = chunk_prerender.RenderSlots(2)
+        monkeypatch.setattr(chunk_prerender, "render_slots", slots)
+        assert slots.acquire(2) == 2
+        summaries = []
+        chunks = [make_chunk("c1", page=0), make_chunk("c2", page=1)]
+
+        thread = threading.Thread(target=lambda: summaries.append(prerender_chunk_images(
+            s3, "bucket", pdf_path, "budget", chunks, chunk_types=set(), workers=4
+        )), daemon=True)
+        thread.start()
+        thread.join(timeout=0.5)
+        assert thread.is_alive()
+        assert not s3.put_object.called
+
+        slots.release(2)
+        thread.join(timeout=30)
+
+        assert summaries[0]["complete"] is True
+        assert slots.free == 2
+
+    def test_no_render_slot_before_timeout(self, pdf_path, monkeypatch):
+        """Test a document still waiting for a slot near the timeout stops with a resumable checkpoint"""
+        s3 = FakeS3()
+        monkeypatch.setattr(chunk_prerender, "render_slots", chunk_prerender.RenderSlots(0))
+        context = Mock()
+        context.get_remaining_time_in_millis.return_value = 1000
+
+        summary = prerender_chunk_images(
+            s3, "bucket", pdf_path, "budget", [make_chunk("c1")], context=context, chunk_types=set()
+        )
+
+        assert summary["complete"] is False
+        assert chunk_prerender.prerender_incomplete(s3, "bucket", "budget")
@@ -0,0 +1,97 @@
+"""
+Unit tests for NDJSON chunk shards
+Tests shard packing, the offset index and Range reads
+"""
+import io
+import json
+import re
+import pytest
+from unittest.mock import Mock
+from src.rag.chunk_shards import (
+    ChunkShardReader,
+    pack_chunk_shards,
+    shard_index_key,
+    write_chunk_shards
+)
+
+
+def make_chunks(count):
+    return [
+        {
+            "chunk_id": f"id-{i}",
+            "chunk_type": "text",
+            "text": f"Paragraph {i} about the fiscal outlook — {'x' * (i * 7)}",
+            "bbox": [0.1, 0.2, 0.5, 0.6],
+            "page": i,
+            "source_document": "budget_2024"
+        }
+        for i in range(count)
+    ]
+
+
+class FakeS3:
+    """In-memory S3 stand-in honouring Range on get_object"""
+
+    def __init__(self):
+        self.objects = {}
+        self.put_object = Mock(side_effect=self._put_object)
+        self.get_object = Mock(side_effect=self._get_object)
+
+    def _put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[Key] = Body
+
+    def _get_object(self, Bucket, Key, Range=None):
+        body = self.objects[Key]
+        if Range:
+            start, end = map(int, re.match(r"bytes=(\d+)-(\d+)", Range).groups())
+            body = body[start:end + 1]
+        return {"Body": io.BytesIO(body)}
+
+
+class TestChunkShards:
+    """Test suite for chunk shard writing and reading"""
+
+    def test_every_chunk_round_trips(self):
+        """Test each chunk is read back intact through a Range GET"""
+        s3 = FakeS3()
+        chunks = make_chunks(50)
+        write_chunk_shards(s3, "bucket", "budget_2024", chunks)
+        reader = ChunkShardReader()
+
+        for chunk in chunks:
+            assert reader.read_chunk(s3, "bucket", "budget_2024", chunk["chunk_id"]) == chunk
+
+        ranged = [c for c in s3.get_object.call_args_list if "Range" in c.kwargs]
+        assert len(ranged) == 50
+        # The index is fetched once and cached
+        assert len(s3.get_object.call_args_list) == 51
+
+    def test_few_puts_per_document(self):
+        """Test a document is written as shards plus one index, not one object per chunk"""
+        s3 = FakeS3()
+
+        write_chunk_shards(s3, "bucket", "budget_2024", make_chunks(2000))
+
+        keys = [c.kwargs["Key"] for c in s3.put_object.call_args_list]
+        assert len(keys) <= 3
+        assert keys[-1] == shard_index_key("budget_2024")
+
+    def test_shards_respect_size_limit(self):
+        """Test a new shard starts when the size limit is reached"""
+        shards, index = pack_chunk_shards("budget_2024", make_chunks(30), max_bytes=2048)
+
+        assert len(shards) > 1
+        assert all(len(body) <= 2048 for _, body in shards)
+        assert index["shards"] == [name for name, _ in shards]
+        for chunk_id, (shard_no, offset, length) in index["chunks"].items():
+            line = shards[shard_no][1][offset:offset + length]
+            assert json.loads(line)["chunk_id"] == chunk_id
+
+    def test_unknown_chunk_returns_none(self):
+        """Test missing documents and chunks fail softly"""
+        s3 = FakeS3()
+        write_chunk_shards(s3, "bucket", "budget_2024", make_chunks(3))
+        reader = ChunkShardReader()
+
+        assert reader.read_chunk(s3, "bucket", "budget_2024", "id-99") is None
+        assert reader.read_chunk(s3, "bucket", "missing_doc", "id-0") is None
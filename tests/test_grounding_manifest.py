@@ -0,0 +1,182 @@
+"""
+Unit tests for the grounding manifest and presigned-URL cache
+Tests conditional refresh, write-back merging and URL reuse
+"""
+import io
+import json
+import hashlib
+from unittest.mock import Mock, patch
+from botocore.exceptions import ClientError
+from src.rag import grounding_manifest as gm
+from src.rag.grounding_manifest import GroundingManifest, PresignedUrlCache
+
+MANIFEST_KEY = "internal/grounding_manifest.json"
+
+
+def client_error(code, status):
+    return ClientError(
+        {"Error": {"Code": code, "Message": code}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        "GetObject"
+    )
+
+
+class FakeS3:
+    """In-memory S3 stand-in with ETags and conditional GET/PUT support"""
+
+    def __init__(self):
+        self.objects = {}
+        self.get_object = Mock(side_effect=self._get_object)
+        self.put_object = Mock(side_effect=self._put_object)
+
+    def _put_object(self, Bucket, Key, Body, ContentType=None, IfMatch=None, IfNoneMatch=None):
+        current = self.objects.get(Key)
+        if (IfMatch and (current is None or current[1] != IfMatch)) or (IfNoneMatch == "*" and current):
+            raise client_error("PreconditionFailed", 412)
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        self.objects[Key] = (Body, etag)
+        return {"ETag": etag}
+
+    def _get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise client_error("NoSuchKey", 404)
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise client_error("304", 304)
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+    def manifest(self):
+        return json.loads(self.objects[MANIFEST_KEY][0])
+
+
+class TestGroundingManifest:
+    """Test suite for GroundingManifest"""
+
+    def test_lookups_between_refreshes_hit_memory(self):
+        """Test the manifest is read once per refresh interval"""
+        s3 = FakeS3()
+        s3.put_object(Bucket="b", Key=MANIFEST_KEY, Body=json.dumps({"images": ["img/a.png"], "pdfs": {}}).encode())
+        manifest = GroundingManifest(MANIFEST_KEY, refresh_seconds=60)
+
+        assert manifest.has_image(s3, "b", "img/a.png")
+        assert not manifest.has_image(s3, "b", "img/b.png")
+        assert s3.get_object.call_count == 1
+
+    def test_unchanged_manifest_is_revalidated(self):
+        """Test an expired view is refreshed with a conditional GET"""
+        s3 = FakeS3()
+        s3.put_object(Bucket="b", Key=MANIFEST_KEY, Body=json.dumps({"images": ["img/a.png"]}).encode())
+        manifest = GroundingManifest(MANIFEST_KEY, refresh_seconds=0)
+
+        manifest.has_image(s3, "b", "img/a.png")
+        assert manifest.has_image(s3, "b", "img/a.png")
+
+        assert "IfNoneMatch" in s3.get_object.call_args.kwargs
+        assert manifest.refreshes == 1
+
+    def test_flush_merges_with_other_writers(self):
+        """Test local additions are merged into entries written by others"""
+        s3 = FakeS3()
+        manifest = GroundingManifest(MANIFEST_KEY, refresh_seconds=60)
+        manifest.add_images("b", ["img/a.png"])
+        manifest.add_pdf("b", "input/doc.pdf", "abc")
+        s3.put_object(Bucket="b", Key=MANIFEST_KEY, Body=json.dumps({"images": ["img/other.png"]}).encode())
+
+        manifest.flush(s3, "b")
+
+        assert s3.manifest() == {"images": ["img/a.png", "img/other.png"], "pdfs": {"input/doc.pdf": "abc"}}
+        assert manifest.has_image(s3, "b", "img/other.png")
+
+    def test_concurrent_write_is_merged_not_overwritten(self):
+        """Test a write that loses a race re-reads the manifest and keeps the other writer's entries"""
+        s3 = FakeS3()
+        s3.put_object(Bucket="b", Key=MANIFEST_KEY, Body=json.dumps({"images": ["img/old.png"]}).encode())
+        manifest = GroundingManifest(MANIFEST_KEY, refresh_seconds=60)
+        manifest.add_images("b", ["img/a.png"])
+        read = s3._get_object
+
+        def racing_get(**kwargs):
+            # Another ingestion writes between this writer's first read and its PUT
+            response = read(**kwargs)
+            if s3.get_object.call_count == 1:
+                s3.put_object(Bucket="b", Key=MANIFEST_KEY, Body=json.dumps({"images": ["img/other.png"]}).encode())
+            return response
+        s3.get_object.side_effect = racing_get
+
+        with patch.object(gm, "MANIFEST_WRITE_BACKOFF_SECONDS", 0):
+            assert manifest.flush(s3, "b")
+
+        assert s3.manifest()["images"] == ["img/a.png", "img/other.png"]
+        assert s3.get_object.call_count == 2
+
+    def test_first_write_does_not_replace_a_new_manifest(self):
+        """Test creating the manifest is conditional on it still not existing"""
+        s3 = FakeS3()
+        manifest = GroundingManifest(MANIFEST_KEY, refresh_seconds=60)
+        manifest.add_images("b", ["img/a.png"])
+
+        manifest.flush(s3, "b")
+
+        assert s3.put_object.call_args.kwargs["IfNoneMatch"] == "*"
+
+    def test_gives_up_after_repeated_conflicts(self):
+        """Test pending entries are kept when every write loses its race"""
+        s3 = FakeS3()
+        s3.put_object(Bucket="b", Key=MANIFEST_KEY, Body=json.dumps({"images": []}).encode())
+        s3.put_object.side_effect = client_error("PreconditionFailed", 412)
+        manifest = GroundingManifest(MANIFEST_KEY, refresh_seconds=60)
+        manifest.add_images("b", ["img/a.png"])
+
+        with patch.object(gm, "MANIFEST_WRITE_BACKOFF_SECONDS", 0):
+            assert not manifest.flush(s3, "b")
+
+        assert s3.put_object.call_count == 1 + gm.MANIFEST_WRITE_ATTEMPTS
+        assert manifest.has_image(s3, "b", "img/a.png")
+        assert manifest._pending_images == {"img/a.png"}
+
+    def test_maybe_flush_writes_before_returning(self):
+        """Test a due flush completes in the calling thread"""
+        s3 = FakeS3()
+        manifest = GroundingManifest(MANIFEST_KEY, refresh_seconds=60, flush_seconds=0)
+        manifest.add_images("b", ["img/a.png"])
+
+        manifest.maybe_flush(s3, "b")
+
+        assert s3.manifest()["images"] == ["img/a.png"]
+
+    def test_removed_images_are_dropped(self):
+        """Test removed keys disappear from memory and from S3"""
+        s3 = FakeS3()
+        s3.put_object(Bucket="b", Key=MANIFEST_KEY, Body=json.dumps({"images": ["img/a.png", "img/b.png"]}).encode())
+        manifest = GroundingManifest(MANIFEST_KEY, refresh_seconds=60)
+
+        manifest.remove_images("b", ["img/a.png"])
+        manifest.flush(s3, "b")
+
+        assert not manifest.has_image(s3, "b", "img/a.png")
+        assert s3.manifest()["images"] == ["img/b.png"]
+
+    def test_missing_manifest_is_empty(self):
+        """Test a bucket without a manifest behaves as an empty one"""
+        manifest = GroundingManifest(MANIFEST_KEY)
+
+        assert not manifest.has_image(FakeS3(), "b", "img/a.png")
+        assert manifest.pdf_etag(FakeS3(), "b", "input/doc.pdf") is None
+
+
+class TestPresignedUrlCache:
+    """Test suite for PresignedUrlCache"""
+
+    def test_urls_are_reused_until_close_to_expiry(self):
+        """Test a URL is signed again only when less than the minimum TTL is left"""
+        s3 = Mock()
+        s3.generate_presigned_url.side_effect = lambda op, Params, ExpiresIn: f"https://signed/{Params['Key']}"
+        cache = PresignedUrlCache(expires_in=3600, min_ttl_seconds=300)
+
+        with patch.object(gm.time, "time", return_value=1000.0):
+            cache.get_many(s3, "b", ["k1", "k2"])
+            cache.get_many(s3, "b", ["k1"])
+        assert s3.generate_presigned_url.call_count == 2
+
+        with patch.object(gm.time, "time", return_value=1000.0 + 3600 - 299):
+            cache.get_many(s3, "b", ["k1"])
+        assert s3.generate_presigned_url.call_count == 3
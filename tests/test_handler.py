@@ -5,9 +5,19 @@ Tests API Gateway integration, error handling, and responses
 import json
 import pytest
 from unittest.mock import Mock, patch, MagicMock
+from src.runtime import handler
 from src.runtime.handler import lambda_handler
 
 
+@pytest.fixture(autouse=True)
+def fresh_agent_pool():
+    """Every test starts from a cold container"""
+    handler.agent_pool = None
+    with patch('src.runtime.handler.get_shared_model') as mock_model:
+        yield mock_model
+    handler.agent_pool = None
+
+
 class TestLambdaHandler:
     """Test suite for Lambda handler function"""
     
@@ -147,7 +157,7 @@ class TestLambdaHandlerIntegration:
     @patch('src.runtime.handler.invoke_agent')
     @patch('src.runtime.handler.BudgetAgent')
     @patch('src.runtime.handler.setup_memory')
-    def test_full_request_flow(self, mock_memory, mock_agent_class, mock_invoke):
+    def test_full_request_flow(self, mock_memory, mock_agent_class, mock_invoke, fresh_agent_pool):
         """Test complete request flow from event to response"""
         # Setup mocks
         mock_memory.return_value = Mock()
@@ -172,5 +182,120 @@ class TestLambdaHandlerIntegration:
         
         # Verify call chain
         mock_memory.assert_called_once()
-        mock_agent_class.assert_called_once_with(mock_memory.return_value)
+        mock_agent_class.assert_called_once_with(mock_memory.return_value, fresh_agent_pool.return_value)
         mock_invoke.assert_called_once_with(mock_agent_instance, "What is the carbon tax rate?")
+
+
+class TestWarmAgentReuse:
+    """Agents are pooled per session across invocations of a warm container"""
+
+    @pytest.fixture
+    def mocks(self):
+        with patch('src.runtime.handler.setup_memory') as mock_memory, \
+             patch('src.runtime.handler.BudgetAgent') as mock_agent_class, \
+             patch('src.runtime.handler.invoke_agent') as mock_invoke:
+            mock_agent_class.side_effect = lambda *args: Mock()
+            mock_invoke.return_value = "answer"
+            yield mock_memory, mock_agent_class, mock_invoke
+
+    @staticmethod
+    def event(query, **ids):
+        return {"body": json.dumps({"query": query, **ids})}
+
+    def test_same_session_reuses_agent(self, mocks):
+        mock_memory, mock_agent_class, mock_invoke = mocks
+
+        lambda_handler(self.event("first", session_id="s1", actor_id="a1"), Mock())
+        lambda_handler(self.event("second", session_id="s1", actor_id="a1"), Mock())
+
+        assert mock_agent_class.call_count == 1
+        assert mock_memory.call_count == 1
+        first_agent = mock_invoke.call_args_list[0][0][0]
+        assert mock_invoke.call_args_list[1][0][0] is first_agent
+        assert handler.get_agent_pool().stats()["hits"] == 1
+
+    def test_sessions_get_their_own_agents(self, mocks):
+        _, mock_agent_class, mock_invoke = mocks
+
+        lambda_handler(self.event("q", session_id="s1", actor_id="a1"), Mock())
+        lambda_handler(self.event("q", session_id="s2", actor_id="a1"), Mock())
+        lambda_handler(self.event("q", session_id="s1", actor_id="other"), Mock())
+
+        assert mock_agent_class.call_count == 3
+        agents = {id(call[0][0]) for call in mock_invoke.call_args_list}
+        assert len(agents) == 3
+
+    def test_requests_without_ids_start_new_sessions(self, mocks):
+        _, mock_agent_class, _ = mocks
+
+        first = json.loads(lambda_handler(self.event("q"), Mock())["body"])
+        second = json.loads(lambda_handler(self.event("q"), Mock())["body"])
+
+        assert mock_agent_class.call_count == 2
+        assert first["session_id"] != second["session_id"]
+        assert first["actor_id"] != second["actor_id"]
+
+    def test_returned_ids_continue_the_conversation(self, mocks):
+        mock_memory, mock_agent_class, _ = mocks
+
+        first = json.loads(lambda_handler(self.event("q"), Mock())["body"])
+        lambda_handler(self.event("follow-up", actor_id=first["actor_id"], session_id=first["session_id"]), Mock())
+
+        assert mock_agent_class.call_count == 1
+        mock_memory.assert_called_once_with(first["actor_id"], first["session_id"])
+
+    def test_memory_session_uses_request_ids(self, mocks):
+        mock_memory, _, _ = mocks
+
+        response = lambda_handler(self.event("q", actor_id="analyst-7", session_id="s1"), Mock())
+
+        mock_memory.assert_called_once_with("analyst-7", "s1")
+        body = json.loads(response["body"])
+        assert (body["actor_id"], body["session_id"]) == ("analyst-7", "s1")
+
+    @pytest.mark.parametrize("ids", [
+        {"session_id": "../other", "actor_id": "a1"},
+        {"actor_id": "a b"},
+        {"session_id": "x" * 101, "actor_id": "a1"},
+        {"session_id": "s1"},
+        {"actor_id": 42}
+    ])
+    def test_invalid_ids_rejected(self, mocks, ids):
+        _, mock_agent_class, _ = mocks
+
+        response = lambda_handler(self.event("q", **ids), Mock())
+
+        assert response["statusCode"] == 400
+        assert "_id'" in json.loads(response["body"])["error"]
+        mock_agent_class.assert_not_called()
+
+    def test_evicted_agent_flushes_its_memory_session(self, mocks):
+        _, _, mock_invoke = mocks
+
+        with patch('src.runtime.handler.AGENT_POOL_SIZE', 1):
+            lambda_handler(self.event("q", session_id="s1", actor_id="a1"), Mock())
+            lambda_handler(self.event("q", session_id="s2", actor_id="a1"), Mock())
+
+        first_agent, second_agent = [call[0][0] for call in mock_invoke.call_args_list]
+        first_agent.session_manager.close.assert_called_once()
+        second_agent.session_manager.close.assert_not_called()
+
+    def test_failed_run_discards_agent(self, mocks):
+        _, mock_agent_class, mock_invoke = mocks
+        mock_invoke.side_effect = [Exception("model error"), "answer"]
+
+        failed = lambda_handler(self.event("q", session_id="s1", actor_id="a1"), Mock())
+        retried = lambda_handler(self.event("q", session_id="s1", actor_id="a1"), Mock())
+
+        assert failed["statusCode"] == 500
+        assert retried["statusCode"] == 200
+        assert mock_agent_class.call_count == 2
+
+    def test_agents_share_one_model_client(self, mocks, fresh_agent_pool):
+        _, mock_agent_class, _ = mocks
+
+        lambda_handler(self.event("q", session_id="s1", actor_id="a1"), Mock())
+        lambda_handler(self.event("q", session_id="s2", actor_id="a1"), Mock())
+
+        models = [call[0][1] for call in mock_agent_class.call_args_list]
+        assert models == [fresh_agent_pool.return_value] * 2
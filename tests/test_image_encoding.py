@@ -0,0 +1,78 @@
+"""
+Unit tests for grounding image encoding profiles
+Tests profile parsing, S3 key suffixes and encoding options
+"""
+import io
+import pytest
+from PIL import Image, ImageDraw
+from src.rag.image_encoding import DEFAULT_PROFILE, EncodingProfile, encode_image, parse_profile
+
+
+@pytest.fixture
+def text_image():
+    """RGB crop with dark text-like strokes and a red highlight border"""
+    img = Image.new("RGB", (1200, 800), "white")
+    draw = ImageDraw.Draw(img)
+    for y in range(40, 760, 24):
+        draw.line([(40, y), (1100, y)], fill=(30, 30, 30), width=2)
+    draw.rectangle([10, 10, 1189, 789], outline="red", width=3)
+    return img
+
+
+class TestEncodingProfile:
+    """Test suite for EncodingProfile and parse_profile"""
+
+    def test_default_profile_keeps_png_keys(self):
+        """Test the default profile leaves existing S3 keys unchanged"""
+        assert parse_profile("png") == DEFAULT_PROFILE
+        assert DEFAULT_PROFILE.key_suffix("table") == ".png"
+        assert DEFAULT_PROFILE.content_type == "image/png"
+
+    def test_spec_overrides_fields(self):
+        """Test a spec sets format and options"""
+        profile = parse_profile("webp, quality=70, max_pixels=500000, grayscale_text=true")
+
+        assert profile == EncodingProfile("webp", quality=70, max_pixels=500000, grayscale_text=True)
+        assert profile.key_suffix("text") == "_q70-px500000-gray.webp"
+        assert profile.key_suffix("table") == "_q70-px500000.webp"
+
+    def test_invalid_spec_raises(self):
+        """Test unknown formats and fields are rejected"""
+        with pytest.raises(ValueError):
+            parse_profile("gif")
+        with pytest.raises(ValueError):
+            parse_profile("png,speed=3")
+
+
+class TestEncodeImage:
+    """Test suite for encode_image"""
+
+    def test_formats_are_decodable(self, text_image):
+        """Test each format produces an image of the same size"""
+        for spec, pil_format in [("png", "PNG"), ("webp", "WEBP"), ("jpeg", "JPEG")]:
+            data = encode_image(text_image, parse_profile(spec))
+            decoded = Image.open(io.BytesIO(data))
+            assert decoded.format == pil_format
+            assert decoded.size == text_image.size
+
+    def test_max_pixels_downscales(self, text_image):
+        """Test images above the pixel budget are downscaled keeping aspect ratio"""
+        data = encode_image(text_image, EncodingProfile(max_pixels=240_000))
+
+        decoded = Image.open(io.BytesIO(data))
+        assert decoded.width * decoded.height <= 240_000
+        assert abs(decoded.width / decoded.height - 1.5) < 0.01
+
+    def test_grayscale_only_for_text_chunks(self, text_image):
+        """Test grayscale_text converts text chunks and leaves tables in color"""
+        profile = EncodingProfile(grayscale_text=True)
+
+        assert Image.open(io.BytesIO(encode_image(text_image, profile, "text"))).mode == "L"
+        assert Image.open(io.BytesIO(encode_image(text_image, profile, "table"))).mode == "RGB"
+
+    def test_webp_is_smaller_than_default_png(self, text_image):
+        """Test the lossy profile shrinks the upload"""
+        png = encode_image(text_image, DEFAULT_PROFILE)
+        webp = encode_image(text_image, parse_profile("webp,quality=75"))
+
+        assert len(webp) < len(png)
@@ -0,0 +1,174 @@
+"""
+Unit tests for the deferred chunk image endpoint
+Tests URL signing, render-on-first-GET redirects and error responses
+"""
+from urllib.parse import urlparse, parse_qsl
+import pytest
+from unittest.mock import Mock, patch
+from src.rag.deferred_images import build_chunk_image_url, parse_chunk_image_request
+from src.runtime.image_handler import image_handler
+
+ENDPOINT = "https://api.example.com/chunk-image"
+SECRET = "test-secret"
+
+
+def query_params(url):
+    return dict(parse_qsl(urlparse(url).query))
+
+
+class TestDeferredImageUrls:
+    """Test suite for deferred image URL building and parsing"""
+
+    def test_url_round_trips(self):
+        """Test the endpoint recovers the crop parameters from the URL"""
+        url = build_chunk_image_url("budget", 4, [0.1, 0.2, 0.5, 0.6], "chunk_1", "table", ENDPOINT, SECRET)
+
+        assert url.startswith(ENDPOINT + "?")
+        assert parse_chunk_image_request(query_params(url), SECRET) == (
+            "budget", 4, [0.1, 0.2, 0.5, 0.6], "chunk_1", "table"
+        )
+
+    def test_url_is_stable(self):
+        """Test the same chunk always gets the same URL"""
+        first = build_chunk_image_url("budget", 4, [0.1, 0.2, 0.5, 0.6], "chunk_1", "table", ENDPOINT, SECRET)
+        second = build_chunk_image_url("budget", 4, [0.1, 0.2, 0.5, 0.6], "chunk_1", "table", ENDPOINT, SECRET)
+
+        assert first == second
+
+    def test_tampered_url_is_rejected(self):
+        """Test changing a signed parameter invalidates the request"""
+        params = query_params(build_chunk_image_url("budget", 4, [0.1, 0.2, 0.5, 0.6], "chunk_1", "table", ENDPOINT, SECRET))
+        params["bbox"] = "[0,0,1,1]"
+
+        assert parse_chunk_image_request(params, SECRET) is None
+
+    def test_no_secret_accepts_nothing(self):
+        """Test unsigned requests are never valid, even without a configured secret"""
+        params = {"doc": "../../secret", "page": "0", "bbox": "[0,0,1,1]", "chunk_id": "victim-id"}
+
+        assert parse_chunk_image_request(params, "") is None
+
+    def test_no_secret_builds_no_urls(self):
+        """Test URLs are never handed out unsigned"""
+        with pytest.raises(ValueError):
+            build_chunk_image_url("budget", 4, [0.1, 0.2, 0.5, 0.6], "chunk_1", "table", ENDPOINT, "")
+
+
+class TestImageHandler:
+    """Test suite for image_handler"""
+
+    @pytest.fixture(autouse=True)
+    def env(self, monkeypatch):
+        monkeypatch.setenv("S3_BUCKET", "test-bucket")
+        monkeypatch.setattr("src.rag.deferred_images.CHUNK_IMAGE_URL_SECRET", SECRET)
+
+    @pytest.fixture(autouse=True)
+    def mock_index(self):
+        with patch("src.runtime.image_handler.chunk_index") as mock:
+            mock.get.side_effect = lambda chunk_id: {
+                "chunk_id": "chunk_1",
+                "chunk_type": "table",
+                "page": 4,
+                "bbox": [0.1, 0.2, 0.5, 0.6],
+                "source_document": "budget"
+            } if chunk_id == "chunk_1" else None
+            yield mock
+
+    @pytest.fixture(autouse=True)
+    def mock_shards(self):
+        with patch("src.runtime.image_handler.chunk_shard_reader") as mock:
+            mock.read_chunk.return_value = None
+            yield mock
+
+    @pytest.fixture
+    def mock_extract(self):
+        with patch("src.runtime.image_handler.extract_chunk_image") as mock:
+            mock.return_value = "https://signed/output/budget_chunk_images/budget_chunk_1.png"
+            yield mock
+
+    def make_event(self, **overrides):
+        url = build_chunk_image_url("budget", 4, [0.1, 0.2, 0.5, 0.6], "chunk_1", "table", ENDPOINT, SECRET)
+        params = query_params(url)
+        params.update(overrides)
+        return {"queryStringParameters": params}
+
+    def test_redirects_to_rendered_image(self, mock_extract):
+        """Test a valid request is rendered (or reused) and redirected to S3"""
+        response = image_handler(self.make_event(), None)
+
+        assert response["statusCode"] == 302
+        assert response["headers"]["Location"] == "https://signed/output/budget_chunk_images/budget_chunk_1.png"
+        kwargs = mock_extract.call_args.kwargs
+        assert kwargs["bucket"] == "test-bucket"
+        assert kwargs["source_pdf_key"] == "input/gov_data/budget.pdf"
+        assert kwargs["page_num"] == 4
+        assert kwargs["chunk_type"] == "table"
+
+    def test_invalid_signature_is_rejected(self, mock_extract):
+        """Test unsigned regions are never rendered"""
+        response = image_handler(self.make_event(sig="forged"), None)
+
+        assert response["statusCode"] == 400
+        mock_extract.assert_not_called()
+
+    def test_missing_image_returns_404(self, mock_extract):
+        """Test a crop that cannot be rendered returns not found"""
+        mock_extract.return_value = None
+
+        response = image_handler(self.make_event(), None)
+
+        assert response["statusCode"] == 404
+
+    def test_unexpected_error_returns_500(self, mock_extract):
+        """Test unexpected failures are reported as server errors"""
+        mock_extract.side_effect = RuntimeError("boom")
+
+        response = image_handler(self.make_event(), None)
+
+        assert response["statusCode"] == 500
+
+    def test_missing_secret_serves_nothing(self, mock_extract, monkeypatch):
+        """Test the endpoint refuses to render without a signing secret"""
+        event = self.make_event()
+        monkeypatch.setattr("src.rag.deferred_images.CHUNK_IMAGE_URL_SECRET", "")
+
+        response = image_handler(event, None)
+
+        assert response["statusCode"] == 503
+        mock_extract.assert_not_called()
+
+    def test_unindexed_chunk_is_rejected(self, mock_extract):
+        """Test signed parameters of an unknown chunk are not rendered"""
+        url = build_chunk_image_url("budget", 4, [0.1, 0.2, 0.5, 0.6], "other_chunk", "table", ENDPOINT, SECRET)
+
+        response = image_handler({"queryStringParameters": query_params(url)}, None)
+
+        assert response["statusCode"] == 404
+        mock_extract.assert_not_called()
+
+    def test_unindexed_chunk_is_read_from_shards(self, mock_extract, mock_shards):
+        """Test a chunk ingested since the index last refreshed is verified against its shard"""
+        url = build_chunk_image_url("budget", 2, [0.1, 0.2, 0.5, 0.6], "new_chunk", "text", ENDPOINT, SECRET)
+        mock_shards.read_chunk.return_value = {"chunk_id": "new_chunk", "chunk_type": "text", "page": 2,
+                                               "bbox": [0.1, 0.2, 0.5, 0.6], "source_document": "budget"}
+
+        response = image_handler({"queryStringParameters": query_params(url)}, None)
+
+        assert response["statusCode"] == 302
+        assert mock_shards.read_chunk.call_args[0][2:] == ("budget", "new_chunk")
+        assert mock_extract.call_args.kwargs["page_num"] == 2
+
+    @pytest.mark.parametrize("doc, page, bbox, chunk_type", [
+        ("../../secret", 4, [0.1, 0.2, 0.5, 0.6], "table"),
+        ("budget", 0, [0.1, 0.2, 0.5, 0.6], "table"),
+        ("budget", 4, [0, 0, 1, 1], "table"),
+        ("budget", 4, [0.1, 0.2, 0.5, 0.6], "text")
+    ])
+    def test_parameters_must_match_index(self, mock_extract, doc, page, bbox, chunk_type):
+        """Test a crop differing from the indexed chunk never lands under its image key"""
+        url = build_chunk_image_url(doc, page, bbox, "chunk_1", chunk_type, ENDPOINT, SECRET)
+
+        response = image_handler({"queryStringParameters": query_params(url)}, None)
+
+        assert response["statusCode"] == 404
+        mock_extract.assert_not_called()
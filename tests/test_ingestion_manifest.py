@@ -0,0 +1,200 @@
+"""
+Unit tests for the ingestion manifest
+Tests chunk id stabilization, unchanged-document skipping and orphan cleanup
+"""
+import io
+import json
+import uuid
+import fitz
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+from src.ingestion import ade_s3_handler
+from src.ingestion.rate_limiter import TokenBucket
+from src.ingestion.ingestion_manifest import apply_chunk_ids, build_manifest, diff_chunks, manifest_key
+
+
+def make_record(chunk_id, text, page=0):
+    return {"chunk_id": chunk_id, "chunk_type": "text", "text": text, "bbox": [0.1, 0.1, 0.9, 0.2], "page": page}
+
+
+def build_pdf(texts):
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page().insert_text((72, 72), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class ClientError(Exception):
+    pass
+
+
+class FakeS3:
+    """In-memory S3 stand-in for the ingestion handler"""
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = []
+        self.exceptions = SimpleNamespace(ClientError=ClientError)
+
+    def put_object(self, Bucket, Key, Body=b"", ContentType=None):
+        self.objects[Key] = Body
+        self.puts.append(Key)
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError("NoSuchKey")
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError("404")
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.objects.pop(obj["Key"], None)
+        return {}
+
+
+class StubADE:
+    """Local stand-in for LandingAIADE: one chunk per page with a fresh random id, like ADE"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def parse(self, document, model=None):
+        self.calls += 1
+        with fitz.open(str(document)) as doc:
+            texts = [page.get_text().strip() for page in doc]
+        ids = [str(uuid.uuid4()) for _ in texts]
+        chunks = [
+            SimpleNamespace(
+                id=chunk_id, type="text", markdown=f"<a id='{chunk_id}'></a>\n\n{text}",
+                grounding=SimpleNamespace(page=page, box=SimpleNamespace(left=0.1, top=0.1, right=0.9, bottom=0.2))
+            )
+            for page, (chunk_id, text) in enumerate(zip(ids, texts))
+        ]
+        markdown = "\n\n".join(c.markdown for c in chunks)
+        return SimpleNamespace(markdown=markdown, chunks=chunks, splits=[], metadata={})
+
+
+class TestChunkDiff:
+    """Test suite for diff_chunks and apply_chunk_ids"""
+
+    def test_identical_chunks_keep_previous_ids(self):
+        """Test unchanged content maps to old ids and removed content is orphaned"""
+        previous = build_manifest("input/b.pdf", "h1", [
+            make_record("old-a", "Revenue"), make_record("old-b", "Spending", page=1)
+        ], "both")
+        records = [make_record("new-a", "Revenue"), make_record("new-c", "Deficit", page=1)]
+
+        diff = diff_chunks(records, previous)
+
+        assert diff.id_map == {"new-a": "old-a"}
+        assert diff.unchanged == {"old-a"}
+        assert diff.orphans == {"old-b": "text"}
+
+    def test_moved_chunk_is_changed(self):
+        """Test the same text on another page is not reused"""
+        previous = build_manifest("input/b.pdf", "h1", [make_record("old-a", "Revenue")], "both")
+
+        diff = diff_chunks([make_record("new-a", "Revenue", page=3)], previous)
+
+        assert diff.id_map == {}
+        assert diff.orphans == {"old-a": "text"}
+
+    def test_anchor_ids_do_not_change_the_hash(self):
+        """Test chunks re-parsed with fresh anchored ids still match"""
+        previous = build_manifest("input/b.pdf", "h1", [make_record("old-a", "<a id='old-a'></a>\n\nRevenue")], "both")
+
+        diff = diff_chunks([make_record("new-a", "<a id='new-a'></a>\n\nRevenue")], previous)
+
+        assert diff.id_map == {"new-a": "old-a"}
+        assert diff.orphans == {}
+
+    def test_apply_renames_anchors_and_splits(self):
+        parsed = {
+            "markdown": "<a id='new-a'></a> Revenue",
+            "chunks": [{"id": "new-a", "markdown": "<a id='new-a'></a> Revenue"}],
+            "splits": [{"chunks": ["new-a", "new-b"], "pages": [0], "markdown": ""}],
+            "metadata": {}
+        }
+
+        renamed = apply_chunk_ids(parsed, {"new-a": "old-a"})
+
+        assert renamed["markdown"] == "<a id='old-a'></a> Revenue"
+        assert renamed["chunks"][0]["id"] == "old-a"
+        assert renamed["splits"][0]["chunks"] == ["old-a", "new-b"]
+
+
+class TestIncrementalIngestion:
+    """Test suite for re-ingesting revised documents through ade_handler"""
+
+    @pytest.fixture
+    def env(self):
+        s3 = FakeS3()
+        stub = StubADE()
+        with patch.object(ade_s3_handler, "s3", s3), \
+                patch.object(ade_s3_handler, "client", stub), \
+                patch.object(ade_s3_handler, "ade_limiter", TokenBucket(rate=0, capacity=1)), \
+                patch.object(ade_s3_handler, "CHUNK_LAYOUT", "both"), \
+                patch.object(ade_s3_handler, "FORCE_REPROCESS", False), \
+                patch.object(ade_s3_handler, "PRERENDER_CHUNK_IMAGES", False), \
+                patch.object(ade_s3_handler.grounding_manifest, "flush"):
+            yield s3, stub
+
+    def upload(self, s3, pdf_bytes):
+        s3.objects["input/budget.pdf"] = pdf_bytes
+        event = {"Records": [{"s3": {"bucket": {"name": "b"}, "object": {"key": "input/budget.pdf"}}}]}
+        s3.puts.clear()
+        return ade_s3_handler.ade_handler(event, None)["results"][0]
+
+    def chunk_files(self, s3):
+        return sorted(k for k in s3.objects if "_chunks/" in k)
+
+    def test_unchanged_document_is_not_parsed(self, env):
+        s3, stub = env
+        pdf_bytes = build_pdf(["Revenue", "Spending"])
+        self.upload(s3, pdf_bytes)
+
+        result = self.upload(s3, pdf_bytes)
+
+        assert result["status"] == "skipped"
+        assert result["reason"] == "unchanged"
+        assert stub.calls == 1
+
+    def test_revision_rewrites_only_changed_chunks(self, env):
+        s3, stub = env
+        self.upload(s3, build_pdf(["Revenue", "Spending", "Debt"]))
+        first_files = self.chunk_files(s3)
+        manifest = json.loads(s3.objects[manifest_key("budget")])
+
+        result = self.upload(s3, build_pdf(["Revenue", "Spending", "Deficit"]))
+
+        assert stub.calls == 2
+        assert result["chunks"] == {"unchanged": 2, "changed": 1, "removed": 1}
+        written_chunk_files = [k for k in s3.puts if "_chunks/" in k]
+        assert len(written_chunk_files) == 1
+        files = self.chunk_files(s3)
+        assert len(files) == 3
+        # Two of the three chunk files survive unchanged with their ids
+        assert len(set(files) & set(first_files)) == 2
+        new_manifest = json.loads(s3.objects[manifest_key("budget")])
+        assert len(set(new_manifest["chunks"]) & set(manifest["chunks"])) == 2
+        # Markdown anchors point at the stable ids
+        markdown = s3.objects["output/budget.md"].decode("utf-8")
+        assert all(f"<a id='{chunk_id}'>" in markdown for chunk_id in new_manifest["chunks"])
+
+    def test_native_text_revision_keeps_unchanged_chunks(self, env):
+        s3, stub = env
+        with patch.object(ade_s3_handler, "NATIVE_TEXT_FAST_PATH", True):
+            self.upload(s3, build_pdf(["Revenue", "Spending", "Debt"]))
+            first_files = self.chunk_files(s3)
+
+            result = self.upload(s3, build_pdf(["Revenue", "Spending", "Deficit"]))
+
+        assert result["chunks"] == {"unchanged": 2, "changed": 1, "removed": 1}
+        assert len(set(self.chunk_files(s3)) & set(first_files)) == 2
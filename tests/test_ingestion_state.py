@@ -0,0 +1,244 @@
+"""
+Unit tests for checkpointed, resumable ingestion
+Tests stage checkpoints, resuming after a crash and re-invocation before the timeout
+"""
+import threading
+import time
+import pytest
+from unittest.mock import Mock, patch
+from src.ingestion import ade_s3_handler
+from src.ingestion.rate_limiter import TokenBucket
+from src.ingestion.ingestion_state import (
+    CONTINUATION_KEY, INGESTION_MAX_CONTINUATIONS, STAGE_OUTPUTS_WRITTEN, next_continuation, stage_reached, state_key
+)
+from tests.test_ingestion_manifest import FakeS3, StubADE, build_pdf
+
+EVENT = {"Records": [{"s3": {"bucket": {"name": "b"}, "object": {"key": "input/budget.pdf"}}}]}
+
+
+class FakeContext:
+    """Lambda context whose remaining time drops after a number of checks"""
+
+    def __init__(self, checks_before_low=None):
+        self.checks = 0
+        self.checks_before_low = checks_before_low
+        self.function_name = "ade-s3-handler"
+
+    def get_remaining_time_in_millis(self):
+        self.checks += 1
+        if self.checks_before_low is not None and self.checks > self.checks_before_low:
+            return 1000
+        return 800_000
+
+
+class TestResumableIngestion:
+    """Test suite for stage checkpoints in ade_handler"""
+
+    @pytest.fixture
+    def env(self):
+        s3 = FakeS3()
+        s3.objects["input/budget.pdf"] = build_pdf([f"Budget page {i}" for i in range(7)])
+        stub = StubADE()
+        with patch.object(ade_s3_handler, "s3", s3), \
+                patch.object(ade_s3_handler, "client", stub), \
+                patch.object(ade_s3_handler, "ade_limiter", TokenBucket(rate=0, capacity=1)), \
+                patch.object(ade_s3_handler, "CHUNK_LAYOUT", "both"), \
+                patch.object(ade_s3_handler, "FORCE_REPROCESS", False), \
+                patch.object(ade_s3_handler, "PRERENDER_CHUNK_IMAGES", False), \
+                patch.object(ade_s3_handler, "INGESTION_CHECKPOINT_EVERY", 2), \
+                patch.object(ade_s3_handler, "reinvoke") as reinvoke, \
+                patch.object(ade_s3_handler.grounding_manifest, "flush"):
+            yield s3, stub, reinvoke
+
+    def chunk_files(self, s3):
+        return [k for k in s3.objects if "_chunks/" in k]
+
+    def test_stops_and_reinvokes_before_timeout(self, env):
+        """Test a run low on time checkpoints its chunk files and re-invokes itself"""
+        s3, stub, reinvoke = env
+
+        # Time runs low at the first chunk checkpoint
+        result = ade_s3_handler.ade_handler(EVENT, FakeContext(checks_before_low=1))["results"][0]
+
+        assert result["status"] == "in_progress"
+        assert result["chunks_written"] == 2
+        assert len(self.chunk_files(s3)) == 2
+        reinvoke.assert_called_once()
+        continued = reinvoke.call_args[0][1]
+        assert continued == {"Records": [{**EVENT["Records"][0], CONTINUATION_KEY: {"hops": 1, "progress": ["chunks", 2]}}]}
+
+        # The re-invocation finishes without parsing again
+        result = ade_s3_handler.ade_handler(continued, FakeContext())["results"][0]
+
+        assert result["status"] == "success"
+        assert stub.calls == 1
+        assert len(self.chunk_files(s3)) == 7
+        assert state_key("budget") not in s3.objects
+        assert reinvoke.call_count == 1
+
+    def test_resumes_after_crash_without_reparsing(self, env):
+        """Test a failed run resumes from the parsed checkpoint"""
+        s3, stub, _ = env
+        with patch.object(ade_s3_handler, "write_chunk_index", side_effect=RuntimeError("crash")):
+            result = ade_s3_handler.ade_handler(EVENT, FakeContext())["results"][0]
+        assert result["status"] == "failed"
+        assert state_key("budget") in s3.objects
+
+        result = ade_s3_handler.ade_handler(EVENT, FakeContext())["results"][0]
+
+        assert result["status"] == "success"
+        assert stub.calls == 1
+        assert len(self.chunk_files(s3)) == 7
+
+    def test_new_upload_discards_old_checkpoint(self, env):
+        """Test a checkpoint of a previous version of the file is not resumed"""
+        s3, stub, _ = env
+        with patch.object(ade_s3_handler, "write_chunk_index", side_effect=RuntimeError("crash")):
+            ade_s3_handler.ade_handler(EVENT, FakeContext())
+        s3.objects["input/budget.pdf"] = build_pdf(["Revised budget"])
+
+        result = ade_s3_handler.ade_handler(EVENT, FakeContext())["results"][0]
+
+        assert result["status"] == "success"
+        assert stub.calls == 2
+
+    def test_defers_records_when_out_of_time(self, env):
+        """Test records not yet started are handed to the next invocation"""
+        s3, stub, reinvoke = env
+
+        result = ade_s3_handler.ade_handler(EVENT, FakeContext(checks_before_low=0))["results"][0]
+
+        assert result["stage"] == "queued"
+        assert stub.calls == 0
+        reinvoke.assert_called_once()
+
+    def test_failed_reinvoke_marks_records_failed(self, env):
+        """Test documents are reported failed when the continuation cannot be queued"""
+        s3, stub, reinvoke = env
+        reinvoke.return_value = False
+
+        result = ade_s3_handler.ade_handler(EVENT, FakeContext(checks_before_low=1))["results"][0]
+
+        reinvoke.assert_called_once()
+        assert result["status"] == "failed"
+        assert "re-invoke" in result["error"]
+        assert state_key("budget") in s3.objects
+
+    def test_gives_up_without_progress(self, env):
+        """Test a continuation that stops where the previous one did fails instead of re-invoking"""
+        s3, stub, reinvoke = env
+        ade_s3_handler.ade_handler(EVENT, FakeContext(checks_before_low=1))
+        # The previous continuation already got to 4 chunk files; this run stops there again
+        stalled = {"Records": [{**EVENT["Records"][0], CONTINUATION_KEY: {"hops": 1, "progress": ["chunks", 4]}}]}
+
+        result = ade_s3_handler.ade_handler(stalled, FakeContext(checks_before_low=1))["results"][0]
+
+        assert result["chunks_written"] == 4
+        assert result["status"] == "failed"
+        assert "no progress" in result["error"]
+        assert reinvoke.call_count == 1
+
+    def test_gives_up_after_max_continuations(self, env):
+        """Test a document is failed once it used up its continuations"""
+        s3, stub, reinvoke = env
+        marker = {"hops": INGESTION_MAX_CONTINUATIONS, "progress": None}
+        exhausted = {"Records": [{**EVENT["Records"][0], CONTINUATION_KEY: marker}]}
+
+        result = ade_s3_handler.ade_handler(exhausted, FakeContext(checks_before_low=1))["results"][0]
+
+        assert result["status"] == "failed"
+        assert f"{INGESTION_MAX_CONTINUATIONS} continuations" in result["error"]
+        reinvoke.assert_not_called()
+
+    def test_continuation_markers(self):
+        record = EVENT["Records"][0]
+        chunks = {"status": "in_progress", "stage": "chunks", "chunks_written": 4}
+        images = {"status": "in_progress", "stage": "images", "prerender": {"rendered": 9}}
+        queued = {"status": "in_progress", "stage": "queued"}
+
+        first, _ = next_continuation(record, chunks)
+        assert first == {"hops": 1, "progress": ["chunks", 4]}
+        second, _ = next_continuation({**record, CONTINUATION_KEY: first}, images)
+        assert second == {"hops": 2, "progress": ["images", 9]}
+        # A deferred record keeps its progress, so a later stall is still caught
+        deferred, _ = next_continuation({**record, CONTINUATION_KEY: second}, queued)
+        assert deferred == {"hops": 3, "progress": ["images", 9]}
+        stalled, reason = next_continuation({**record, CONTINUATION_KEY: deferred}, images)
+        assert stalled is None and "no progress" in reason
+
+    def test_stage_order(self):
+        assert stage_reached({"stage": "chunks_written"}, STAGE_OUTPUTS_WRITTEN)
+        assert not stage_reached({"stage": "parsed"}, STAGE_OUTPUTS_WRITTEN)
+        assert not stage_reached(None, "parsed")
+
+
+class TestConcurrentRecords:
+    """Test suite for processing the records of one event concurrently"""
+
+    @pytest.fixture
+    def env(self):
+        s3 = FakeS3()
+        stub = SlowStubADE()
+        with patch.object(ade_s3_handler, "s3", s3), \
+                patch.object(ade_s3_handler, "client", stub), \
+                patch.object(ade_s3_handler, "CHUNK_LAYOUT", "shards"), \
+                patch.object(ade_s3_handler, "FORCE_REPROCESS", False), \
+                patch.object(ade_s3_handler, "PRERENDER_CHUNK_IMAGES", False), \
+                patch.object(ade_s3_handler, "INGESTION_RECORD_CONCURRENCY", 3), \
+                patch.object(ade_s3_handler, "ade_limiter", TokenBucket(rate=0, capacity=1)), \
+                patch.object(ade_s3_handler, "reinvoke"), \
+                patch.object(ade_s3_handler.grounding_manifest, "flush"):
+            yield s3, stub
+
+    def make_event(self, s3, names):
+        records = []
+        for name in names:
+            s3.objects[f"input/{name}.pdf"] = build_pdf([f"{name} page"])
+            records.append({"s3": {"bucket": {"name": "b"}, "object": {"key": f"input/{name}.pdf"}}})
+        records.append({"s3": {"bucket": {"name": "b"}, "object": {"key": "input/"}}})
+        return {"Records": records}
+
+    def test_records_run_concurrently_in_order(self, env):
+        """Test documents overlap, keep the record order and set up folders once"""
+        s3, stub = env
+        names = [f"budget_{i}" for i in range(6)]
+
+        results = ade_s3_handler.ade_handler(self.make_event(s3, names), FakeContext())["results"]
+
+        assert [r["source"] for r in results] == [f"s3://b/input/{name}.pdf" for name in names]
+        assert all(r["status"] == "success" for r in results)
+        assert stub.max_active == 3
+        assert s3.puts.count("input/") == 1
+
+    def test_failures_are_isolated(self, env):
+        """Test one failing document does not affect the others"""
+        s3, stub = env
+        stub.fail_on = "budget_1"
+
+        results = ade_s3_handler.ade_handler(self.make_event(s3, ["budget_0", "budget_1", "budget_2"]), FakeContext())["results"]
+
+        assert [r["status"] for r in results] == ["success", "failed", "success"]
+
+
+class SlowStubADE(StubADE):
+    """StubADE that takes a while per call and tracks concurrent calls"""
+
+    def __init__(self):
+        super().__init__()
+        self.active = 0
+        self.max_active = 0
+        self.fail_on = None
+        self._lock = threading.Lock()
+
+    def parse(self, document, model=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(0.05)
+            if self.fail_on and self.fail_on in str(document):
+                raise RuntimeError("ADE error")
+            return super().parse(document, model)
+        finally:
+            with self._lock:
+                self.active -= 1
@@ -2,10 +2,26 @@
 Unit tests for memory management
 Tests session creation, retrieval, and error handling
 """
+import io
+import os
+import json
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime
-from src.rag.memory import setup_memory
+from src.rag import memory
+from src.rag.memory import provision_memory, setup_memory
+
+
+@pytest.fixture(autouse=True)
+def fresh_memory_client():
+    """The memory client and memory ID are cached per process; start every test without them"""
+    memory.memory_client = None
+    memory.clear_memory_id_cache()
+    with patch.dict(os.environ):
+        os.environ.pop("BUDGET_MEMORY_ID", None)
+        yield
+    memory.memory_client = None
+    memory.clear_memory_id_cache()
 
 
 class TestMemorySetup:
@@ -45,7 +61,19 @@ class TestMemorySetup:
         # Should create session manager with existing memory ID
         mock_session_manager.assert_called_once()
     
-    def test_creates_new_memory_when_none_exists(self, mock_memory_client, mock_session_manager):
+    def test_never_creates_memory_in_request(self, mock_memory_client, mock_session_manager):
+        """Test that a request without a provisioned memory runs without one"""
+        mock_memory_client.gmcp_client.list_memories.return_value = {
+            'memories': []
+        }
+        
+        result = setup_memory()
+        
+        mock_memory_client.create_memory_and_wait.assert_not_called()
+        mock_session_manager.assert_not_called()
+        assert result is None
+    
+    def test_provision_creates_memory_when_none_exists(self, mock_memory_client):
         """Test memory creation when no existing memory found"""
         # Setup mock to return empty list
         mock_memory_client.gmcp_client.list_memories.return_value = {
@@ -53,15 +81,25 @@ class TestMemorySetup:
         }
         
         # Mock the create_memory_and_wait response
-        mock_memory_client.create_memory_and_wait.return_value = Mock(id='new_memory_id')
+        mock_memory_client.create_memory_and_wait.return_value = {'id': 'BudgetAgentMemory_new'}
         
-        result = setup_memory()
+        memory_id = provision_memory()
         
         # Should create new memory
         mock_memory_client.create_memory_and_wait.assert_called_once()
         call_kwargs = mock_memory_client.create_memory_and_wait.call_args[1]
         assert 'BudgetAgentMemory' in call_kwargs['name']
         assert 'strategies' in call_kwargs
+        assert memory_id == 'BudgetAgentMemory_new'
+    
+    def test_provision_reuses_existing_memory(self, mock_memory_client):
+        """Test that provisioning twice does not create a second memory"""
+        mock_memory_client.gmcp_client.list_memories.return_value = {
+            'memories': [{'id': 'BudgetAgentMemory_1', 'createdAt': '2026-02-04T12:00:00Z'}]
+        }
+        
+        assert provision_memory() == 'BudgetAgentMemory_1'
+        mock_memory_client.create_memory_and_wait.assert_not_called()
     
     def test_uses_most_recent_memory(self, mock_memory_client, mock_session_manager):
         """Test that most recent memory is selected when multiple exist"""
@@ -93,9 +131,9 @@ class TestMemorySetup:
     def test_memory_strategies_configuration(self, mock_memory_client, mock_session_manager):
         """Test that memory is created with correct strategies"""
         mock_memory_client.gmcp_client.list_memories.return_value = {'memories': []}
-        mock_memory_client.create_memory_and_wait.return_value = Mock(id='new_memory')
+        mock_memory_client.create_memory_and_wait.return_value = {'id': 'BudgetAgentMemory_new'}
         
-        setup_memory()
+        provision_memory()
         
         call_kwargs = mock_memory_client.create_memory_and_wait.call_args[1]
         strategies = call_kwargs['strategies']
@@ -110,19 +148,20 @@ class TestMemorySetup:
     def test_handles_list_memories_exception(self, mock_memory_client, mock_session_manager):
         """Test graceful handling when listing memories fails"""
         mock_memory_client.gmcp_client.list_memories.side_effect = Exception("API Error")
-        mock_memory_client.create_memory_and_wait.return_value = Mock(id='fallback_memory')
         
         result = setup_memory()
         
-        # Should fall back to creating new memory
-        mock_memory_client.create_memory_and_wait.assert_called_once()
+        # Should fall back to running without memory
+        mock_memory_client.create_memory_and_wait.assert_not_called()
+        assert result is None
     
     @patch('src.rag.memory.os.getenv')
     def test_uses_correct_aws_region(self, mock_getenv, mock_memory_client, mock_session_manager):
         """Test that correct AWS region is used"""
         mock_getenv.return_value = "us-west-2"
-        mock_memory_client.gmcp_client.list_memories.return_value = {'memories': []}
-        mock_memory_client.create_memory_and_wait.return_value = Mock(id='test_memory')
+        mock_memory_client.gmcp_client.list_memories.return_value = {
+            'memories': [{'id': 'BudgetAgentMemory_test', 'createdAt': '2026-02-04T12:00:00Z'}]
+        }
         
         with patch('src.rag.memory.MemoryClient') as mock_client_class:
             mock_client_class.return_value = mock_memory_client
@@ -130,10 +169,22 @@ class TestMemorySetup:
             
             mock_client_class.assert_called_once_with(region_name="us-west-2")
     
+    def test_uses_given_actor_and_session(self, mock_memory_client, mock_session_manager):
+        """Test that request identifiers are used for the memory session"""
+        mock_memory_client.gmcp_client.list_memories.return_value = {
+            'memories': [{'id': 'BudgetAgentMemory_test', 'createdAt': '2026-02-04T12:00:00Z'}]
+        }
+        
+        setup_memory(actor_id='analyst-7', session_id='budget-review')
+        
+        config = mock_session_manager.call_args[1]['agentcore_memory_config']
+        assert config.actor_id == 'analyst-7'
+        assert config.session_id == 'budget-review'
+    
     def test_returns_session_manager(self, mock_memory_client, mock_session_manager):
         """Test that function returns a session manager instance"""
         mock_memory_client.gmcp_client.list_memories.return_value = {
-            'memories': [{'id': 'test_memory', 'createdAt': '2026-02-04T12:00:00Z'}]
+            'memories': [{'id': 'BudgetAgentMemory_test', 'createdAt': '2026-02-04T12:00:00Z'}]
         }
         
         mock_session_manager_instance = Mock()
@@ -142,3 +193,72 @@ class TestMemorySetup:
         result = setup_memory()
         
         assert result == mock_session_manager_instance
+
+
+class TestMemoryIdCache:
+    """Test suite for the cached memory ID lookup"""
+    
+    @pytest.fixture
+    def mock_memory_client(self):
+        with patch('src.rag.memory.MemoryClient') as mock:
+            client_instance = Mock()
+            client_instance.gmcp_client.list_memories.return_value = {
+                'memories': [{'id': 'BudgetAgentMemory_1', 'createdAt': '2026-02-04T12:00:00Z'}]
+            }
+            mock.return_value = client_instance
+            yield client_instance
+    
+    @pytest.fixture
+    def mock_session_manager(self):
+        with patch('src.rag.memory.AgentCoreMemorySessionManager') as mock:
+            yield mock
+    
+    def test_memory_id_is_looked_up_once(self, mock_memory_client, mock_session_manager):
+        """Test that warm requests reuse the resolved memory ID"""
+        setup_memory()
+        setup_memory()
+        setup_memory()
+        
+        assert mock_memory_client.gmcp_client.list_memories.call_count == 1
+        assert mock_session_manager.call_count == 3
+    
+    def test_memory_id_expires(self, mock_memory_client, mock_session_manager):
+        """Test that the memory ID is looked up again after the TTL"""
+        with patch.object(memory, 'MEMORY_ID_TTL_SECONDS', 0):
+            setup_memory()
+            setup_memory()
+        
+        assert mock_memory_client.gmcp_client.list_memories.call_count == 2
+    
+    def test_environment_memory_id(self, mock_memory_client, mock_session_manager):
+        """Test that BUDGET_MEMORY_ID skips the lookup"""
+        with patch.dict(os.environ, {'BUDGET_MEMORY_ID': 'BudgetAgentMemory_env'}):
+            setup_memory()
+        
+        mock_memory_client.gmcp_client.list_memories.assert_not_called()
+        assert 'BudgetAgentMemory_env' in str(mock_session_manager.call_args)
+    
+    def test_memory_id_from_s3_config(self, mock_memory_client, mock_session_manager):
+        """Test that the S3 config is read instead of listing memories"""
+        s3 = Mock()
+        s3.get_object.return_value = {'Body': io.BytesIO(json.dumps({'memory_id': 'BudgetAgentMemory_s3'}).encode())}
+        
+        with patch.object(memory, 'MEMORY_CONFIG_S3_URI', 's3://config-bucket/agent/memory.json'), \
+             patch('src.rag.memory.boto3.client', return_value=s3):
+            setup_memory()
+        
+        s3.get_object.assert_called_once_with(Bucket='config-bucket', Key='agent/memory.json')
+        mock_memory_client.gmcp_client.list_memories.assert_not_called()
+        assert 'BudgetAgentMemory_s3' in str(mock_session_manager.call_args)
+    
+    def test_provision_writes_s3_config(self, mock_memory_client):
+        """Test that provisioning stores the memory ID for later lookups"""
+        s3 = Mock()
+        
+        with patch.object(memory, 'MEMORY_CONFIG_S3_URI', 's3://config-bucket/agent/memory.json'), \
+             patch('src.rag.memory.boto3.client', return_value=s3):
+            provision_memory()
+        
+        call_kwargs = s3.put_object.call_args[1]
+        assert call_kwargs['Bucket'] == 'config-bucket'
+        assert json.loads(call_kwargs['Body'])['memory_id'] == 'BudgetAgentMemory_1'
@@ -0,0 +1,108 @@
+"""
+Unit tests for the native-text fast path
+Tests page classification, native chunk emission and routing of complex pages to ADE
+"""
+import io
+import fitz
+import pytest
+from PIL import Image
+from src.ingestion.native_text import PAGE_COMPLEX, PAGE_SIMPLE, classify_page, native_page_result, parse_with_native_text
+from tests.test_ingestion_manifest import StubADE
+
+PROSE = (
+    "The government will continue to invest in housing, health care and clean growth while "
+    "keeping the deficit on a declining path over the medium term. These measures support "
+    "families and workers across the country and strengthen the long-term fiscal position."
+)
+
+
+def add_prose_page(doc, label):
+    page = doc.new_page()
+    page.insert_text((72, 30), f"Budget {label}", fontsize=8)
+    page.insert_textbox(fitz.Rect(72, 100, 520, 400), f"{label}. {PROSE}", fontsize=11)
+    page.insert_textbox(fitz.Rect(72, 420, 520, 700), PROSE, fontsize=11)
+
+
+def add_table_page(doc):
+    page = doc.new_page()
+    for row in range(12):
+        y = 100 + row * 20
+        page.draw_line((72, y), (520, y))
+        page.insert_text((80, y + 14), f"Program {row}   {row * 125:,}   {row * 3.5:.1f}%   {row * 980:,}")
+
+
+def add_figure_page(doc):
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(72, 72, 520, 300), PROSE, fontsize=11)
+    image = io.BytesIO()
+    Image.new("RGB", (200, 120), (40, 120, 200)).save(image, format="PNG")
+    page.insert_image(fitz.Rect(72, 320, 520, 700), stream=image.getvalue())
+
+
+def add_scan_page(doc):
+    page = doc.new_page()
+    image = io.BytesIO()
+    Image.new("L", (300, 400), 230).save(image, format="PNG")
+    page.insert_image(page.rect, stream=image.getvalue())
+
+
+@pytest.fixture
+def budget_pdf(tmp_path):
+    doc = fitz.open()
+    add_prose_page(doc, "Overview")      # 0 simple
+    add_table_page(doc)                   # 1 complex
+    add_prose_page(doc, "Housing")       # 2 simple
+    add_figure_page(doc)                  # 3 complex
+    add_scan_page(doc)                    # 4 complex
+    add_prose_page(doc, "Health")        # 5 simple
+    path = tmp_path / "budget.pdf"
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+class TestClassifyPage:
+    """Test suite for classify_page"""
+
+    def test_pages_are_classified(self, budget_pdf):
+        with fitz.open(str(budget_pdf)) as doc:
+            kinds = [classify_page(page) for page in doc]
+
+        assert kinds == [PAGE_SIMPLE, PAGE_COMPLEX, PAGE_SIMPLE, PAGE_COMPLEX, PAGE_COMPLEX, PAGE_SIMPLE]
+
+    def test_native_chunks_match_ade_schema(self, budget_pdf):
+        """Test native chunks carry ids, anchors, types and normalized boxes"""
+        with fitz.open(str(budget_pdf)) as doc:
+            result = native_page_result(doc[0])
+
+        chunks = result["chunks"]
+        assert [c["type"] for c in chunks] == ["marginalia", "text", "text"]
+        for chunk in chunks:
+            assert chunk["markdown"].startswith(f"<a id='{chunk['id']}'></a>")
+            box = chunk["grounding"]["box"]
+            assert 0 <= box["left"] < box["right"] <= 1
+            assert 0 <= box["top"] < box["bottom"] <= 1
+        assert "Overview. The government will continue" in chunks[1]["markdown"]
+
+
+class TestParseWithNativeText:
+    """Test suite for parse_with_native_text"""
+
+    def test_only_complex_pages_go_to_ade(self, budget_pdf, tmp_path):
+        """Test ADE sees the complex runs and pages come back in document order"""
+        stub = StubADE()
+        parsed_ranges = []
+
+        def parse(path):
+            parsed_ranges.append(path.name)
+            return stub.parse(path)
+
+        merged = parse_with_native_text(parse, budget_pdf, pages_per_range=50, out_dir=tmp_path / "ranges")
+
+        assert parsed_ranges == ["budget_p00002-00002.pdf", "budget_p00004-00005.pdf"]
+        assert merged["metadata"]["native_pages"] == 3
+        assert merged["metadata"]["page_count"] == 6
+        pages = [c["grounding"]["page"] for c in merged["chunks"]]
+        assert pages == sorted(pages)
+        assert set(pages) == {0, 1, 2, 3, 4, 5}
+        assert merged["markdown"].index("Overview") < merged["markdown"].index("Housing") < merged["markdown"].index("Health")
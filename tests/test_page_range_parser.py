@@ -0,0 +1,167 @@
+"""
+Unit tests for page-range fan-out parsing
+Tests PDF splitting, concurrent parsing with a stub ADE client and page rebasing
+"""
+import threading
+import time
+import fitz
+import pytest
+from types import SimpleNamespace
+from src.ingestion.rate_limiter import TokenBucket
+from src.ingestion.page_range_parser import (
+    merge_parse_results,
+    page_ranges,
+    parse_page_ranges,
+    serialize_parse_response
+)
+
+
+def build_pdf(path, pages):
+    doc = fitz.open()
+    for page_num in range(pages):
+        doc.new_page().insert_text((72, 72), f"Budget page {page_num}")
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+class StubADE:
+    """Local stand-in for LandingAIADE: one chunk per page with range-local page numbers"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def parse(self, document, model=None):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with fitz.open(str(document)) as doc:
+            texts = [page.get_text().strip() for page in doc]
+        with self._lock:
+            self.active -= 1
+        chunks = [
+            SimpleNamespace(
+                id=f"chunk-{text.split()[-1]}",
+                type="text",
+                markdown=text,
+                grounding=SimpleNamespace(page=local, box=SimpleNamespace(left=0.1, top=0.1, right=0.9, bottom=0.2))
+            )
+            for local, text in enumerate(texts)
+        ]
+        return SimpleNamespace(
+            markdown="\n\n".join(texts),
+            chunks=chunks,
+            splits=[SimpleNamespace(chunks=[c.id for c in chunks], pages=list(range(len(texts))), markdown="", class_="page")],
+            metadata=SimpleNamespace(filename=document.name, page_count=len(texts), version="v1",
+                                     job_id=f"job-{self.calls}", org_id="org", credit_usage=len(texts), duration_ms=10)
+        )
+
+
+class TestPageRangeParser:
+    """Test suite for parse_page_ranges"""
+
+    def test_page_ranges_cover_document(self):
+        assert page_ranges(120, 50) == [(0, 49), (50, 99), (100, 119)]
+        assert page_ranges(50, 50) == [(0, 49)]
+
+    def test_merged_pages_are_rebased(self, tmp_path):
+        """Test chunks and splits carry page numbers of the whole document"""
+        pdf = build_pdf(tmp_path / "budget.pdf", 23)
+        stub = StubADE()
+
+        merged = parse_page_ranges(stub.parse, pdf, pages_per_range=5, concurrency=3, out_dir=tmp_path / "ranges")
+
+        assert stub.calls == 5
+        assert [c["grounding"]["page"] for c in merged["chunks"]] == list(range(23))
+        assert [c["id"] for c in merged["chunks"]] == [f"chunk-{i}" for i in range(23)]
+        assert [p for split in merged["splits"] for p in split["pages"]] == list(range(23))
+        assert merged["markdown"].index("Budget page 4") < merged["markdown"].index("Budget page 5")
+        assert merged["metadata"]["page_count"] == 23
+        assert merged["metadata"]["credit_usage"] == 23
+        assert merged["metadata"]["filename"] == "budget.pdf"
+        # Range files are cleaned up
+        assert not list((tmp_path / "ranges").iterdir())
+
+    def test_concurrency_is_limited(self, tmp_path):
+        """Test no more than the configured number of ranges are parsed at once"""
+        pdf = build_pdf(tmp_path / "budget.pdf", 12)
+        stub = StubADE(delay=0.05)
+
+        parse_page_ranges(stub.parse, pdf, pages_per_range=2, concurrency=2, out_dir=tmp_path / "ranges")
+
+        assert stub.calls == 6
+        assert stub.max_active == 2
+
+    def test_failed_range_fails_document(self, tmp_path):
+        """Test an error in any range is raised instead of dropping its pages"""
+        pdf = build_pdf(tmp_path / "budget.pdf", 4)
+
+        def parse(path):
+            if "00003" in path.name:
+                raise RuntimeError("ADE error")
+            return StubADE().parse(path)
+
+        with pytest.raises(RuntimeError):
+            parse_page_ranges(parse, pdf, pages_per_range=2, out_dir=tmp_path / "ranges")
+
+    def test_one_mupdf_lock_per_process(self):
+        """Test ingestion and grounding serialize PyMuPDF calls on the same lock"""
+        from src.ingestion import native_text, page_range_parser
+        from src.rag import render_cache, visual_grounding_helper
+
+        assert page_range_parser.MUPDF_LOCK is render_cache.MUPDF_LOCK
+        assert native_text.MUPDF_LOCK is render_cache.MUPDF_LOCK
+        assert visual_grounding_helper.MUPDF_LOCK is render_cache.MUPDF_LOCK
+
+    def test_merge_orders_parts_by_first_page(self):
+        """Test parts finishing out of order are merged in page order"""
+        part = lambda i: serialize_parse_response(SimpleNamespace(
+            markdown=f"part {i}",
+            chunks=[{"id": f"c{i}", "grounding": {"page": 0, "box": {}}}],
+            splits=[],
+            metadata={"page_count": 1}
+        ))
+
+        merged = merge_parse_results([(2, part(2)), (0, part(0)), (1, part(1))])
+
+        assert [c["id"] for c in merged["chunks"]] == ["c0", "c1", "c2"]
+        assert [c["grounding"]["page"] for c in merged["chunks"]] == [0, 1, 2]
+        assert merged["markdown"] == "part 0\n\npart 1\n\npart 2"
+
+
+class TestParseDocument:
+    """Test suite for ade_s3_handler.parse_document with a stub client"""
+
+    def test_large_pdfs_fan_out(self, tmp_path):
+        """Test documents above the range size are parsed per range"""
+        from unittest.mock import patch
+        from src.ingestion import ade_s3_handler
+
+        pdf = build_pdf(tmp_path / "budget.pdf", 7)
+        stub = StubADE()
+        with patch.object(ade_s3_handler, "client", stub), patch.object(ade_s3_handler, "PARSE_PAGES_PER_RANGE", 3), \
+                patch.object(ade_s3_handler, "ade_limiter", TokenBucket(rate=0, capacity=1)):
+            parsed = ade_s3_handler.parse_document(pdf)
+
+        assert stub.calls == 3
+        assert [c["grounding"]["page"] for c in parsed["chunks"]] == list(range(7))
+
+    def test_small_pdfs_parse_whole(self, tmp_path):
+        """Test documents within the range size are parsed in one call"""
+        from unittest.mock import patch
+        from src.ingestion import ade_s3_handler
+
+        pdf = build_pdf(tmp_path / "budget.pdf", 3)
+        stub = StubADE()
+        with patch.object(ade_s3_handler, "client", stub), patch.object(ade_s3_handler, "PARSE_PAGES_PER_RANGE", 3), \
+                patch.object(ade_s3_handler, "ade_limiter", TokenBucket(rate=0, capacity=1)):
+            parsed = ade_s3_handler.parse_document(pdf)
+
+        assert stub.calls == 1
+        assert len(parsed["chunks"]) == 3
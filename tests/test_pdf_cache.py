@@ -0,0 +1,168 @@
+"""
+Unit tests for the local PDF cache
+Tests download reuse, ETag revalidation and LRU eviction
+"""
+import io
+import pytest
+from unittest.mock import Mock
+from botocore.exceptions import ClientError
+from src.rag.pdf_cache import PdfCache
+
+
+class FakeS3:
+    """Minimal S3 stand-in honouring IfNoneMatch on get_object"""
+
+    def __init__(self):
+        self.objects = {}
+        self.get_object = Mock(side_effect=self._get_object)
+
+    def put(self, key, body, etag):
+        self.objects[key] = (body, etag)
+
+    def _get_object(self, Bucket, Key, IfNoneMatch=None):
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError(
+                {"Error": {"Code": "304", "Message": "Not Modified"},
+                 "ResponseMetadata": {"HTTPStatusCode": 304}},
+                "GetObject"
+            )
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+
+class TestPdfCache:
+    """Test suite for PdfCache"""
+
+    @pytest.fixture
+    def s3(self):
+        s3 = FakeS3()
+        s3.put("input/a.pdf", b"a" * 100, '"etag-a"')
+        s3.put("input/b.pdf", b"b" * 100, '"etag-b"')
+        return s3
+
+    def test_second_lookup_is_served_from_disk(self, s3, tmp_path):
+        """Test a cached PDF is not downloaded again"""
+        cache = PdfCache(cache_dir=tmp_path, max_bytes=10_000, revalidate_seconds=60)
+
+        first = cache.get_path(s3, "bucket", "input/a.pdf")
+        second = cache.get_path(s3, "bucket", "input/a.pdf")
+
+        assert first == second
+        assert first.read_bytes() == b"a" * 100
+        assert s3.get_object.call_count == 1
+        assert cache.hits == 1
+
+    def test_unchanged_pdf_is_revalidated_without_download(self, s3, tmp_path):
+        """Test an expired entry is revalidated with a conditional GET"""
+        cache = PdfCache(cache_dir=tmp_path, max_bytes=10_000, revalidate_seconds=0)
+
+        cache.get_path(s3, "bucket", "input/a.pdf")
+        cache.get_path(s3, "bucket", "input/a.pdf")
+
+        assert s3.get_object.call_args.kwargs["IfNoneMatch"] == '"etag-a"'
+        assert cache.downloads == 1
+
+    def test_changed_pdf_is_downloaded_again(self, s3, tmp_path):
+        """Test a new ETag replaces the cached copy"""
+        cache = PdfCache(cache_dir=tmp_path, max_bytes=10_000, revalidate_seconds=0)
+
+        cache.get_path(s3, "bucket", "input/a.pdf")
+        s3.put("input/a.pdf", b"new", '"etag-a2"')
+        path = cache.get_path(s3, "bucket", "input/a.pdf")
+
+        assert path.read_bytes() == b"new"
+        assert cache.get_etag("bucket", "input/a.pdf") == '"etag-a2"'
+        assert cache.downloads == 2
+
+    def test_least_recently_used_pdf_is_evicted(self, s3, tmp_path):
+        """Test the size cap evicts the least recently used PDF"""
+        s3.put("input/c.pdf", b"c" * 100, '"etag-c"')
+        cache = PdfCache(cache_dir=tmp_path, max_bytes=250, revalidate_seconds=60)
+
+        path_a = cache.get_path(s3, "bucket", "input/a.pdf")
+        cache.get_path(s3, "bucket", "input/b.pdf")
+        cache.get_path(s3, "bucket", "input/a.pdf")
+        cache.get_path(s3, "bucket", "input/c.pdf")
+
+        assert cache.get_etag("bucket", "input/b.pdf") is None
+        assert cache.get_etag("bucket", "input/a.pdf") == '"etag-a"'
+        assert path_a.exists()
+        assert cache.total_bytes <= 250
+
+    def test_missing_pdf_raises(self, s3, tmp_path):
+        """Test S3 errors other than not-modified propagate"""
+        cache = PdfCache(cache_dir=tmp_path, max_bytes=10_000, revalidate_seconds=60)
+
+        with pytest.raises(KeyError):
+            cache.get_path(s3, "bucket", "input/missing.pdf")
+
+    def test_expected_etag_skips_revalidation(self, s3, tmp_path):
+        """Test a cached PDF matching the known ETag is used without any S3 call"""
+        cache = PdfCache(cache_dir=tmp_path, max_bytes=10_000, revalidate_seconds=0)
+
+        cache.get_path(s3, "bucket", "input/a.pdf")
+        cache.get_path(s3, "bucket", "input/a.pdf", expected_etag="etag-a")
+        assert s3.get_object.call_count == 1
+
+        s3.put("input/a.pdf", b"new", '"etag-a2"')
+        path = cache.get_path(s3, "bucket", "input/a.pdf", expected_etag="etag-a2")
+        assert path.read_bytes() == b"new"
+
+    def test_construction_leaves_the_directory_alone(self, tmp_path):
+        """Test creating a cache (e.g. on import) does not remove anything"""
+        other = tmp_path / "other.txt"
+        other.write_text("keep")
+
+        PdfCache(cache_dir=tmp_path, max_bytes=10_000, revalidate_seconds=60)
+
+        assert other.exists()
+        assert list(tmp_path.iterdir()) == [other]
+
+    def test_only_own_leftovers_are_removed(self, s3, tmp_path):
+        """Test the first download drops stale entries but keeps foreign files"""
+        cache = PdfCache(cache_dir=tmp_path, max_bytes=10_000, revalidate_seconds=60)
+        cache.cache_dir.mkdir(parents=True)
+        stale = cache.cache_dir / ("0" * 40 + ".pdf")
+        stale.write_bytes(b"old")
+        foreign = cache.cache_dir / "notes.pdf"
+        foreign.write_bytes(b"keep")
+        sibling = tmp_path / ("1" * 40 + ".pdf")
+        sibling.write_bytes(b"keep")
+
+        cache.get_path(s3, "bucket", "input/a.pdf")
+
+        assert not stale.exists()
+        assert foreign.exists()
+        assert sibling.exists()
+
+    def test_evicted_pdf_is_released_before_removal(self, s3, tmp_path):
+        """Test on_evict sees the file before it is unlinked"""
+        released = []
+        cache = PdfCache(
+            cache_dir=tmp_path, max_bytes=150, revalidate_seconds=60,
+            on_evict=lambda path: released.append((path, path.exists()))
+        )
+
+        path_a = cache.get_path(s3, "bucket", "input/a.pdf")
+        cache.get_path(s3, "bucket", "input/b.pdf")
+
+        assert released == [(path_a, True)]
+        assert not path_a.exists()
+
+    def test_eviction_closes_open_documents(self, s3, tmp_path):
+        """Test the module cache closes document handles of evicted PDFs"""
+        from src.rag.render_cache import DocumentCache, document_version
+
+        documents = DocumentCache()
+        cache = PdfCache(
+            cache_dir=tmp_path, max_bytes=150, revalidate_seconds=60,
+            on_evict=documents.discard
+        )
+        path_a = cache.get_path(s3, "bucket", "input/a.pdf")
+        doc = Mock()
+        documents.get(document_version(path_a), lambda: doc)
+
+        cache.get_path(s3, "bucket", "input/b.pdf")
+
+        doc.close.assert_called_once()
+        assert len(documents._documents) == 0
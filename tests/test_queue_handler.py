@@ -0,0 +1,189 @@
+"""
+Unit tests for queue-driven ingestion
+Runs the SQS entry point end to end on the in-memory queue, and tests the ADE token bucket
+"""
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from src.ingestion import ade_s3_handler, queue_handler
+from src.ingestion.local_queue import InMemoryQueue
+from src.ingestion.rate_limiter import TokenBucket
+from tests.test_ingestion_manifest import FakeS3, StubADE, build_pdf
+from tests.test_ingestion_state import FakeContext
+
+
+class FailingStubADE(StubADE):
+    """StubADE that fails for documents whose name contains fail_on"""
+
+    def __init__(self, fail_on=None):
+        super().__init__()
+        self.fail_on = fail_on
+
+    def parse(self, document, model=None):
+        if self.fail_on and self.fail_on in str(document):
+            raise RuntimeError("ADE error")
+        return super().parse(document, model)
+
+
+class TestQueueHandler:
+    """Test suite for queue_handler on the in-memory queue"""
+
+    @pytest.fixture
+    def env(self):
+        s3 = FakeS3()
+        stub = FailingStubADE()
+        queue = InMemoryQueue(visibility_timeout=900, max_receives=3)
+        with patch.object(ade_s3_handler, "s3", s3), \
+                patch.object(ade_s3_handler, "client", stub), \
+                patch.object(ade_s3_handler, "ade_limiter", TokenBucket(rate=0, capacity=1)), \
+                patch.object(ade_s3_handler, "CHUNK_LAYOUT", "shards"), \
+                patch.object(ade_s3_handler, "FORCE_REPROCESS", False), \
+                patch.object(ade_s3_handler, "PRERENDER_CHUNK_IMAGES", False), \
+                patch.object(ade_s3_handler, "reinvoke") as reinvoke, \
+                patch.object(ade_s3_handler.grounding_manifest, "flush"), \
+                patch.object(queue_handler, "sqs", queue):
+            yield s3, stub, queue, reinvoke
+
+    def upload(self, s3, queue, names):
+        for name in names:
+            s3.objects[f"input/{name}.pdf"] = build_pdf([f"{name} page"])
+            queue.send_s3_event("b", f"input/{name}.pdf")
+
+    def test_pipeline_runs_from_queue(self, env):
+        """Test every queued upload is ingested and its message deleted"""
+        s3, stub, queue, reinvoke = env
+        self.upload(s3, queue, ["budget_a", "budget_b", "budget_c"])
+
+        batches = queue.run(queue_handler.queue_handler, FakeContext(), batch_size=2)
+
+        assert batches == 2
+        assert len(queue) == 0
+        assert stub.calls == 3
+        assert all(f"output/budget_{n}.md" in s3.objects for n in "abc")
+        reinvoke.assert_not_called()
+
+    def test_failed_documents_are_reported_per_message(self, env):
+        """Test only the failing message is redelivered, until it is dead-lettered"""
+        s3, stub, queue, _ = env
+        stub.fail_on = "budget_b"
+        self.upload(s3, queue, ["budget_a", "budget_b"])
+
+        event = queue.receive_batch(10)
+        response = queue_handler.queue_handler(event, FakeContext())
+
+        assert response == {"batchItemFailures": [{"itemIdentifier": event["Records"][1]["messageId"]}]}
+
+        queue.complete_batch(event, response)
+        queue.run(queue_handler.queue_handler, FakeContext())
+
+        assert len(queue.dead_letters) == 1
+        assert "budget_b" in queue.dead_letters[0]["body"]
+
+    def test_unstarted_messages_are_requeued_when_time_runs_low(self, env):
+        """Test unstarted messages are deleted and sent again with the short delay"""
+        s3, stub, queue, _ = env
+        self.upload(s3, queue, ["budget_a"])
+
+        event = queue.receive_batch(10)
+        response = queue_handler.queue_handler(event, FakeContext(checks_before_low=0))
+        queue.complete_batch(event, response)
+
+        assert response == {"batchItemFailures": []}
+        assert stub.calls == 0
+        assert len(queue.receive_batch(10)["Records"]) == 0
+        queue.advance(queue_handler.QUEUE_RETRY_DELAY_SECONDS)
+        requeued = queue.receive_batch(10)["Records"]
+        assert len(requeued) == 1
+        assert requeued[0]["attributes"]["ApproximateReceiveCount"] == "1"
+
+    def test_continuations_do_not_count_as_receives(self, env):
+        """Test a document continued more often than max_receives finishes instead of being dead-lettered"""
+        s3, stub, queue, _ = env
+        s3.objects["input/budget.pdf"] = build_pdf([f"Budget page {i}" for i in range(7)])
+        queue.send_s3_event("b", "input/budget.pdf")
+
+        # Every invocation runs out of time at its first chunk checkpoint
+        def handler(event, _):
+            return queue_handler.queue_handler(event, FakeContext(checks_before_low=2))
+
+        with patch.object(ade_s3_handler, "CHUNK_LAYOUT", "both"), \
+                patch.object(ade_s3_handler, "INGESTION_CHECKPOINT_EVERY", 2):
+            batches = queue.run(handler)
+
+        assert batches == 4
+        assert not queue.dead_letters
+        assert stub.calls == 1
+        assert len([k for k in s3.objects if "_chunks/" in k]) == 7
+
+    def test_requeue_failure_falls_back_to_release(self, env):
+        """Test a continuation that cannot be sent is reported and released instead"""
+        s3, stub, queue, _ = env
+        self.upload(s3, queue, ["budget_a"])
+        event = queue.receive_batch(10)
+
+        with patch.object(queue, "send_message", side_effect=RuntimeError("throttled")):
+            response = queue_handler.queue_handler(event, FakeContext(checks_before_low=0))
+
+        assert response == {"batchItemFailures": [{"itemIdentifier": event["Records"][0]["messageId"]}]}
+        queue.complete_batch(event, response)
+        queue.advance(queue_handler.QUEUE_RETRY_DELAY_SECONDS)
+        assert len(queue.receive_batch(10)["Records"]) == 1
+
+    def test_test_events_and_malformed_messages_are_dropped(self, env):
+        s3, stub, queue, _ = env
+        queue.send_message({"Event": "s3:TestEvent"})
+        queue.send_message("not json at all")
+
+        queue.run(queue_handler.queue_handler, FakeContext())
+
+        assert len(queue) == 0
+        assert not queue.dead_letters
+
+    def test_queue_url_from_arn(self):
+        assert queue_handler.queue_url_from_arn("arn:aws:sqs:us-east-1:123456789012:ade-ingestion-queue") == \
+            "https://sqs.us-east-1.amazonaws.com/123456789012/ade-ingestion-queue"
+
+
+class TestTokenBucket:
+    """Test suite for the ADE call limiter"""
+
+    def test_burst_then_rate(self):
+        """Test calls beyond the burst wait for refilled tokens"""
+        clock = {"now": 0.0}
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock["now"] += seconds
+
+        bucket = TokenBucket(rate=2, capacity=3, clock=lambda: clock["now"], sleep=sleep)
+        for _ in range(5):
+            with bucket:
+                pass
+
+        assert sleeps == [0.5, 0.5]
+        assert bucket.waited == 1.0
+
+    def test_caps_calls_in_flight(self):
+        """Test no more than max_in_flight holders run at once"""
+        bucket = TokenBucket(rate=0, capacity=1, max_in_flight=2)
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def call():
+            with bucket:
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.02)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert peak[0] == 2
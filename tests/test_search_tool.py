@@ -0,0 +1,342 @@
+"""
+Unit tests for the knowledge base search tool
+Tests result ordering, deduplication and concurrent visual grounding
+"""
+import io
+import json
+import re
+import time
+import pytest
+from unittest.mock import Mock, patch
+from src.rag import search_tool
+from src.rag.chunk_index import ChunkIndex, chunk_index_key, pack_chunk_index
+from src.rag.chunk_shards import ChunkShardReader, pack_chunk_shards, shard_index_key, shard_key
+from src.rag.search_tool import search_knowledge_base
+
+
+def make_chunk_result(chunk_id, score, doc="budget_2024", page=3):
+    """Build a Bedrock retrieval result pointing at a chunk JSON file"""
+    return {
+        "content": {"text": f"content of {chunk_id}"},
+        "score": score,
+        "location": {"s3Location": {"uri": f"s3://test-bucket/output/budget_chunks/{doc}_{chunk_id}.json"}},
+        "_chunk": {
+            "chunk_id": chunk_id,
+            "chunk_type": "table",
+            "text": f"content of {chunk_id}",
+            "bbox": [0.1, 0.2, 0.5, 0.6],
+            "page": page,
+            "source_document": doc
+        }
+    }
+
+
+def make_markdown_result(text, score, uri="s3://test-bucket/output/gov_data/budget_2024.md"):
+    """Build a Bedrock retrieval result pointing at a markdown file"""
+    return {
+        "content": {"text": text},
+        "score": score,
+        "location": {"s3Location": {"uri": uri}}
+    }
+
+
+class TestSearchKnowledgeBase:
+    """Test suite for search_knowledge_base tool"""
+
+    @pytest.fixture(autouse=True)
+    def env(self, monkeypatch):
+        monkeypatch.setenv("BEDROCK_KB_ID", "test-kb")
+        monkeypatch.setenv("S3_BUCKET", "test-bucket")
+
+    @pytest.fixture
+    def retrieval(self):
+        """Mock the Bedrock retrieve call; tests set .results"""
+        with patch.object(search_tool, "session") as mock_session:
+            runtime = Mock()
+            mock_session.client.return_value = runtime
+            state = Mock()
+            state.results = []
+            runtime.retrieve.side_effect = lambda **kwargs: {"retrievalResults": state.results}
+            yield state
+
+    @pytest.fixture(autouse=True)
+    def index(self):
+        """Fresh chunk metadata index per test"""
+        with patch.object(search_tool, "chunk_index", ChunkIndex()) as index:
+            yield index
+
+    @pytest.fixture(autouse=True)
+    def shard_reader(self):
+        """Fresh chunk shard reader per test"""
+        with patch.object(search_tool, "chunk_shard_reader", ChunkShardReader()) as reader:
+            yield reader
+
+    @pytest.fixture
+    def mock_s3(self, retrieval):
+        """Mock S3 so chunk JSON downloads are served from the retrieval results"""
+        with patch.object(search_tool, "s3_client") as mock:
+            mock.sidecars = {}
+            mock.get_paginator.return_value.paginate.side_effect = lambda **kwargs: [{
+                "Contents": [{"Key": key, "ETag": '"1"'} for key in mock.sidecars if key.startswith(kwargs["Prefix"])]
+            }]
+            def get_object(Bucket, Key, Range=None):
+                if Key in mock.sidecars:
+                    body = mock.sidecars[Key]
+                    if Range:
+                        start, end = map(int, re.match(r"bytes=(\d+)-(\d+)", Range).groups())
+                        body = body[start:end + 1]
+                    return {"Body": io.BytesIO(body), "ETag": '"1"'}
+                for result in retrieval.results:
+                    uri = result["location"]["s3Location"]["uri"]
+                    if uri == f"s3://{Bucket}/{Key}" and "_chunk" in result:
+                        return {"Body": io.BytesIO(json.dumps(result["_chunk"]).encode("utf-8"))}
+                raise Exception("NoSuchKey")
+            mock.get_object.side_effect = get_object
+            yield mock
+
+    @pytest.fixture
+    def mock_crop(self):
+        """Mock batch chunk image extraction"""
+        with patch.object(search_tool, "extract_chunk_images") as mock:
+            mock.side_effect = lambda **kwargs: [
+                f"https://images/{request[3]}.png" for request in kwargs["chunk_requests"]
+            ]
+            yield mock
+
+    @staticmethod
+    def cropped_chunk_ids(mock_crop):
+        return [
+            request[3]
+            for call in mock_crop.call_args_list
+            for request in call.kwargs["chunk_requests"]
+        ]
+
+    def test_missing_kb_id(self, monkeypatch):
+        """Test error message when the knowledge base is not configured"""
+        monkeypatch.delenv("BEDROCK_KB_ID")
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert "BEDROCK_KB_ID" in result
+
+    def test_results_keep_score_order(self, retrieval, mock_s3, mock_crop):
+        """Test grounded results are returned by descending score"""
+        retrieval.results = [
+            make_chunk_result("chunk_low", 0.4),
+            make_chunk_result("chunk_high", 0.9),
+        ]
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert result.index("chunk_high") < result.index("chunk_low")
+        assert "https://images/chunk_high.png" in result
+        assert "**Page:** 3" in result
+
+    def test_duplicate_chunks_are_dropped(self, retrieval, mock_s3, mock_crop):
+        """Test the same chunk retrieved twice is only grounded and listed once"""
+        retrieval.results = [
+            make_chunk_result("chunk_a", 0.9),
+            make_chunk_result("chunk_a", 0.8),
+            make_markdown_result("<a id='chunk_a'></a> same chunk via markdown", 0.7),
+        ]
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert result.count("**Chunk ID:** chunk_a") == 1
+        assert self.cropped_chunk_ids(mock_crop) == ["chunk_a"]
+
+    def test_failed_metadata_falls_back_to_text(self, retrieval, mock_s3, mock_crop):
+        """Test a chunk whose JSON cannot be fetched is returned without grounding"""
+        broken = make_chunk_result("chunk_gone", 0.9)
+        del broken["_chunk"]
+        retrieval.results = [broken]
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert "content of chunk_gone" in result
+        assert "Cropped Chunk Image" not in result
+        assert self.cropped_chunk_ids(mock_crop) == []
+
+    def test_crops_are_requested_in_one_batch(self, retrieval, mock_s3, mock_crop):
+        """Test all crops of a query go through a single batch call"""
+        retrieval.results = [make_chunk_result(f"chunk_{i}", 0.9 - i * 0.1) for i in range(2)]
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert mock_crop.call_count == 1
+        assert mock_crop.call_args.kwargs["chunk_requests"] == [
+            ("budget_2024", 3, [0.1, 0.2, 0.5, 0.6], "chunk_0", "table"),
+            ("budget_2024", 3, [0.1, 0.2, 0.5, 0.6], "chunk_1", "table"),
+        ]
+        assert "https://images/chunk_0.png" in result
+        assert "https://images/chunk_1.png" in result
+
+    def test_metadata_fetches_run_concurrently(self, retrieval, mock_s3, mock_crop):
+        """Test chunk JSON downloads for several results overlap"""
+        retrieval.results = [make_chunk_result(f"chunk_{i}", 0.9 - i * 0.1) for i in range(3)]
+        get_object = mock_s3.get_object.side_effect
+
+        def slow_get_object(**kwargs):
+            time.sleep(0.3)
+            return get_object(**kwargs)
+        mock_s3.get_object.side_effect = slow_get_object
+
+        start = time.monotonic()
+        search_knowledge_base(query="carbon tax")
+        elapsed = time.monotonic() - start
+
+        assert elapsed < 0.8
+
+    def test_crops_get_remaining_time_budget(self, retrieval, mock_s3, mock_crop, monkeypatch):
+        """Test dropped crops are returned without an image within the query budget"""
+        monkeypatch.setattr(search_tool, "GROUNDING_TIME_BUDGET_SECONDS", 0.5)
+        retrieval.results = [
+            make_chunk_result("chunk_fast", 0.9),
+            make_chunk_result("chunk_slow", 0.8),
+        ]
+        mock_crop.side_effect = lambda **kwargs: ["https://images/chunk_fast.png", None]
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert 0 <= mock_crop.call_args.kwargs["timeout"] <= 0.5
+        assert "https://images/chunk_fast.png" in result
+        assert "https://images/chunk_slow.png" not in result
+        # Dropped crop still keeps its page and bbox metadata
+        assert "**Chunk ID:** chunk_slow" in result
+        assert "**Bbox:**" in result
+
+    def test_only_returned_results_are_grounded(self, retrieval, mock_s3, mock_crop):
+        """Test results beyond the returned top 2 are never cropped"""
+        retrieval.results = [make_chunk_result(f"chunk_{i}", 0.9 - i * 0.1) for i in range(5)]
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert self.cropped_chunk_ids(mock_crop) == ["chunk_0", "chunk_1"]
+        assert "chunk_2" not in result
+
+    def test_grounding_cutoff_is_configurable(self, retrieval, mock_s3, mock_crop, monkeypatch):
+        """Test top-N results get images and the rest are returned as text only"""
+        monkeypatch.setattr(search_tool, "SEARCH_MAX_RESULTS", 4)
+        monkeypatch.setattr(search_tool, "SEARCH_GROUNDED_RESULTS", 1)
+        retrieval.results = [make_chunk_result(f"chunk_{i}", 0.9 - i * 0.1) for i in range(5)]
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert self.cropped_chunk_ids(mock_crop) == ["chunk_0"]
+        assert "https://images/chunk_0.png" in result
+        assert result.count("**Bbox:**") == 3
+        assert "chunk_3" in result
+        assert "chunk_4" not in result
+
+    def test_no_results(self, retrieval, mock_s3, mock_crop):
+        """Test message when the knowledge base returns nothing"""
+        retrieval.results = []
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert "No documents found" in result
+
+    def test_deferred_mode_returns_endpoint_urls(self, retrieval, mock_s3, mock_crop, monkeypatch):
+        """Test deferred grounding links to the image endpoint without rendering"""
+        monkeypatch.setattr(search_tool, "GROUNDING_MODE", "deferred")
+        monkeypatch.setattr(search_tool, "CHUNK_IMAGE_ENDPOINT", "https://api.example.com/chunk-image")
+        monkeypatch.setattr("src.rag.deferred_images.CHUNK_IMAGE_URL_SECRET", "test-secret")
+        retrieval.results = [make_chunk_result("chunk_a", 0.9)]
+        mock_s3.sidecars[chunk_index_key("budget_2024")] = pack_chunk_index(
+            "budget_2024", [retrieval.results[0]["_chunk"]]
+        )
+
+        result = search_knowledge_base(query="carbon tax")
+
+        mock_crop.assert_not_called()
+        assert "**Cropped Chunk Image:** https://api.example.com/chunk-image?doc=budget_2024&page=3" in result
+        assert "chunk_id=chunk_a" in result
+
+    def test_deferred_mode_renders_unverifiable_chunks(self, retrieval, mock_s3, mock_crop, monkeypatch):
+        """Test chunks only known from their chunk JSON get a rendered image, not a dead endpoint link"""
+        monkeypatch.setattr(search_tool, "GROUNDING_MODE", "deferred")
+        monkeypatch.setattr(search_tool, "CHUNK_IMAGE_ENDPOINT", "https://api.example.com/chunk-image")
+        monkeypatch.setattr("src.rag.deferred_images.CHUNK_IMAGE_URL_SECRET", "test-secret")
+        sharded = make_chunk_result("chunka", 0.9)
+        legacy = make_chunk_result("chunkb", 0.8, doc="budget_2023")
+        retrieval.results = [sharded, legacy]
+        self.add_shards(mock_s3, "budget_2024", [sharded["_chunk"]])
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert self.cropped_chunk_ids(mock_crop) == ["chunkb"]
+        assert "chunk_id=chunka" in result
+        assert "https://images/chunkb.png" in result
+
+    def test_deferred_mode_needs_secret(self, retrieval, mock_s3, mock_crop, monkeypatch):
+        """Test deferred grounding falls back to rendering when URLs cannot be signed"""
+        monkeypatch.setattr(search_tool, "GROUNDING_MODE", "deferred")
+        monkeypatch.setattr(search_tool, "CHUNK_IMAGE_ENDPOINT", "https://api.example.com/chunk-image")
+        monkeypatch.setattr("src.rag.deferred_images.CHUNK_IMAGE_URL_SECRET", "")
+        retrieval.results = [make_chunk_result("chunk_a", 0.9)]
+
+        result = search_knowledge_base(query="carbon tax")
+
+        mock_crop.assert_called_once()
+        assert "chunk-image?" not in result
+
+    def test_indexed_chunks_need_no_metadata_fetch(self, retrieval, mock_s3, mock_crop):
+        """Test chunks in the metadata index are grounded without chunk JSON GETs"""
+        retrieval.results = [make_chunk_result("chunk_a", 0.9), make_chunk_result("chunk_b", 0.8)]
+        mock_s3.sidecars[chunk_index_key("budget_2024")] = pack_chunk_index(
+            "budget_2024", [r["_chunk"] for r in retrieval.results]
+        )
+
+        search_knowledge_base(query="carbon tax")
+        mock_s3.get_object.reset_mock()
+        result = search_knowledge_base(query="carbon tax")
+
+        mock_s3.get_object.assert_not_called()
+        assert mock_crop.call_args.kwargs["chunk_requests"] == [
+            ("budget_2024", 3, [0.1, 0.2, 0.5, 0.6], "chunk_a", "table"),
+            ("budget_2024", 3, [0.1, 0.2, 0.5, 0.6], "chunk_b", "table"),
+        ]
+        assert "https://images/chunk_a.png" in result
+
+    def test_markdown_results_are_grounded_from_index(self, retrieval, mock_s3, mock_crop):
+        """Test a markdown hit with a chunk anchor gets page, bbox and a crop from the index"""
+        chunk = make_chunk_result("chunk_md", 0.9)["_chunk"]
+        mock_s3.sidecars[chunk_index_key("budget_2024")] = pack_chunk_index("budget_2024", [chunk])
+        retrieval.results = [make_markdown_result("<a id='chunk_md'></a> Carbon pricing revenue", 0.9)]
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert self.cropped_chunk_ids(mock_crop) == ["chunk_md"]
+        assert "**Page:** 3" in result
+        assert "https://images/chunk_md.png" in result
+
+    @staticmethod
+    def add_shards(mock_s3, source_document, chunks):
+        shards, shard_index = pack_chunk_shards(source_document, chunks)
+        for name, body in shards:
+            mock_s3.sidecars[shard_key(source_document, name)] = body
+        mock_s3.sidecars[shard_index_key(source_document)] = json.dumps(shard_index).encode("utf-8")
+
+    def test_unindexed_chunks_are_read_from_shards(self, retrieval, mock_s3, mock_crop):
+        """Test a chunk file hit missing from the index is read from its shard, not its chunk file"""
+        result_a = make_chunk_result("chunka", 0.9)
+        retrieval.results = [result_a]
+        self.add_shards(mock_s3, "budget_2024", [result_a["_chunk"]])
+
+        result = search_knowledge_base(query="carbon tax")
+
+        keys = [call.kwargs["Key"] for call in mock_s3.get_object.call_args_list]
+        assert "output/budget_chunks/budget_2024_chunka.json" not in keys
+        assert any(call.kwargs.get("Range") for call in mock_s3.get_object.call_args_list)
+        assert self.cropped_chunk_ids(mock_crop) == ["chunka"]
+        assert "**Page:** 3" in result
+
+    def test_unindexed_markdown_anchor_is_read_from_shards(self, retrieval, mock_s3, mock_crop):
+        """Test a markdown hit whose anchor is missing from the index is grounded from the shards"""
+        self.add_shards(mock_s3, "budget_2024", [make_chunk_result("chunkmd", 0.9)["_chunk"]])
+        retrieval.results = [make_markdown_result("<a id='chunkmd'></a> Carbon pricing revenue", 0.9)]
+
+        result = search_knowledge_base(query="carbon tax")
+
+        assert self.cropped_chunk_ids(mock_crop) == ["chunkmd"]
+        assert "**Page:** 3" in result
@@ -0,0 +1,179 @@
+"""
+Unit tests for the streaming entry point
+Runs the ASGI app in process on Strands agents with a stubbed model
+"""
+import json
+import asyncio
+import pytest
+from unittest.mock import Mock, patch
+from strands import Agent, tool
+from strands.models.model import Model
+
+from src.runtime import handler
+from src.runtime.cli import stream_reply
+from src.runtime.local_stream import call_app, parse_sse
+from src.runtime.stream_handler import app, format_sse
+
+
+@tool
+def lookup(term: str) -> str:
+    """Look up a budget term"""
+    return f"{term}: $65/tonne"
+
+
+class ScriptedModel(Model):
+    """Model that calls lookup once, then answers in a few tokens with a delay between them"""
+
+    def __init__(self, token_delay: float = 0.0, fail: bool = False):
+        self.token_delay = token_delay
+        self.fail = fail
+
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {}
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        yield {"messageStart": {"role": "assistant"}}
+        if not any("toolResult" in content for message in messages for content in message["content"]):
+            yield {"contentBlockStart": {"start": {"toolUse": {"toolUseId": "t1", "name": "lookup"}}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": '{"term": '}}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": '"carbon tax"}'}}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+            return
+        for token in ["The carbon ", "tax is ", "$65/tonne."]:
+            yield {"contentBlockDelta": {"delta": {"text": token}}}
+            await asyncio.sleep(self.token_delay)
+        yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+
+
+def scripted_agent(token_delay=0.0, fail=False):
+    agent = Agent(model=ScriptedModel(token_delay, fail), tools=[lookup], callback_handler=None)
+    agent.session_manager = None
+    return agent
+
+
+@pytest.fixture(autouse=True)
+def fresh_agent_pool():
+    handler.agent_pool = None
+    with patch('src.runtime.handler.get_shared_model'), \
+         patch('src.runtime.handler.setup_memory', return_value=None):
+        yield
+    handler.agent_pool = None
+
+
+@pytest.fixture
+def mock_agent_class():
+    with patch('src.runtime.handler.BudgetAgent') as mock:
+        mock.side_effect = lambda *args: scripted_agent()
+        yield mock
+
+
+def post(body):
+    return asyncio.run(call_app(app, body=body))
+
+
+class TestStreamHandler:
+    """Test suite for the SSE streaming app"""
+
+    def test_streams_session_tools_tokens_and_result(self, mock_agent_class):
+        response = post({"query": "What is the carbon tax?", "actor_id": "a1", "session_id": "s1"})
+
+        assert response.status == 200
+        assert response.headers["content-type"] == "text/event-stream"
+        assert response.headers["access-control-allow-origin"] == "*"
+        events = response.events
+        names = [event["event"] for event in events]
+        assert names == ["session", "tool_start", "tool_end", "token", "token", "token", "done"]
+        assert events[0]["data"] == {"actor_id": "a1", "session_id": "s1"}
+        assert events[1]["data"]["tool"] == "lookup"
+        assert events[2]["data"]["status"] == "success"
+        assert "".join(e["data"]["text"] for e in events if e["event"] == "token") == "The carbon tax is $65/tonne."
+        assert events[-1]["data"]["response"].strip() == "The carbon tax is $65/tonne."
+
+    def test_first_token_arrives_before_the_run_ends(self, mock_agent_class):
+        mock_agent_class.side_effect = lambda *args: scripted_agent(token_delay=0.1)
+
+        response = post({"query": "What is the carbon tax?"})
+
+        first_token = response.first_event_seconds("token")
+        done = response.first_event_seconds("done")
+        assert first_token is not None
+        assert done - first_token >= 0.2
+
+    def test_session_reuses_agent_with_lambda_handler(self, mock_agent_class):
+        first = post({"query": "q"}).events[0]["data"]
+        post({"query": "follow-up", **first})
+        handler.lambda_handler({"body": json.dumps({"query": "again", **first})}, Mock())
+
+        assert mock_agent_class.call_count == 1
+        assert len(handler.agent_pool) == 1
+
+    def test_failed_run_reports_error_event(self, mock_agent_class):
+        mock_agent_class.side_effect = lambda *args: scripted_agent(fail=True)
+
+        response = post({"query": "q", "actor_id": "a1", "session_id": "s1"})
+
+        assert response.status == 200
+        assert response.events[-1]["event"] == "error"
+        assert "model unavailable" in response.events[-1]["data"]["message"]
+        assert ("a1", "s1") not in handler.agent_pool
+
+    def test_missing_query(self, mock_agent_class):
+        response = post({})
+
+        assert response.status == 400
+        assert "query" in response.json()["error"].lower()
+        mock_agent_class.assert_not_called()
+
+    def test_invalid_json(self, mock_agent_class):
+        response = post(b"invalid json{{")
+
+        assert response.status == 400
+        assert "json" in response.json()["error"].lower()
+
+    def test_invalid_session(self, mock_agent_class):
+        response = post({"query": "q", "session_id": "s1"})
+
+        assert response.status == 400
+        assert "actor_id" in response.json()["error"]
+
+    def test_readiness_and_preflight(self):
+        ready = asyncio.run(call_app(app, method="GET"))
+        preflight = asyncio.run(call_app(app, method="OPTIONS"))
+
+        assert ready.status == 200
+        assert preflight.status == 204
+        assert preflight.headers["access-control-allow-methods"] == "GET,POST,OPTIONS"
+
+
+class TestServerSentEvents:
+    """Test suite for SSE framing"""
+
+    def test_format_and_parse_round_trip(self):
+        stream = format_sse({"type": "token", "text": "line one\nline two"}) + format_sse({"type": "done", "total_ms": 5})
+
+        assert parse_sse(stream.decode("utf-8")) == [
+            {"event": "token", "data": {"text": "line one\nline two"}},
+            {"event": "done", "data": {"total_ms": 5}}
+        ]
+
+
+class TestCliStreaming:
+    """Test suite for streamed CLI output"""
+
+    def test_prints_tokens_and_tool_progress(self, capsys):
+        asyncio.run(stream_reply(scripted_agent(), "What is the carbon tax?"))
+
+        output = capsys.readouterr().out
+        assert "[lookup...]" in output
+        assert "[lookup success]" in output
+        assert "The carbon tax is $65/tonne." in output
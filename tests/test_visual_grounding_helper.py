@@ -0,0 +1,369 @@
+"""
+Unit tests for visual grounding helpers
+Tests chunk region rendering and chunk image extraction
+"""
+import io
+import time
+import pytest
+from unittest.mock import Mock, patch
+from src.rag import visual_grounding_helper as vgh
+from src.rag.grounding_manifest import grounding_manifest, presigned_url_cache
+from src.rag.render_cache import document_cache, page_raster_cache
+from benchmarks.bench_chunk_render import build_synthetic_pdf
+
+
+@pytest.fixture(scope="module")
+def pdf_path(tmp_path_factory):
+    """Synthetic multi-page PDF with text, tables, shapes and a raster figure"""
+    path = tmp_path_factory.mktemp("pdfs") / "budget.pdf"
+    path.write_bytes(build_synthetic_pdf(pages=3))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def empty_render_caches():
+    for cache in (document_cache, page_raster_cache, grounding_manifest, presigned_url_cache):
+        cache.clear()
+    yield
+    for cache in (document_cache, page_raster_cache, grounding_manifest, presigned_url_cache):
+        cache.clear()
+
+
+class TestRenderChunkRegion:
+    """Test suite for clip-region rendering"""
+
+    @pytest.mark.parametrize("bbox", [
+        [0.05, 0.04, 0.6, 0.1],      # running text
+        [0.5, 0.47, 0.6, 0.5],       # single table cell
+        [0.15, 0.8, 0.5, 0.97],      # raster figure
+        [0.0, 0.0, 1.0, 1.0],        # whole page
+        [0.9, 0.95, 1.0, 1.0],       # padding clamped at the page corner
+    ])
+    @pytest.mark.parametrize("dpi", [96, 150, 200])
+    def test_clip_matches_full_render_pixel_for_pixel(self, pdf_path, bbox, dpi):
+        """Test clip rasterization produces exactly the full-page crop"""
+        clip = vgh.render_chunk_region(pdf_path, 1, bbox, padding=10, dpi=dpi, mode=vgh.RENDER_MODE_CLIP)
+        full = vgh.render_chunk_region(pdf_path, 1, bbox, padding=10, dpi=dpi, mode=vgh.RENDER_MODE_FULL)
+
+        assert clip.size == full.size
+        assert clip.tobytes() == full.tobytes()
+
+    def test_repeated_page_shares_one_rasterization(self, pdf_path):
+        """Test crops from a page requested again come from one cached full render"""
+        first = vgh.render_chunk_region(pdf_path, 0, [0.1, 0.1, 0.3, 0.2])
+        assert page_raster_cache.renders == 0
+
+        second = vgh.render_chunk_region(pdf_path, 0, [0.5, 0.5, 0.7, 0.6])
+        third = vgh.render_chunk_region(pdf_path, 0, [0.1, 0.1, 0.3, 0.2])
+
+        assert page_raster_cache.renders == 1
+        assert page_raster_cache.hits >= 1
+        assert third.tobytes() == first.tobytes()
+        assert second.size != first.size or second.tobytes() != first.tobytes()
+
+    def test_document_is_opened_once(self, pdf_path):
+        """Test repeated renders reuse the open document handle"""
+        for page_num in range(3):
+            vgh.render_chunk_region(pdf_path, page_num, [0.1, 0.1, 0.3, 0.2])
+
+        assert document_cache.opens == 1
+        assert document_cache.hits == 2
+
+    def test_changed_file_is_reopened(self, pdf_path, tmp_path):
+        """Test a replaced PDF gets a new document version"""
+        path = tmp_path / "copy.pdf"
+        path.write_bytes(pdf_path.read_bytes())
+        vgh.render_pdf_page(path, 0)
+
+        path.write_bytes(build_synthetic_pdf(pages=1, seed=7))
+        vgh.render_pdf_page(path, 0)
+
+        assert document_cache.opens == 2
+        assert page_raster_cache.renders == 2
+
+    def test_accepts_pdf_bytes(self, pdf_path):
+        """Test regions can be rendered from in-memory PDF bytes"""
+        img = vgh.render_chunk_region(pdf_path.read_bytes(), 0, [0.1, 0.1, 0.2, 0.2])
+
+        assert img is not None
+        assert img.width > 0 and img.height > 0
+
+    def test_invalid_page_returns_none(self, pdf_path):
+        """Test rendering a missing page fails softly"""
+        assert vgh.render_chunk_region(pdf_path, 99, [0.1, 0.1, 0.2, 0.2]) is None
+
+
+class TestExtractChunkImage:
+    """Test suite for extract_chunk_image"""
+
+    @pytest.fixture
+    def s3(self):
+        s3 = Mock()
+        s3.head_object.side_effect = Exception("404")
+        s3.generate_presigned_url.side_effect = lambda op, Params, ExpiresIn: f"https://signed/{Params['Key']}"
+        return s3
+
+    @pytest.fixture
+    def cached_pdf(self, pdf_path):
+        with patch.object(vgh.pdf_cache, "get_path", return_value=pdf_path) as mock:
+            yield mock
+
+    def test_renders_and_uploads_missing_image(self, s3, cached_pdf):
+        """Test a missing chunk image is rendered, uploaded and signed"""
+        url = vgh.extract_chunk_image(
+            s3_client=s3,
+            bucket="bucket",
+            source_pdf_key="input/gov_data/budget.pdf",
+            bbox=[0.1, 0.1, 0.4, 0.2],
+            page_num=0,
+            chunk_id="chunk_1",
+            source_document="budget"
+        )
+
+        assert url == "https://signed/output/budget_chunk_images/budget_chunk_1.png"
+        put_kwargs = s3.put_object.call_args.kwargs
+        assert put_kwargs["ContentType"] == "image/png"
+        assert put_kwargs["Body"].startswith(b"\x89PNG")
+
+    def test_existing_image_is_not_rendered(self, s3, cached_pdf):
+        """Test an image already in S3 is only signed"""
+        s3.head_object.side_effect = None
+
+        url = vgh.extract_chunk_image(
+            s3_client=s3,
+            bucket="bucket",
+            source_pdf_key="input/gov_data/budget.pdf",
+            bbox=[0.1, 0.1, 0.4, 0.2],
+            page_num=0,
+            chunk_id="chunk_1",
+            source_document="budget"
+        )
+
+        assert url.endswith("budget_chunk_1.png")
+        cached_pdf.assert_not_called()
+        s3.put_object.assert_not_called()
+
+
+class TestExtractChunkImages:
+    """Test suite for the batch chunk image API"""
+
+    @pytest.fixture
+    def s3(self):
+        s3 = Mock()
+        s3.head_object.side_effect = Exception("404")
+        s3.generate_presigned_url.side_effect = lambda op, Params, ExpiresIn: f"https://signed/{Params['Key']}"
+        return s3
+
+    @pytest.fixture
+    def cached_pdf(self, pdf_path):
+        with patch.object(vgh.pdf_cache, "get_path", return_value=pdf_path) as mock:
+            yield mock
+
+    def test_urls_follow_request_order(self, s3, cached_pdf):
+        """Test one URL is returned per request, in input order"""
+        requests = [
+            ("budget", 0, [0.1, 0.1, 0.4, 0.2], "chunk_b"),
+            ("budget", 1, [0.1, 0.1, 0.4, 0.2], "chunk_a"),
+            ("budget", 0, [0.1, 0.1, 0.4, 0.2], "chunk_b"),
+        ]
+
+        urls = vgh.extract_chunk_images(s3, "bucket", requests)
+
+        assert urls == [
+            "https://signed/output/budget_chunk_images/budget_chunk_b.png",
+            "https://signed/output/budget_chunk_images/budget_chunk_a.png",
+            "https://signed/output/budget_chunk_images/budget_chunk_b.png",
+        ]
+        assert s3.put_object.call_count == 2
+
+    def test_page_with_several_crops_is_rendered_once(self, s3, cached_pdf):
+        """Test crops sharing a page are cut from a single rasterization"""
+        requests = [
+            ("budget", 2, [0.1, 0.1 * i, 0.4, 0.1 * i + 0.05], f"chunk_{i}")
+            for i in range(1, 5)
+        ]
+
+        urls = vgh.extract_chunk_images(s3, "bucket", requests)
+
+        assert all(urls)
+        assert page_raster_cache.renders == 1
+        assert cached_pdf.call_count == 1
+
+    def test_existing_images_are_only_signed(self, s3, cached_pdf):
+        """Test images already in S3 are not rendered again"""
+        def head_object(Bucket, Key):
+            if not Key.endswith("chunk_old.png"):
+                raise Exception("404")
+            return {}
+        s3.head_object.side_effect = head_object
+        requests = [
+            ("budget", 0, [0.1, 0.1, 0.4, 0.2], "chunk_old"),
+            ("budget", 0, [0.5, 0.5, 0.7, 0.6], "chunk_new"),
+        ]
+
+        urls = vgh.extract_chunk_images(s3, "bucket", requests)
+
+        assert all(urls)
+        uploaded = [call.kwargs["Key"] for call in s3.put_object.call_args_list]
+        assert uploaded == ["output/budget_chunk_images/budget_chunk_new.png"]
+
+    def test_steady_state_makes_no_head_requests(self, s3, cached_pdf):
+        """Test images recorded in the manifest are served without HEAD calls or re-signing"""
+        requests = [
+            ("budget", 0, [0.1, 0.1, 0.4, 0.2], "chunk_1"),
+            ("budget", 1, [0.1, 0.1, 0.4, 0.2], "chunk_2"),
+        ]
+        first = vgh.extract_chunk_images(s3, "bucket", requests)
+        s3.head_object.reset_mock()
+        s3.generate_presigned_url.reset_mock()
+
+        second = vgh.extract_chunk_images(s3, "bucket", requests)
+
+        assert second == first
+        s3.head_object.assert_not_called()
+        s3.generate_presigned_url.assert_not_called()
+        assert s3.put_object.call_count == 2
+
+    def test_profile_sets_key_and_content_type(self, s3, pdf_path):
+        """Test a non-default profile is encoded in the S3 key and upload"""
+        profile = vgh.EncodingProfile("webp", quality=70)
+
+        with patch.object(vgh.pdf_cache, "get_path", return_value=pdf_path):
+            urls = vgh.extract_chunk_images(
+                s3, "bucket", [("budget", 0, [0.1, 0.1, 0.4, 0.2], "chunk_1", "text")], profile=profile
+            )
+
+        assert urls == ["https://signed/output/budget_chunk_images/budget_chunk_1_q70.webp"]
+        put_kwargs = s3.put_object.call_args.kwargs
+        assert put_kwargs["ContentType"] == "image/webp"
+        assert put_kwargs["Body"][8:12] == b"WEBP"
+
+    def test_missing_pdf_yields_none(self, s3):
+        """Test crops of an unavailable PDF come back as None"""
+        with patch.object(vgh.pdf_cache, "get_path", side_effect=Exception("NoSuchKey")):
+            urls = vgh.extract_chunk_images(s3, "bucket", [("gone", 0, [0.1, 0.1, 0.2, 0.2], "chunk_1")])
+
+        assert urls == [None]
+        s3.put_object.assert_not_called()
+
+    def test_uploads_missing_the_timeout_are_dropped(self, s3, cached_pdf):
+        """Test slow uploads are dropped once the time budget is spent"""
+        def put_object(**kwargs):
+            if kwargs["Key"].endswith("chunk_slow.png"):
+                time.sleep(1)
+        s3.put_object.side_effect = put_object
+        requests = [
+            ("budget", 0, [0.1, 0.1, 0.4, 0.2], "chunk_fast"),
+            ("budget", 1, [0.1, 0.1, 0.4, 0.2], "chunk_slow"),
+        ]
+
+        start = time.monotonic()
+        urls = vgh.extract_chunk_images(s3, "bucket", requests, timeout=0.5)
+        elapsed = time.monotonic() - start
+
+        assert elapsed < 0.9
+        assert urls[0].endswith("chunk_fast.png")
+        assert urls[1] is None
+
+
+class TestAnnotatePageImage:
+    """Test suite for single-pass page annotation"""
+
+    @pytest.fixture
+    def page(self, pdf_path):
+        img, _, _ = vgh.render_pdf_page(pdf_path, 1)
+        return img
+
+    @staticmethod
+    def table_cells(img, rows=20, cols=10):
+        cell_w, cell_h = img.width // cols, img.height // rows
+        return [
+            ((c * cell_w, r * cell_h, (c + 1) * cell_w, (r + 1) * cell_h), vgh.CHUNK_TYPE_COLORS["tablecell"])
+            for r in range(rows) for c in range(cols)
+        ]
+
+    def test_numpy_and_pillow_blending_match(self, page):
+        """Test both blending paths produce the same pixels"""
+        boxes = self.table_cells(page) + [((50, 60, 400, 300), vgh.CHUNK_TYPE_COLORS["table"])]
+
+        with_numpy = vgh.annotate_page_image(page, boxes, use_numpy=True)
+        with_pillow = vgh.annotate_page_image(page, boxes, use_numpy=False)
+
+        assert with_numpy.tobytes() == with_pillow.tobytes()
+
+    def test_single_box_matches_previous_rendering(self, page):
+        """Test one box looks like the former outline-then-overlay drawing"""
+        box, color = (50, 60, 400, 300), vgh.CHUNK_TYPE_COLORS["text"]
+        expected = page.copy()
+        vgh.ImageDraw.Draw(expected).rectangle(box, outline=color, width=3)
+        overlay = vgh.Image.new('RGBA', expected.size, (0, 0, 0, 0))
+        vgh.ImageDraw.Draw(overlay).rectangle(box, fill=color + (30,))
+        expected = vgh.Image.alpha_composite(expected.convert('RGBA'), overlay).convert('RGB')
+
+        annotated = vgh.annotate_page_image(page, [(box, color)])
+
+        assert annotated.tobytes() == expected.tobytes()
+
+    def test_source_image_is_not_modified(self, page):
+        """Test the cached page raster is left untouched"""
+        before = page.tobytes()
+
+        vgh.annotate_page_image(page, self.table_cells(page))
+
+        assert page.tobytes() == before
+
+    def test_page_image_highlights_every_chunk(self, pdf_path):
+        """Test one upload covers all chunks of a page, colored by type"""
+        s3 = Mock()
+        s3.generate_presigned_url.side_effect = lambda op, Params, ExpiresIn: f"https://signed/{Params['Key']}"
+        chunks = [
+            {"box": {"left": 0.1, "top": 0.1, "right": 0.3, "bottom": 0.2}, "chunk_type": "text"},
+            {"boxes": [{"left": 0.5, "top": 0.5, "right": 0.7, "bottom": 0.6}], "chunk_type": "table"},
+        ]
+
+        url = vgh.create_annotated_page_image(pdf_path, 1, chunks, "annotations/p1.png", s3, "bucket")
+
+        assert url == "https://signed/annotations/p1.png"
+        assert s3.put_object.call_count == 1
+        img = vgh.Image.open(io.BytesIO(s3.put_object.call_args.kwargs["Body"]))
+        page_img, _, _ = vgh.render_pdf_page(pdf_path, 0)
+        x1, y1, _, _ = vgh._annotation_box_pixels(chunks[0]["box"], img.width, img.height)
+        x2, y2, _, _ = vgh._annotation_box_pixels(chunks[1]["boxes"][0], img.width, img.height)
+        assert img.getpixel((x1, y1)) == vgh.CHUNK_TYPE_COLORS["text"]
+        assert img.getpixel((x2, y2)) == vgh.CHUNK_TYPE_COLORS["table"]
+        assert img.size == page_img.size
+
+
+class TestGetOrCreateAnnotatedImage:
+    """Test suite for get_or_create_annotated_image"""
+
+    @pytest.fixture
+    def s3(self):
+        s3 = Mock()
+        s3.get_object.side_effect = Exception("NoSuchKey")
+        s3.generate_presigned_url.side_effect = lambda op, Params, ExpiresIn: f"https://signed/{Params['Key']}"
+        return s3
+
+    def test_known_annotation_needs_no_s3_requests(self, s3):
+        """Test an annotation seen before is served from the manifest and URL cache"""
+        grounding = {"page": 1, "box": {"left": 0.1, "top": 0.1, "right": 0.3, "bottom": 0.2}}
+
+        first = vgh.get_or_create_annotated_image(s3, "bucket", "input/budget.pdf", "chunk_1", grounding)
+        second = vgh.get_or_create_annotated_image(s3, "bucket", "input/budget.pdf", "chunk_1", grounding)
+
+        assert first == second
+        assert first.startswith("https://signed/annotations/budget_p1_chunk_1")
+        s3.head_object.assert_called_once()
+        s3.generate_presigned_url.assert_called_once()
+
+    def test_created_annotation_is_recorded(self, s3, pdf_path):
+        """Test a newly rendered annotation is added to the manifest"""
+        s3.head_object.side_effect = Exception("404")
+        grounding = {"page": 1, "box": {"left": 0.1, "top": 0.1, "right": 0.3, "bottom": 0.2}}
+
+        with patch.object(vgh.pdf_cache, "get_path", return_value=pdf_path):
+            url = vgh.get_or_create_annotated_image(s3, "bucket", "input/budget.pdf", "chunk_1", grounding)
+        key = url.removeprefix("https://signed/")
+
+        assert s3.put_object.call_args.kwargs["Key"] == key
+        assert grounding_manifest.has_image(s3, "bucket", key)